@@ -3,9 +3,10 @@
 Endpoints para geração de mídia com IA
 """
 
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends, Request
 from fastapi.responses import JSONResponse
 import asyncio
+import os
 import uuid
 import time
 import logging
@@ -38,10 +39,29 @@ async def get_video_generator():
     from ..models.video_generator import VideoGenerator
     return VideoGenerator()
 
+_storage_manager = None
+
 async def get_storage_manager():
-    """Dependency injection para o storage manager"""
-    from ..utils.storage import StorageManager
-    return StorageManager()
+    """Dependency injection para o storage manager (instância compartilhada)"""
+    global _storage_manager
+    if _storage_manager is None:
+        from ..utils.storage import StorageManager
+        _storage_manager = StorageManager()
+    return _storage_manager
+
+_batch_job_manager = None
+
+async def get_batch_job_manager():
+    """Dependency injection para o gerenciador de jobs em lote (instância compartilhada)"""
+    global _batch_job_manager
+    if _batch_job_manager is None:
+        from ..utils.batch_jobs import BatchJobManager
+        storage_manager = await get_storage_manager()
+        _batch_job_manager = BatchJobManager(
+            storage_manager.backend,
+            window_size=int(os.getenv("BATCH_JOB_WINDOW_SIZE", "50"))
+        )
+    return _batch_job_manager
 
 # === ENDPOINTS PRINCIPAIS ===
 
@@ -240,6 +260,25 @@ async def get_system_status():
         }
     )
 
+# === ENDPOINTS DE MÍDIA ===
+
+@router.get("/media/{filename}")
+async def download_media(
+    filename: str,
+    request: Request,
+    storage_manager = Depends(get_storage_manager)
+):
+    """
+    📥 Baixar arquivo de mídia armazenado
+    
+    Suporta HTTP Range (206) para streaming e retomada de download de vídeos
+    """
+    from ..utils.media_serving import build_media_response
+    
+    return await build_media_response(
+        storage_manager, filename, request.headers.get("range")
+    )
+
 # === ENDPOINTS DE GERENCIAMENTO ===
 
 @router.delete("/cancel/{task_id}", response_model=SuccessResponse)
@@ -305,26 +344,22 @@ async def _process_image_generation(
         
         start_time = time.time()
         
-        # Gerar imagem (placeholder - implementação real nos models)
+        # Gerar imagem (o gerador devolve um placeholder se o modelo não carregar)
         logger.info("Chamando gerador de imagem...")
+        image_bytes = await image_generator.generate(request)
+        active_tasks[task_id]["progress_percent"] = 80
+        
+        # Salvar no storage com nome único
+        filename = await storage_manager.save_image(
+            image_bytes,
+            f"img_{task_id[:8]}_{int(time.time())}.png",
+            metadata={"source": "generation", "prompt": request.prompt, "style": request.style.value}
+        )
+        file_url = storage_manager.get_file_url(filename)
+        file_info = await storage_manager.get_file_info(filename)
         
-        # Simular progresso
-        for i in range(10, 90, 10):
-            active_tasks[task_id]["progress_percent"] = i
-            active_tasks[task_id]["current_step"] = i
-            active_tasks[task_id]["total_steps"] = 100
-            await asyncio.sleep(0.5)  # Simular processamento
-        
-        # Gerar filename único
-        filename = f"img_{task_id[:8]}_{int(time.time())}.png"
-        
-        # Aqui seria chamado o gerador real:
-        # result = await image_generator.generate(request)
-        # filename = await storage_manager.save_image(result, filename)
-        
-        # Simular resultado por enquanto
-        file_path = f"/var/shared_media/{filename}"
-        file_url = f"/storage/media/{filename}"
+        # Indexar para a busca visual (chave = nome resolvido pelo storage)
+        await _index_generated_image(storage_manager, filename)
         
         generation_time = time.time() - start_time
         
@@ -333,7 +368,7 @@ async def _process_image_generation(
             "status": GenerationStatus.COMPLETED,
             "filename": filename,
             "file_url": file_url,
-            "file_size": 1024000,  # 1MB simulado
+            "file_size": file_info["size"] if file_info else len(image_bytes),
             "generation_time": generation_time,
             "progress_percent": 100,
             "metadata": {
@@ -353,6 +388,14 @@ async def _process_image_generation(
             "error_message": str(e)
         })
 
+async def _index_generated_image(storage_manager, filename: str):
+    """Gravar o embedding CLIP da imagem gerada no índice (falha não invalida a geração)"""
+    try:
+        from ..models.image_analyzer import image_analyzer
+        await image_analyzer.index_stored_image(storage_manager, filename)
+    except Exception as e:
+        logger.warning(f"Imagem gerada não indexada ({filename}): {e}")
+
 async def _process_video_generation(
     task_id: str,
     request: VideoGenerationRequest,
@@ -12,6 +12,7 @@ Endpoints expandidos para:
 
 from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, List, Optional, Any
 import asyncio
@@ -32,11 +33,23 @@ load_dotenv()
 # from models.code_generator import code_generator, CodeGenerationRequest, CodeGenerationType, ProgrammingLanguage
 # from models.scene_manager import scene_manager, SceneManager, VideoProject, Scene, SceneType, TransitionType
 # from models.image_input_processor import image_input_processor, ImageInputProcessor, ImageInputRequest, ProcessingMode
+# from api.routes import get_storage_manager, get_batch_job_manager
+# from utils.llm_gateway import estimate_cost
+# from utils.media_fetcher import media_fetcher
+# from utils.metrics import render_metrics
+# from utils.streaming import sse_stream
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _services_loaded(*names: str) -> bool:
+    """Whether the module-level services above are imported (lifecycle hooks skip disabled ones)"""
+    missing = [name for name in names if name not in globals()]
+    if missing:
+        logger.warning(f"Skipping lifecycle hook, services not loaded: {', '.join(missing)}")
+    return not missing
+
 # FastAPI app
 app = FastAPI(
     title="PyLab - AI Business Intelligence Laboratory",
@@ -72,6 +85,38 @@ class BatchRequest(BaseModel):
     requests: List[Dict[str, Any]]
     request_type: str
 
+class MultiTextAnalysisRequest(BaseModel):
+    text: str
+    analysis_types: List[str]
+    context: Optional[Dict[str, Any]] = None
+    language: str = "pt-BR"
+    business_domain: Optional[str] = None
+
+class ConversationAnalysisRequest(BaseModel):
+    messages: List[Dict[str, str]]
+    conversation_id: Optional[str] = None
+
+class MultiImageAnalysisRequest(BaseModel):
+    image_data: str
+    analysis_types: List[str]
+    context: Optional[Dict[str, Any]] = None
+    business_domain: Optional[str] = None
+
+class ImageSimilarityRequest(BaseModel):
+    filename: Optional[str] = None
+    image_data: Optional[str] = None
+    k: int = 10
+    min_score: Optional[float] = None
+
+class ImageTextSearchRequest(BaseModel):
+    query: str
+    k: int = 10
+
+class StoredImageCompareRequest(BaseModel):
+    filenames: List[str]
+    top_k: int = 5
+    include_matrix: Optional[bool] = None
+
 class BatchResponse(BaseModel):
     results: List[Dict[str, Any]]
     success_count: int
@@ -107,6 +152,12 @@ async def health_check():
         logger.error(f"Health check failed: {e}")
         raise HTTPException(status_code=500, detail="Service unhealthy")
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: tokens, cost, latency, retries and cache hits per model/analysis type"""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
 @app.get("/status/detailed")
 async def detailed_status():
     """Detailed system status"""
@@ -255,20 +306,146 @@ async def analyze_financial_data(request: TextAnalysisRequest):
 
 @app.post("/analyze/text/batch")
 async def batch_text_analysis(request: BatchRequest):
-    """Batch text analysis"""
+    """Batch text analysis (small batches; use /jobs/text-analysis for large ones)"""
     try:
-        requests = [TextAnalysisRequest(**req) for req in request.requests]
-        results = await text_analyzer.batch_analyze(requests)
+        start_time = asyncio.get_event_loop().time()
+        requests = [_text_request_from_payload(req) for req in request.requests]
+        results = await text_analyzer.batch_analyze(requests, return_exceptions=True)
+        errors = [r for r in results if isinstance(r, Exception)]
         return BatchResponse(
-            results=[result.__dict__ for result in results],
-            success_count=len(results),
-            error_count=0,
-            processing_time=sum(r.processing_time for r in results)
+            results=[
+                {"error": str(r)} if isinstance(r, Exception) else r.__dict__
+                for r in results
+            ],
+            success_count=len(results) - len(errors),
+            error_count=len(errors),
+            # Itens rodam em paralelo: tempo de parede, não a soma dos tempos
+            processing_time=asyncio.get_event_loop().time() - start_time
         )
     except Exception as e:
         logger.error(f"Batch text analysis failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _text_request_from_payload(payload: Dict[str, Any]) -> TextAnalysisRequest:
+    """Build a TextAnalysisRequest from a JSON payload (analysis_type given by value)"""
+    return TextAnalysisRequest(**{**payload, "analysis_type": AnalysisType(payload["analysis_type"])})
+
+async def _text_analysis_job_item(payload: Dict[str, Any]):
+    """Batch job handler: one TextAnalysisRequest per JSONL line"""
+    result = await text_analyzer.analyze(_text_request_from_payload(payload))
+    tokens = result.metadata.get("tokens_used", 0)
+    return result.__dict__, {"tokens": tokens, "cost": estimate_cost(result.metadata["model_used"], tokens)}
+
+# ============================================================================
+# BATCH JOB ENDPOINTS (Async bulk processing)
+# ============================================================================
+
+@app.on_event("startup")
+async def resume_batch_jobs():
+    """Register job handlers and resume jobs interrupted by a restart"""
+    if not _services_loaded("get_batch_job_manager", "text_analyzer", "estimate_cost"):
+        return
+    try:
+        manager = await get_batch_job_manager()
+        manager.register("text_analysis", _text_analysis_job_item)
+        await manager.resume_jobs()
+    except Exception as e:
+        logger.error(f"Failed to resume batch jobs: {e}")
+
+@app.on_event("shutdown")
+async def stop_batch_jobs():
+    """Stop running jobs; they resume from their last checkpoint"""
+    if not _services_loaded("get_batch_job_manager"):
+        return
+    manager = await get_batch_job_manager()
+    await manager.close()
+
+@app.post("/jobs/text-analysis")
+async def create_text_analysis_job(file: UploadFile = File(...)):
+    """Start an async bulk text analysis job from a JSONL upload (one TextAnalysisRequest per line)"""
+    try:
+        manager = await get_batch_job_manager()
+        return await manager.create_job("text_analysis", await file.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Batch job creation failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs")
+async def list_batch_jobs():
+    """List batch jobs with progress, throughput and cost"""
+    manager = await get_batch_job_manager()
+    return {"jobs": await manager.list_jobs()}
+
+@app.get("/jobs/{job_id}")
+async def get_batch_job(job_id: str):
+    """Batch job status: progress, throughput, tokens, cost and failures"""
+    manager = await get_batch_job_manager()
+    job = await manager.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/results")
+async def get_batch_job_results(job_id: str):
+    """Per-item results written so far (JSONL)"""
+    manager = await get_batch_job_manager()
+    if await manager.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(manager.stream_results(job_id), media_type="application/x-ndjson")
+
+@app.delete("/jobs/{job_id}")
+async def cancel_batch_job(job_id: str):
+    """Cancel a running job (results already written are kept)"""
+    manager = await get_batch_job_manager()
+    if not await manager.cancel_job(job_id):
+        raise HTTPException(status_code=404, detail="Job not found or already finished")
+    return {"job_id": job_id, "status": "cancelled"}
+
+@app.post("/analyze/text/conversation")
+async def analyze_conversation(request: ConversationAnalysisRequest):
+    """Analyze a conversation; with conversation_id, only new messages are sent to the model"""
+    try:
+        return await text_analyzer.analyze_conversation(request.messages, request.conversation_id)
+    except Exception as e:
+        logger.error(f"Conversation analysis failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/analyze/text/multi")
+async def multi_text_analysis(request: MultiTextAnalysisRequest):
+    """Run several analysis types on the same text in a single model call"""
+    try:
+        analysis_types = [AnalysisType(t) for t in request.analysis_types]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        base_request = TextAnalysisRequest(
+            text=request.text,
+            analysis_type=analysis_types[0] if analysis_types else AnalysisType.SENTIMENT,
+            context=request.context,
+            language=request.language,
+            business_domain=request.business_domain
+        )
+        results = await text_analyzer.analyze_multi(base_request, analysis_types)
+        return {result.analysis_type.value: result for result in results}
+    except Exception as e:
+        logger.error(f"Multi text analysis failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/analyze/text/stream/{analysis_type}")
+async def stream_text_analysis(analysis_type: str, request: TextAnalysisRequest):
+    """Stream text analysis as Server-Sent Events (summary first, final result last)"""
+    try:
+        request.analysis_type = AnalysisType(analysis_type)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Unknown analysis type: {analysis_type}")
+    return StreamingResponse(
+        sse_stream(text_analyzer.analyze_stream(request)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ============================================================================
 # IMAGE ANALYSIS ENDPOINTS (New)
 # ============================================================================
@@ -351,15 +528,129 @@ async def analyze_image_accessibility(request: ImageAnalysisRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/analyze/image/compare")
-async def compare_images(images: List[str], comparison_type: str = "similarity"):
-    """Compare multiple images"""
+async def compare_images(
+    images: List[str],
+    comparison_type: str = "similarity",
+    top_k: int = 5,
+    include_matrix: Optional[bool] = None
+):
+    """Compare multiple images (full matrix only for small sets unless requested)"""
     try:
-        result = await image_analyzer.compare_images(images, comparison_type)
+        result = await image_analyzer.compare_images(images, comparison_type, top_k, include_matrix)
         return result
     except Exception as e:
         logger.error(f"Image comparison failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/analyze/image/multi")
+async def multi_image_analysis(request: MultiImageAnalysisRequest):
+    """Run several image analysis types sharing decoding, captioning, features and the CLIP embedding"""
+    try:
+        analysis_types = [ImageAnalysisType(t) for t in request.analysis_types]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        base_request = ImageAnalysisRequest(
+            image_data=request.image_data,
+            analysis_type=analysis_types[0] if analysis_types else ImageAnalysisType.CONTENT_ANALYSIS,
+            context=request.context,
+            business_domain=request.business_domain
+        )
+        results = await image_analyzer.analyze_multi(base_request, analysis_types)
+        return {result.analysis_type.value: result for result in results}
+    except Exception as e:
+        logger.error(f"Multi image analysis failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/analyze/image/compare/stored")
+async def compare_stored_images(request: StoredImageCompareRequest):
+    """Compare indexed images using their stored embeddings (no re-encoding)"""
+    try:
+        return await image_analyzer.compare_stored_images(request.filenames, request.top_k, request.include_matrix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Stored image comparison failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ============================================================================
+# VISUAL SEARCH ENDPOINTS
+# ============================================================================
+
+@app.post("/search/images/similar")
+async def search_similar_images(request: ImageSimilarityRequest):
+    """Find indexed images similar to a stored image or to an uploaded one"""
+    try:
+        matches = await image_analyzer.find_similar(
+            request.filename, request.image_data, request.k, request.min_score
+        )
+        return {"matches": matches, "index_size": len(image_analyzer.embedding_index)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Similar image search failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/search/images/duplicates")
+async def search_duplicate_images(request: ImageSimilarityRequest):
+    """Find near-duplicates of an image (similarity >= min_score, default 0.95)"""
+    try:
+        matches = await image_analyzer.find_similar(
+            request.filename, request.image_data, request.k,
+            request.min_score if request.min_score is not None else 0.95
+        )
+        return {"duplicates": matches, "is_duplicate": bool(matches)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Duplicate image search failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/search/images/text")
+async def search_images_by_text(request: ImageTextSearchRequest):
+    """Text-to-image search over indexed images"""
+    try:
+        return {"matches": await image_analyzer.search_by_text(request.query, request.k)}
+    except Exception as e:
+        logger.error(f"Text-to-image search failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/search/images/index/{filename}")
+async def index_stored_image(filename: str):
+    """Add (or refresh) the embedding of an image already in storage"""
+    try:
+        storage_manager = await get_storage_manager()
+        if not await image_analyzer.index_stored_image(storage_manager, filename):
+            raise HTTPException(status_code=404, detail="File not found")
+        return {"filename": filename, "indexed": True, "index_size": len(image_analyzer.embedding_index)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Image indexing failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.on_event("startup")
+async def drop_deleted_images_from_index():
+    """Remove embeddings of images deleted from storage (delete_file / cleanup_old_files)"""
+    if not _services_loaded("get_storage_manager", "image_analyzer"):
+        return
+    storage_manager = await get_storage_manager()
+    storage_manager.add_delete_listener(image_analyzer.embedding_index.remove)
+
+@app.on_event("shutdown")
+async def close_embedding_index():
+    """Persist the image embedding index"""
+    if not _services_loaded("image_analyzer"):
+        return
+    await image_analyzer.embedding_index.close()
+
+@app.on_event("shutdown")
+async def close_media_fetcher():
+    """Close pooled connections used for media URL downloads"""
+    if not _services_loaded("media_fetcher"):
+        return
+    await media_fetcher.close()
+
 # ============================================================================
 # SPEECH PROCESSING ENDPOINTS (New)
 # ============================================================================
@@ -537,6 +828,19 @@ async def generate_integration(request: CodeGenerationRequest):
         logger.error(f"Integration generation failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate/code/stream/{generation_type}")
+async def stream_code_generation(generation_type: str, request: CodeGenerationRequest):
+    """Stream generated code as Server-Sent Events, followed by analysis, tests and docs"""
+    try:
+        request.generation_type = CodeGenerationType(generation_type)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Unknown generation type: {generation_type}")
+    return StreamingResponse(
+        sse_stream(code_generator.generate_stream(request)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/optimize/code")
 async def optimize_code(code: str, language: str):
     """Optimize existing code"""
@@ -720,12 +1024,16 @@ async def upload_image_for_analysis(file: UploadFile = File(...)):
         contents = await file.read()
         image_b64 = base64.b64encode(contents).decode()
         
+        # Guardar no storage: o embedding fica indexado com o nome do arquivo salvo
+        storage_manager = await get_storage_manager()
+        filename = await storage_manager.save_image(contents, metadata={"source": "upload", "original_name": file.filename})
+        
         request = ImageAnalysisRequest(
             image_data=image_b64,
             analysis_type=ImageAnalysisType.CONTENT_ANALYSIS
         )
         
-        result = await image_analyzer.analyze(request)
+        result = await image_analyzer.analyze(request, index_key=filename)
         return result
         
     except Exception as e:
@@ -751,6 +1059,83 @@ async def upload_audio_for_analysis(file: UploadFile = File(...)):
         logger.error(f"Audio upload analysis failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# ============================================================================
+# STORED MEDIA ANALYSIS ENDPOINTS
+# ============================================================================
+
+@app.post("/analyze/image/stored/{filename}")
+async def analyze_stored_image(filename: str, analysis_type: str = "content_analysis"):
+    """Analyze an image already in storage (memory-mapped, no base64 round-trip)"""
+    try:
+        try:
+            parsed_type = ImageAnalysisType(analysis_type)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Unknown analysis type: {analysis_type}")
+        storage_manager = await get_storage_manager()
+        request = ImageAnalysisRequest(
+            image_data="",
+            analysis_type=parsed_type
+        )
+        
+        file_path = storage_manager.get_file_path(filename)
+        if file_path is None:
+            # Backend remoto: sem arquivo local para mapear
+            info = await storage_manager.get_file_info(filename)
+            if info is None:
+                raise HTTPException(status_code=404, detail="File not found")
+            contents = await storage_manager.backend.get(
+                storage_manager.get_file_key(filename, info["media_type"])
+            )
+            request.image_data = base64.b64encode(contents).decode()
+        
+        # Caminho e chave do índice resolvidos aqui, a partir do storage (não fazem parte do corpo das requisições)
+        result = await image_analyzer.analyze(
+            request, image_path=str(file_path) if file_path is not None else None, index_key=filename
+        )
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Stored image analysis failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/analyze/speech/stored/{filename}")
+async def analyze_stored_audio(filename: str, analysis_type: str = "transcription"):
+    """Analyze an audio file already in storage (path handed straight to Whisper)"""
+    try:
+        try:
+            parsed_type = SpeechAnalysisType(analysis_type)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Unknown analysis type: {analysis_type}")
+        storage_manager = await get_storage_manager()
+        request = SpeechAnalysisRequest(
+            audio_data="",
+            analysis_type=parsed_type
+        )
+        
+        file_path = storage_manager.get_file_path(filename)
+        if file_path is None:
+            info = await storage_manager.get_file_info(filename)
+            if info is None:
+                raise HTTPException(status_code=404, detail="File not found")
+            contents = await storage_manager.backend.get(
+                storage_manager.get_file_key(filename, info["media_type"])
+            )
+            request.audio_data = base64.b64encode(contents).decode()
+        
+        # Caminho resolvido aqui, a partir do storage (não faz parte do corpo das requisições)
+        result = await speech_processor.analyze(
+            request, audio_path=str(file_path) if file_path is not None else None
+        )
+        return result
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Stored audio analysis failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ============================================================================
 # MAIN
 # ============================================================================
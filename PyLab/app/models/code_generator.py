@@ -17,10 +17,9 @@ from transformers import (
     CodeT5Tokenizer, T5ForConditionalGeneration,
     AutoTokenizer, AutoModelForCausalLM
 )
-import openai
 import asyncio
 import logging
-from typing import Dict, List, Optional, Any, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
 from enum import Enum
 import json
@@ -32,6 +31,10 @@ import tempfile
 import os
 from pathlib import Path
 
+from ..utils.llm_gateway import llm_gateway
+from ..utils.metrics import current_usage, instrument
+from ..utils.prompt_builder import prepare_input
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
@@ -100,7 +103,7 @@ class CodeGenerator:
         self._load_models()
         
         # Cliente OpenAI para análises avançadas
-        self.openai_client = openai.AsyncOpenAI()
+        self.llm = llm_gateway  # Cliente LLM compartilhado (pool, rate limit, retries)
         
         # Templates de código para diferentes linguagens
         self.templates = self._load_templates()
@@ -222,6 +225,7 @@ class {controller_name} extends Controller
             }
         }
 
+    @instrument("code", "generation_type")
     async def generate(self, request: CodeGenerationRequest) -> CodeGenerationResult:
         """Gera código baseado na solicitação"""
         start_time = asyncio.get_event_loop().time()
@@ -233,17 +237,20 @@ class {controller_name} extends Controller
             else:
                 generated_code = await self._generate_with_ai(request)
             
+            # Código como entra nos prompts de análise (orçamento de tokens)
+            prompt_code = self._prompt_code(generated_code)
+            
             # Analisar código gerado
-            analysis = await self._analyze_code(generated_code, request.language)
+            analysis = await self._analyze_code(prompt_code, request.language)
             
             # Gerar testes
-            tests = await self._generate_tests(generated_code, request.language) if request.generation_type != CodeGenerationType.SQL_QUERY else None
+            tests = await self._generate_tests(prompt_code, request.language) if request.generation_type != CodeGenerationType.SQL_QUERY else None
             
             # Gerar documentação
-            documentation = await self._generate_documentation(generated_code, request)
+            documentation = await self._generate_documentation(prompt_code, request)
             
             # Explicação
-            explanation = await self._generate_explanation(generated_code, request)
+            explanation = await self._generate_explanation(prompt_code, request)
             
             processing_time = asyncio.get_event_loop().time() - start_time
             
@@ -260,7 +267,9 @@ class {controller_name} extends Controller
                     "models_used": ["CodeT5", "GPT-4"],
                     "device": self.device,
                     "framework": request.framework,
-                    "lines_of_code": len(generated_code.split('\n'))
+                    "lines_of_code": len(generated_code.split('\n')),
+                    "tokens_used": current_usage().total_tokens,
+                    "prompt_trims": current_usage().prompt_trims
                 },
                 processing_time=processing_time
             )
@@ -269,6 +278,81 @@ class {controller_name} extends Controller
             logger.error(f"Erro na geração de código: {e}")
             raise
 
+    @instrument("code", "generation_type")
+    async def generate_stream(self, request: CodeGenerationRequest) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Versão streaming de ``generate``
+        
+        O código é gerado direto pelo GPT-4 e enviado em trechos
+        ("delta" do campo generated_code) à medida que chega. Em seguida,
+        análise, testes, documentação e explicação rodam em paralelo e
+        cada um é emitido ("field") assim que fica pronto; o resultado
+        completo vem no evento final ("result").
+        """
+        start_time = asyncio.get_event_loop().time()
+        
+        prompt = self._build_gpt4_prompt(self._prepare_generation_prompt(request))
+        parts: List[str] = []
+        try:
+            async for delta in self.llm.chat_completion_stream(
+                model="gpt-4-turbo-preview",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.3,
+                max_tokens=2000
+            ):
+                parts.append(delta)
+                yield {"type": "delta", "field": "generated_code", "text": delta}
+        except Exception as e:
+            logger.error(f"Erro na geração de código (streaming): {e}")
+            raise
+        
+        generated_code = "".join(parts).strip()
+        yield {"type": "field", "field": "generated_code", "value": generated_code}
+        
+        # Etapas dependem só do código: rodar em paralelo e emitir na ordem em que terminam
+        async def run(field: str, coro):
+            return field, await coro
+        
+        prompt_code = self._prompt_code(generated_code)
+        steps = [
+            run("analysis", self._analyze_code(prompt_code, request.language)),
+            run("documentation", self._generate_documentation(prompt_code, request)),
+            run("explanation", self._generate_explanation(prompt_code, request)),
+            run("confidence_score", self._calculate_confidence(generated_code, request)),
+        ]
+        if request.generation_type != CodeGenerationType.SQL_QUERY:
+            steps.append(run("tests", self._generate_tests(prompt_code, request.language)))
+        
+        fields: Dict[str, Any] = {"tests": None}
+        for step in asyncio.as_completed(steps):
+            field, value = await step
+            fields[field] = value
+            yield {"type": "field", "field": field, "value": value}
+        
+        yield {
+            "type": "result",
+            "result": CodeGenerationResult(
+                generated_code=generated_code,
+                language=request.language,
+                generation_type=request.generation_type,
+                explanation=fields["explanation"],
+                analysis=fields["analysis"],
+                tests=fields["tests"],
+                documentation=fields["documentation"],
+                confidence_score=fields["confidence_score"],
+                metadata={
+                    "models_used": ["GPT-4"],
+                    "device": self.device,
+                    "framework": request.framework,
+                    "lines_of_code": len(generated_code.split('\n')),
+                    "tokens_used": current_usage().total_tokens,
+                    "prompt_trims": current_usage().prompt_trims,
+                    "streamed": True
+                },
+                processing_time=asyncio.get_event_loop().time() - start_time
+            )
+        }
+
     async def _generate_with_templates(self, request: CodeGenerationRequest) -> str:
         """Gera código usando templates e IA"""
         try:
@@ -292,7 +376,7 @@ class {controller_name} extends Controller
             }}
             """
             
-            response = await self.openai_client.chat.completions.create(
+            response = await self.llm.chat_completion(
                 model="gpt-4-turbo-preview",
                 messages=[{"role": "user", "content": prompt}],
                 response_format={"type": "json_object"},
@@ -335,7 +419,7 @@ class {controller_name} extends Controller
             Retorne apenas o código da função.
             """
             
-            response = await self.openai_client.chat.completions.create(
+            response = await self.llm.chat_completion(
                 model="gpt-4-turbo-preview",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.2
@@ -382,7 +466,7 @@ class {controller_name} extends Controller
             Retorne código completo pronto para executar.
             """
             
-            response = await self.openai_client.chat.completions.create(
+            response = await self.llm.chat_completion(
                 model="gpt-4-turbo-preview",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.3
@@ -425,7 +509,7 @@ class {controller_name} extends Controller
             base_prompt += f"\nRequisitos: {', '.join(request.requirements)}"
         
         if request.existing_code:
-            base_prompt += f"\nCódigo existente:\n{request.existing_code}"
+            base_prompt += f"\nCódigo existente:\n{self._prompt_code(request.existing_code, 'existing_code')}"
         
         # Prompts específicos por tipo
         type_prompts = {
@@ -442,6 +526,10 @@ class {controller_name} extends Controller
         
         return f"{base_prompt}\n\n{specific_prompt}"
 
+    def _prompt_code(self, code: str, label: str = "code") -> str:
+        """Código compactado (indentação preservada) e cortado ao orçamento do GPT-4"""
+        return prepare_input(code, "gpt-4-turbo-preview", label=label, kind="code")
+
     async def _generate_with_starcoder(self, prompt: str, request: CodeGenerationRequest) -> str:
         """Gera código usando StarCoder"""
         try:
@@ -470,10 +558,9 @@ class {controller_name} extends Controller
             logger.error(f"Erro com StarCoder: {e}")
             return await self._generate_with_gpt4(prompt, request)
 
-    async def _generate_with_gpt4(self, prompt: str, request: CodeGenerationRequest) -> str:
-        """Gera código usando GPT-4"""
-        try:
-            full_prompt = f"""
+    def _build_gpt4_prompt(self, prompt: str) -> str:
+        """Prompt final de geração com GPT-4 (compartilhado com o streaming)"""
+        return f"""
             {prompt}
             
             Requisitos adicionais:
@@ -485,10 +572,13 @@ class {controller_name} extends Controller
             
             Retorne apenas o código, sem explicações adicionais.
             """
-            
-            response = await self.openai_client.chat.completions.create(
+
+    async def _generate_with_gpt4(self, prompt: str, request: CodeGenerationRequest) -> str:
+        """Gera código usando GPT-4"""
+        try:
+            response = await self.llm.chat_completion(
                 model="gpt-4-turbo-preview",
-                messages=[{"role": "user", "content": full_prompt}],
+                messages=[{"role": "user", "content": self._build_gpt4_prompt(prompt)}],
                 temperature=0.3,
                 max_tokens=2000
             )
@@ -519,7 +609,7 @@ class {controller_name} extends Controller
             }}
             """
             
-            response = await self.openai_client.chat.completions.create(
+            response = await self.llm.chat_completion(
                 model="gpt-4-turbo-preview",
                 messages=[{"role": "user", "content": prompt}],
                 response_format={"type": "json_object"},
@@ -576,7 +666,7 @@ class {controller_name} extends Controller
             Retorne apenas o código dos testes.
             """
             
-            response = await self.openai_client.chat.completions.create(
+            response = await self.llm.chat_completion(
                 model="gpt-4-turbo-preview",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.3
@@ -609,7 +699,7 @@ class {controller_name} extends Controller
             Use formato Markdown.
             """
             
-            response = await self.openai_client.chat.completions.create(
+            response = await self.llm.chat_completion(
                 model="gpt-4-turbo-preview",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.3
@@ -638,7 +728,7 @@ class {controller_name} extends Controller
             Seja conciso mas informativo.
             """
             
-            response = await self.openai_client.chat.completions.create(
+            response = await self.llm.chat_completion(
                 model="gpt-4-turbo-preview",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.3
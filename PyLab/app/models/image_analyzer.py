@@ -8,25 +8,43 @@ Capacidades:
 - Detecção de elementos visuais
 - Análise de concorrentes visuais
 - Classificação automática de imagens
+- Inferência CLIP/BLIP em lote para requisições concorrentes
+- Índice de embeddings: busca por similaridade, quase duplicatas e texto -> imagem
+- Pipeline não bloqueante: inferência, OpenCV e download em executores/pools próprios
+- Vários tipos de análise numa requisição, com decodificação, legenda e features compartilhadas
 """
 
+import os
 import torch
 import clip
-import cv2
 import numpy as np
 from PIL import Image
 import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
 from enum import Enum
 import json
 import base64
+import hashlib
 import io
+import functools
+from collections import OrderedDict
 from datetime import datetime
-import requests
+from pathlib import Path
 from transformers import BlipProcessor, BlipForConditionalGeneration
 
+from ..utils.embedding_index import EmbeddingIndex
+from ..utils.image_features import ImageFeatureContext
+from ..utils.image_ingest import (
+    BLIP_INPUT_SIDE, CLIP_INPUT_SIDE, IMAGE_INGEST_MAX_SIDE, decode_image, fit_image, model_input, original_size
+)
+from ..utils.media_fetcher import media_fetcher
+from ..utils.media_serving import open_mmap
+from ..utils.micro_batcher import MicroBatcher
+from ..utils.similarity import pairwise_similarity_stats
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
@@ -67,6 +85,27 @@ class ImageAnalyzer:
         # Carregar modelos
         self._load_models()
         
+        # Executores por etapa (nada roda no event loop):
+        # - inferência CLIP/BLIP: lotes em sequência, o torch paraleliza cada lote
+        # - CPU: decodificação, OpenCV e NumPy (liberam o GIL)
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("VISION_INFERENCE_THREADS", "1")), thread_name_prefix="pylab-vision"
+        )
+        self.cpu_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("IMAGE_CPU_THREADS", "4")), thread_name_prefix="pylab-image-cpu"
+        )
+        
+        # Imagens remotas já decodificadas (chave: URL + ETag/hash do conteúdo)
+        self._decoded_cache: "OrderedDict[Tuple[str, str, int], Image.Image]" = OrderedDict()
+        self._decoded_cache_size = int(os.getenv("IMAGE_DECODE_CACHE_SIZE", "32"))
+        
+        # Inferência em lote: chamadas concorrentes (requisições, compare_images) são
+        # agrupadas por uma janela curta
+        batch_size = int(os.getenv("VISION_BATCH_SIZE", "16"))
+        batch_wait = float(os.getenv("VISION_BATCH_WAIT_MS", "10")) / 1000
+        self._clip_batcher = MicroBatcher(self._encode_images_batch, max_batch_size=batch_size, max_wait=batch_wait)
+        self._blip_batcher = MicroBatcher(self._caption_batch, max_batch_size=batch_size, max_wait=batch_wait)
+        
         # Prompts especializados para análise textual das imagens
         self.analysis_prompts = {
             ImageAnalysisType.CONTENT_ANALYSIS: self._get_content_analysis_queries(),
@@ -78,12 +117,31 @@ class ImageAnalyzer:
             ImageAnalysisType.EMOTION_ANALYSIS: self._get_emotion_analysis_queries(),
             ImageAnalysisType.ACCESSIBILITY_ANALYSIS: self._get_accessibility_analysis_queries(),
         }
+        
+        # Embeddings normalizados das queries (fixas): calculados uma vez, só a imagem é codificada por requisição
+        self.text_features = self._load_text_features()
+        
+        # Todas as queries empilhadas (análise multi-tipo: uma multiplicação só)
+        self._text_feature_slices: Dict[ImageAnalysisType, slice] = {}
+        offset = 0
+        for analysis_type, queries in self.analysis_prompts.items():
+            self._text_feature_slices[analysis_type] = slice(offset, offset + len(queries))
+            offset += len(queries)
+        self._all_text_features = torch.cat([self.text_features[t] for t in self.analysis_prompts])
+        
+        # Índice persistente dos embeddings das imagens (chave: nome do arquivo no storage)
+        self.embedding_index = EmbeddingIndex(
+            Path(os.getenv("EMBEDDING_INDEX_PATH") or os.path.join(os.getenv("CACHE_PATH", "./cache"), "embedding_index")),
+            dim=self.clip_model.visual.output_dim,
+            ann=os.getenv("EMBEDDING_INDEX_ANN", "false").lower() == "true"
+        )
 
     def _load_models(self):
         """Carrega os modelos necessários"""
         try:
             # CLIP para análise visual-textual
-            self.clip_model, self.clip_preprocess = clip.load("ViT-B/32", device=self.device)
+            self.clip_model_name = "ViT-B/32"
+            self.clip_model, self.clip_preprocess = clip.load(self.clip_model_name, device=self.device)
             logger.info("✅ CLIP model carregado")
             
             # BLIP para descrição de imagens
@@ -97,169 +155,308 @@ class ImageAnalyzer:
             logger.error(f"Erro ao carregar modelos: {e}")
             raise
 
-    async def analyze(self, request: ImageAnalysisRequest) -> ImageAnalysisResult:
-        """Analisa imagem usando CLIP e outros modelos"""
+    async def analyze(
+        self,
+        request: ImageAnalysisRequest,
+        features: Optional[ImageFeatureContext] = None,
+        image_path: Optional[str] = None,
+        index_key: Optional[str] = None,
+        image: Optional[Image.Image] = None
+    ) -> ImageAnalysisResult:
+        """
+        Analisa imagem usando CLIP e outros modelos
+        
+        Args:
+            request: Requisição de análise
+            features: Contexto de características já calculado para a mesma imagem (opcional)
+            image_path: Arquivo local já resolvido pelo servidor (mapeado em memória, tem
+                prioridade sobre image_data); nunca vem do corpo da requisição
+            index_key: Nome no storage resolvido pelo servidor; o embedding é indexado com
+                essa chave (também nunca vem do corpo da requisição)
+            image: Imagem já decodificada por quem chama (dispensa image_data/image_path)
+        """
         start_time = asyncio.get_event_loop().time()
         
         try:
-            # Carregar e preprocessar imagem
-            image = await self._load_image(request.image_data)
+            # Carregar e preprocessar imagem (decodificada: só o limite do ingest)
+            if image is not None:
+                image = await self.run_cpu(fit_image, image)
+            else:
+                image = await self.load_image(request.image_data, image_path)
             
-            # Análises base
-            description = await self._generate_description(image)
-            visual_elements = await self._extract_visual_elements(image)
-            clip_analysis = await self._analyze_with_clip(image, request.analysis_type)
+            # Análises base em paralelo (BLIP e CLIP entram nos lotes em andamento, OpenCV no pool de CPU)
+            description, clip_analysis, visual_elements = await asyncio.gather(
+                self._generate_description(image),
+                self._analyze_with_clip(image, request.analysis_type, index_key),
+                self._extract_visual_elements(image, features)
+            )
             
-            # Análise específica por tipo
-            specialized_insights = await self._perform_specialized_analysis(
-                image, request.analysis_type, request.context
+            return await self._build_result(
+                request, request.analysis_type, image, description, visual_elements, clip_analysis, start_time,
+                index_key=index_key
             )
             
-            # Combinar resultados
-            insights = {
-                **visual_elements,
-                **clip_analysis,
-                **specialized_insights,
-                "description": description
-            }
+        except Exception as e:
+            logger.error(f"Erro na análise de imagem: {e}")
+            raise
+
+    async def analyze_multi(
+        self,
+        request: ImageAnalysisRequest,
+        analysis_types: List[ImageAnalysisType],
+        features: Optional[ImageFeatureContext] = None,
+        index_key: Optional[str] = None
+    ) -> List[ImageAnalysisResult]:
+        """
+        Vários tipos de análise sobre a mesma imagem numa única passada
+        
+        A imagem é decodificada, descrita (BLIP), codificada (CLIP) e tem os
+        elementos visuais extraídos uma vez; as queries de todos os tipos são
+        pontuadas contra o mesmo embedding numa única multiplicação.
+        
+        Args:
+            request: Requisição base (analysis_type é ignorado)
+            analysis_types: Tipos de análise desejados
+            features: Contexto de características já calculado (opcional)
+            index_key: Nome no storage resolvido pelo servidor (indexa o embedding)
+        
+        Returns:
+            Um resultado por tipo, na ordem pedida
+        """
+        start_time = asyncio.get_event_loop().time()
+        analysis_types = list(dict.fromkeys(analysis_types))
+        if not analysis_types:
+            return []
+        
+        try:
+            image = await self.load_image(request.image_data)
             
-            # Gerar recomendações
-            recommendations = await self._generate_recommendations(
-                insights, request.analysis_type, request.business_domain
+            description, image_features, visual_elements = await asyncio.gather(
+                self._generate_description(image),
+                self._encode_image(image, index_key),
+                self._extract_visual_elements(image, features)
             )
             
-            processing_time = asyncio.get_event_loop().time() - start_time
-            
-            return ImageAnalysisResult(
-                analysis_type=request.analysis_type,
-                insights=insights,
-                summary=await self._generate_summary(insights, request.analysis_type),
-                confidence_score=insights.get("confidence_score", 0.8),
-                recommendations=recommendations,
-                visual_elements=visual_elements,
-                metadata={
-                    "models_used": ["CLIP", "BLIP"],
-                    "device": self.device,
-                    "business_domain": request.business_domain,
-                    "image_size": image.size
-                },
-                processing_time=processing_time
-            )
+            # Logits de todas as queries de uma vez; softmax por tipo
+            logits = (100.0 * image_features @ self._all_text_features.T)[0]
+            
+            return list(await asyncio.gather(*[
+                self._build_result(
+                    request, analysis_type, image, description, visual_elements,
+                    self._clip_scores(analysis_type, logits[self._text_feature_slices[analysis_type]]),
+                    start_time, shared_types=analysis_types, index_key=index_key
+                )
+                for analysis_type in analysis_types
+            ]))
             
         except Exception as e:
-            logger.error(f"Erro na análise de imagem: {e}")
+            logger.error(f"Erro na análise multi-tipo de imagem: {e}")
             raise
 
-    async def _load_image(self, image_data: str) -> Image.Image:
-        """Carrega imagem de base64 ou URL"""
+    async def _build_result(
+        self,
+        request: ImageAnalysisRequest,
+        analysis_type: ImageAnalysisType,
+        image: Image.Image,
+        description: str,
+        visual_elements: Dict[str, Any],
+        clip_analysis: Dict[str, Any],
+        start_time: float,
+        shared_types: Optional[List[ImageAnalysisType]] = None,
+        index_key: Optional[str] = None
+    ) -> ImageAnalysisResult:
+        """Análise específica do tipo, recomendações e resumo sobre os resultados base"""
+        # Análise específica por tipo
+        specialized_insights = await self._perform_specialized_analysis(
+            image, analysis_type, request.context
+        )
+        
+        # Combinar resultados
+        insights = {
+            **visual_elements,
+            **clip_analysis,
+            **specialized_insights,
+            "description": description
+        }
+        
+        # Gerar recomendações
+        recommendations = await self._generate_recommendations(
+            insights, analysis_type, request.business_domain
+        )
+        
+        metadata = {
+            "models_used": ["CLIP", "BLIP"],
+            "device": self.device,
+            "business_domain": request.business_domain,
+            "image_size": original_size(image),
+            "working_size": image.size,
+            "filename": index_key
+        }
+        if shared_types:
+            # Decodificação, legenda, features e embedding compartilhados entre os tipos
+            metadata["shared_with"] = [t.value for t in shared_types]
+        
+        processing_time = asyncio.get_event_loop().time() - start_time
+        
+        return ImageAnalysisResult(
+            analysis_type=analysis_type,
+            insights=insights,
+            summary=await self._generate_summary(insights, analysis_type),
+            confidence_score=insights.get("confidence_score", 0.8),
+            recommendations=recommendations,
+            visual_elements=visual_elements,
+            metadata=metadata,
+            processing_time=processing_time
+        )
+
+    async def load_image(
+        self,
+        image_data: str,
+        image_path: Optional[str] = None,
+        max_side: Optional[int] = IMAGE_INGEST_MAX_SIDE
+    ) -> Image.Image:
+        """
+        Carrega imagem de arquivo local, base64 ou URL
+        
+        A decodificação já sai reduzida (maior lado <= max_side, draft em JPEG)
+        e com a orientação EXIF aplicada; o tamanho original fica em
+        ``image.info["original_size"]``.
+        """
         try:
-            if image_data.startswith("http"):
-                response = requests.get(image_data)
-                image = Image.open(io.BytesIO(response.content))
-            else:
-                # Assumir base64
-                image_bytes = base64.b64decode(image_data)
-                image = Image.open(io.BytesIO(image_bytes))
+            if image_path:
+                return await self.run_cpu(self._decode_file, image_path, max_side)
             
-            return image.convert("RGB")
+            if image_data.startswith("http"):
+                # Cliente assíncrono com pool de conexões e cache (revalidação por ETag)
+                media = await media_fetcher.get(image_data)
+                key = (media.url, media.version, max_side or 0)
+                image = self._decoded_cache.get(key)
+                if image is None:
+                    image = await self.run_cpu(self._decode_bytes, media.content, max_side)
+                    self._remember_decoded(key, image)
+                else:
+                    self._decoded_cache.move_to_end(key)
+                return image
+            
+            # Assumir base64
+            return await self.run_cpu(self._decode_base64, image_data, max_side)
         except Exception as e:
             logger.error(f"Erro ao carregar imagem: {e}")
             raise
 
+    async def run_cpu(self, func, *args, **kwargs) -> Any:
+        """Executar trabalho de CPU (decodificação, OpenCV, NumPy) no pool da etapa de CPU"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.cpu_executor, functools.partial(func, *args, **kwargs))
+
+    def _remember_decoded(self, key: Tuple[str, str, int], image: Image.Image):
+        self._decoded_cache[key] = image
+        # Versão anterior da mesma URL não será mais usada
+        for stale in [k for k in self._decoded_cache if k[0] == key[0] and k[1] != key[1]]:
+            del self._decoded_cache[stale]
+        while len(self._decoded_cache) > self._decoded_cache_size:
+            self._decoded_cache.popitem(last=False)
+
+    @staticmethod
+    def _decode_file(image_path: str, max_side: Optional[int]) -> Image.Image:
+        # Decodificar direto do mmap, sem copiar o arquivo para bytes
+        with open_mmap(image_path) as buffer:
+            return decode_image(buffer, max_side)
+
+    @staticmethod
+    def _decode_bytes(image_bytes: bytes, max_side: Optional[int]) -> Image.Image:
+        return decode_image(io.BytesIO(image_bytes), max_side)
+
+    @classmethod
+    def _decode_base64(cls, image_data: str, max_side: Optional[int]) -> Image.Image:
+        return cls._decode_bytes(base64.b64decode(image_data), max_side)
+
     async def _generate_description(self, image: Image.Image) -> str:
         """Gera descrição da imagem usando BLIP"""
         try:
-            inputs = self.blip_processor(image, return_tensors="pt")
-            if self.device == "cuda":
-                inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            
-            with torch.no_grad():
-                out = self.blip_model.generate(**inputs, max_length=100)
-            
-            description = self.blip_processor.decode(out[0], skip_special_tokens=True)
-            return description
+            return await self._blip_batcher.submit(image)
         except Exception as e:
             logger.error(f"Erro na geração de descrição: {e}")
             return "Descrição não disponível"
 
-    async def _extract_visual_elements(self, image: Image.Image) -> Dict[str, Any]:
-        """Extrai elementos visuais básicos"""
+    async def _extract_visual_elements(
+        self,
+        image: Image.Image,
+        features: Optional[ImageFeatureContext] = None
+    ) -> Dict[str, Any]:
+        """Extrai elementos visuais básicos (no pool de CPU)"""
+        return await self.run_cpu(self._compute_visual_elements, image, features)
+
+    def _compute_visual_elements(
+        self,
+        image: Image.Image,
+        features: Optional[ImageFeatureContext] = None
+    ) -> Dict[str, Any]:
         try:
-            # Converter para numpy para análise
-            img_array = np.array(image)
+            # Características calculadas uma vez sobre a cópia de trabalho reduzida
+            features = features or ImageFeatureContext(image)
             
             # Análise de cores dominantes
-            colors = self._analyze_colors(img_array)
+            colors = self._analyze_colors(features)
             
             # Análise de composição
-            composition = self._analyze_composition(img_array)
+            composition = self._analyze_composition(features)
             
             # Análise de qualidade técnica
-            quality = self._analyze_technical_quality(img_array)
+            quality = self._analyze_technical_quality(features)
             
             return {
                 "colors": colors,
                 "composition": composition,
                 "technical_quality": quality,
-                "dimensions": {"width": image.width, "height": image.height},
+                "dimensions": dict(zip(("width", "height"), original_size(image))),
                 "aspect_ratio": round(image.width / image.height, 2)
             }
         except Exception as e:
             logger.error(f"Erro na extração de elementos visuais: {e}")
             return {}
 
-    def _analyze_colors(self, img_array: np.ndarray) -> Dict[str, Any]:
+    def _analyze_colors(self, features: ImageFeatureContext) -> Dict[str, Any]:
         """Analisa paleta de cores"""
         try:
-            # Redimensionar para análise mais rápida
-            small_img = cv2.resize(img_array, (100, 100))
-            
-            # K-means para cores dominantes
-            data = small_img.reshape((-1, 3))
-            data = np.float32(data)
-            
-            criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
-            k = 5
-            _, labels, centers = cv2.kmeans(data, k, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
+            # Paleta dominante (histograma quantizado + k-means determinístico)
+            centers, _ = features.dominant_colors(5)
             
             # Converter para lista de cores
             dominant_colors = centers.astype(int).tolist()
             
             # Análise de temperatura de cor
-            avg_color = np.mean(img_array, axis=(0, 1))
+            avg_color = features.mean_rgb
             warmth = "quente" if avg_color[0] > avg_color[2] else "fria"
             
             return {
                 "dominant_colors": dominant_colors,
                 "color_temperature": warmth,
-                "brightness": float(np.mean(cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY))),
-                "contrast": float(np.std(cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)))
+                "brightness": features.brightness,
+                "contrast": features.contrast
             }
         except Exception as e:
             logger.error(f"Erro na análise de cores: {e}")
             return {}
 
-    def _analyze_composition(self, img_array: np.ndarray) -> Dict[str, Any]:
+    def _analyze_composition(self, features: ImageFeatureContext) -> Dict[str, Any]:
         """Analisa composição da imagem"""
         try:
-            height, width = img_array.shape[:2]
+            width, height = features.size
             
             # Análise de regra dos terços
             third_h, third_w = height // 3, width // 3
             
             # Detectar bordas para análise de composição
-            gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-            edges = cv2.Canny(gray, 100, 200)
+            edges = features.edges(100, 200)
             
             # Análise de simetria
-            left_half = gray[:, :width//2]
-            right_half = cv2.flip(gray[:, width//2:], 1)
-            symmetry = cv2.matchTemplate(left_half, right_half[:, :left_half.shape[1]], cv2.TM_CCOEFF_NORMED)[0][0]
+            symmetry = features.symmetry
             
             return {
                 "rule_of_thirds_compliance": self._check_rule_of_thirds(edges, third_w, third_h),
-                "symmetry_score": float(symmetry),
-                "edge_density": float(np.sum(edges > 0) / edges.size),
+                "symmetry_score": symmetry,
+                "edge_density": features.edge_density(100, 200),
                 "composition_balance": "equilibrada" if 0.3 < symmetry < 0.7 else "assimétrica"
             }
         except Exception as e:
@@ -288,19 +485,17 @@ class ImageAnalyzer:
         except Exception as e:
             return 0.0
 
-    def _analyze_technical_quality(self, img_array: np.ndarray) -> Dict[str, Any]:
+    def _analyze_technical_quality(self, features: ImageFeatureContext) -> Dict[str, Any]:
         """Analisa qualidade técnica"""
         try:
-            gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-            
             # Análise de nitidez (Laplacian)
-            sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+            sharpness = features.sharpness
             
             # Análise de ruído
-            noise = np.std(gray)
+            noise = features.contrast
             
             # Análise de exposição
-            histogram = cv2.calcHist([gray], [0], None, [256], [0, 256])
+            histogram = features.histogram
             exposure = "adequada"
             if np.sum(histogram[:50]) > np.sum(histogram) * 0.3:
                 exposure = "subexposta"
@@ -317,51 +512,50 @@ class ImageAnalyzer:
             logger.error(f"Erro na análise de qualidade: {e}")
             return {}
 
-    async def _analyze_with_clip(self, image: Image.Image, analysis_type: ImageAnalysisType) -> Dict[str, Any]:
+    async def _analyze_with_clip(
+        self,
+        image: Image.Image,
+        analysis_type: ImageAnalysisType,
+        filename: Optional[str] = None
+    ) -> Dict[str, Any]:
         """Análise usando CLIP"""
         try:
-            # Preprocessar imagem
-            image_input = self.clip_preprocess(image).unsqueeze(0).to(self.device)
-            
-            # Obter queries para o tipo de análise
-            queries = self.analysis_prompts[analysis_type]
-            
-            # Tokenizar textos
-            text_inputs = clip.tokenize(queries).to(self.device)
-            
-            # Calcular similaridades
-            with torch.no_grad():
-                image_features = self.clip_model.encode_image(image_input)
-                text_features = self.clip_model.encode_text(text_inputs)
-                
-                # Normalizar features
-                image_features /= image_features.norm(dim=-1, keepdim=True)
-                text_features /= text_features.norm(dim=-1, keepdim=True)
-                
-                # Calcular similaridade
-                similarity = (100.0 * image_features @ text_features.T).softmax(dim=-1)
-            
-            # Processar resultados
-            results = {}
-            for i, query in enumerate(queries):
-                score = float(similarity[0][i])
-                results[query.replace(" ", "_").lower()] = score
-            
-            # Encontrar o conceito mais provável
-            max_idx = similarity.argmax().item()
-            top_concept = queries[max_idx]
-            confidence = float(similarity[0][max_idx])
+            image_features = await self._encode_image(image, filename)
             
-            return {
-                "clip_analysis": results,
-                "top_concept": top_concept,
-                "confidence_score": confidence
-            }
+            # Similaridade com os embeddings pré-calculados das queries do tipo
+            logits = (100.0 * image_features @ self.text_features[analysis_type].T)[0]
+            return self._clip_scores(analysis_type, logits)
             
         except Exception as e:
             logger.error(f"Erro na análise CLIP: {e}")
             return {}
 
+    async def _encode_image(self, image: Image.Image, filename: Optional[str] = None) -> torch.Tensor:
+        """Features CLIP normalizadas (1, d) via lote; indexadas se houver nome no storage"""
+        image_features = (await self._clip_batcher.submit(image)).unsqueeze(0)
+        if filename:
+            await self.embedding_index.add(filename, image_features[0].numpy())
+        return image_features
+
+    def _clip_scores(self, analysis_type: ImageAnalysisType, logits: torch.Tensor) -> Dict[str, Any]:
+        """Probabilidades (softmax) das queries de um tipo a partir dos logits imagem x texto"""
+        queries = self.analysis_prompts[analysis_type]
+        similarity = logits.softmax(dim=-1)
+        
+        # Processar resultados
+        results = {}
+        for i, query in enumerate(queries):
+            results[query.replace(" ", "_").lower()] = float(similarity[i])
+        
+        # Encontrar o conceito mais provável
+        max_idx = similarity.argmax().item()
+        
+        return {
+            "clip_analysis": results,
+            "top_concept": queries[max_idx],
+            "confidence_score": float(similarity[max_idx])
+        }
+
     def _get_content_analysis_queries(self) -> List[str]:
         return [
             "a professional business photo",
@@ -548,72 +742,228 @@ class ImageAnalyzer:
         
         return f"Análise {analysis_type.value}: {description}. Confiança: {confidence:.1%}"
 
-    async def compare_images(self, images: List[str], comparison_type: str = "similarity") -> Dict[str, Any]:
-        """Compara múltiplas imagens"""
+    async def compare_images(
+        self,
+        images: List[str],
+        comparison_type: str = "similarity",
+        top_k: int = 5,
+        include_matrix: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """
+        Compara múltiplas imagens por similaridade de cosseno (CLIP)
+        
+        As similaridades são calculadas em blocos de linhas (uma multiplicação
+        de matrizes por bloco), sem materializar a matriz n×n em Python.
+        
+        Args:
+            images: Imagens (base64 ou URL)
+            comparison_type: Tipo de comparação
+            top_k: Quantidade de pares em top_pairs/bottom_pairs
+            include_matrix: Incluir a matriz completa (padrão: só até COMPARE_MATRIX_MAX_IMAGES)
+        """
         try:
             if len(images) < 2:
                 raise ValueError("Necessário pelo menos 2 imagens para comparação")
             
-            # Carregar todas as imagens
-            loaded_images = []
-            for img_data in images:
-                img = await self._load_image(img_data)
-                loaded_images.append(img)
+            block_size = int(os.getenv("COMPARE_BLOCK_SIZE", "256"))
+            if include_matrix is None:
+                include_matrix = len(images) <= int(os.getenv("COMPARE_MATRIX_MAX_IMAGES", "100"))
             
-            # Extrair features de todas as imagens
+            # Carregar e codificar por blocos: só um bloco de imagens decodificadas em memória
             features = []
-            for img in loaded_images:
-                image_input = self.clip_preprocess(img).unsqueeze(0).to(self.device)
-                with torch.no_grad():
-                    feature = self.clip_model.encode_image(image_input)
-                    feature /= feature.norm(dim=-1, keepdim=True)
-                    features.append(feature)
-            
-            # Calcular matriz de similaridade
-            similarity_matrix = []
-            for i, feat_i in enumerate(features):
-                row = []
-                for j, feat_j in enumerate(features):
-                    similarity = float((feat_i @ feat_j.T).item())
-                    row.append(similarity)
-                similarity_matrix.append(row)
+            for start in range(0, len(images), block_size):
+                loaded_images = await asyncio.gather(
+                    *[self.load_image(img_data) for img_data in images[start:start + block_size]]
+                )
+                features.extend(await self._clip_batcher.submit_many(list(loaded_images)))
+            
+            stats = await self.run_cpu(
+                pairwise_similarity_stats, torch.stack(features), top_k, block_size, include_matrix
+            )
             
             return {
-                "similarity_matrix": similarity_matrix,
-                "most_similar_pair": self._find_most_similar_pair(similarity_matrix),
-                "least_similar_pair": self._find_least_similar_pair(similarity_matrix),
-                "average_similarity": np.mean([s for row in similarity_matrix for s in row if s != 1.0])
+                "comparison_type": comparison_type,
+                "image_count": len(images),
+                **stats
             }
             
         except Exception as e:
             logger.error(f"Erro na comparação de imagens: {e}")
             raise
 
-    def _find_most_similar_pair(self, similarity_matrix: List[List[float]]) -> Tuple[int, int, float]:
-        """Encontra o par mais similar"""
-        max_sim = 0
-        max_pair = (0, 0)
+    async def compare_stored_images(
+        self,
+        filenames: List[str],
+        top_k: int = 5,
+        include_matrix: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """Compara imagens já indexadas usando os embeddings salvos (sem recodificar)"""
+        if len(filenames) < 2:
+            raise ValueError("Necessário pelo menos 2 imagens para comparação")
         
-        for i in range(len(similarity_matrix)):
-            for j in range(i + 1, len(similarity_matrix[i])):
-                if similarity_matrix[i][j] > max_sim:
-                    max_sim = similarity_matrix[i][j]
-                    max_pair = (i, j)
+        vectors, missing = await self.embedding_index.get_many(filenames)
+        if missing:
+            raise ValueError(f"Imagens não indexadas: {', '.join(missing)}")
         
-        return (*max_pair, max_sim)
-
-    def _find_least_similar_pair(self, similarity_matrix: List[List[float]]) -> Tuple[int, int, float]:
-        """Encontra o par menos similar"""
-        min_sim = 1.0
-        min_pair = (0, 0)
+        if include_matrix is None:
+            include_matrix = len(filenames) <= int(os.getenv("COMPARE_MATRIX_MAX_IMAGES", "100"))
+        stats = await self.run_cpu(
+            pairwise_similarity_stats, torch.from_numpy(vectors), top_k, int(os.getenv("COMPARE_BLOCK_SIZE", "256")), include_matrix
+        )
+        return {"comparison_type": "similarity", "image_count": len(filenames), "filenames": filenames, **stats}
+
+    # === BUSCA VISUAL ===
+
+    async def index_image(self, filename: str, image_data: str = "", image_path: Optional[str] = None) -> np.ndarray:
+        """
+        Codifica uma imagem e grava o embedding no índice
+        
+        Args:
+            filename: Nome do arquivo no storage (chave do índice)
+            image_data: Base64 ou URL (se image_path não for informado)
+            image_path: Arquivo local
+        """
+        image = await self.load_image(image_data, image_path)
+        vector = (await self._clip_batcher.submit(image)).numpy()
+        await self.embedding_index.add(filename, vector)
+        return vector
+
+    async def index_stored_image(self, storage_manager, filename: str) -> bool:
+        """
+        Indexa uma imagem do storage pelo nome resolvido no servidor
+        
+        Usa o arquivo local quando existe (mapeado em memória); em backends
+        remotos o conteúdo é lido do objeto.
+        
+        Args:
+            storage_manager: StorageManager de onde a imagem é lida
+            filename: Nome do arquivo no storage (chave do índice)
+            
+        Returns:
+            False se a imagem não existir no storage
+        """
+        file_path = storage_manager.get_file_path(filename)
+        if file_path is not None:
+            await self.index_image(filename, image_path=str(file_path))
+            return True
+        
+        info = await storage_manager.get_file_info(filename)
+        if info is None or info["media_type"] != "image":
+            return False
+        contents = await storage_manager.backend.get(storage_manager.get_file_key(filename, info["media_type"]))
+        await self.index_image(filename, base64.b64encode(contents).decode())
+        return True
+
+    async def find_similar(
+        self,
+        filename: Optional[str] = None,
+        image_data: Optional[str] = None,
+        k: int = 10,
+        min_score: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Imagens indexadas mais parecidas com uma imagem do índice ou enviada
+        
+        Args:
+            filename: Imagem já indexada (tem prioridade sobre image_data)
+            image_data: Imagem nova (base64 ou URL), não é indexada
+            k: Quantidade de resultados
+            min_score: Similaridade mínima (ex.: 0.95 para quase duplicatas)
+        """
+        if filename:
+            vector = await self.embedding_index.get(filename)
+            if vector is None:
+                raise ValueError(f"Imagem não indexada: {filename}")
+        elif image_data:
+            image = await self.load_image(image_data)
+            vector = (await self._clip_batcher.submit(image)).numpy()
+        else:
+            raise ValueError("Informe filename ou image_data")
+        
+        matches = await self.embedding_index.search(vector, k, exclude=filename, min_score=min_score)
+        return [{"filename": key, "similarity": score} for key, score in matches]
+
+    async def search_by_text(self, query: str, k: int = 10) -> List[Dict[str, Any]]:
+        """Busca texto -> imagem no índice (embedding de texto CLIP)"""
+        loop = asyncio.get_running_loop()
+        vector = (await loop.run_in_executor(self._executor, self._encode_texts, [query]))[0].numpy()
+        matches = await self.embedding_index.search(vector, k)
+        return [{"filename": key, "similarity": score} for key, score in matches]
+
+    # === EMBEDDINGS DAS QUERIES ===
+
+    def _load_text_features(self) -> Dict[ImageAnalysisType, torch.Tensor]:
+        """
+        Embeddings CLIP normalizados (CPU) das queries de cada tipo de análise
+
+        Persistidos em CACHE_PATH, com chave pelo modelo CLIP e pelo conteúdo
+        das queries: mudar qualquer um dos dois gera um arquivo novo.
+        """
+        key = hashlib.sha256(json.dumps({
+            "model": self.clip_model_name,
+            "queries": {t.value: q for t, q in self.analysis_prompts.items()}
+        }, sort_keys=True).encode()).hexdigest()[:16]
+        cache_file = os.path.join(os.getenv("CACHE_PATH", "./cache"), "clip_text_features", f"{key}.pt")
+        
+        if os.path.exists(cache_file):
+            try:
+                stored = torch.load(cache_file, map_location="cpu", weights_only=True)
+                logger.info(f"✅ Embeddings das queries CLIP carregados de {cache_file}")
+                return {t: stored[t.value] for t in self.analysis_prompts}
+            except Exception as e:
+                logger.warning(f"Cache de embeddings CLIP inválido ({cache_file}): {e}")
+        
+        text_features = {t: self._encode_texts(q) for t, q in self.analysis_prompts.items()}
+        
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            torch.save({t.value: f for t, f in text_features.items()}, cache_file)
+        except OSError as e:
+            logger.warning(f"Não foi possível salvar embeddings CLIP em {cache_file}: {e}")
+        
+        return text_features
+
+    def _encode_texts(self, texts: List[str]) -> torch.Tensor:
+        """Codifica textos com CLIP; retorna features normalizadas (CPU)"""
+        text_inputs = clip.tokenize(texts).to(self.device)
+        with torch.no_grad():
+            features = self.clip_model.encode_text(text_inputs).float()
+            features /= features.norm(dim=-1, keepdim=True)
+        return features.cpu()
+
+    # === INFERÊNCIA EM LOTE ===
+
+    async def _encode_images_batch(self, images: List[Image.Image]) -> List[torch.Tensor]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._encode_images, images)
+
+    def _encode_images(self, images: List[Image.Image]) -> List[torch.Tensor]:
+        """Preprocessa e codifica um lote com CLIP; retorna features normalizadas (CPU) por imagem"""
+        # Menor nível da pirâmide que ainda cobre a entrada do CLIP
+        image_input = torch.stack([
+            self.clip_preprocess(model_input(img, CLIP_INPUT_SIDE)) for img in images
+        ]).to(self.device)
+        with torch.no_grad():
+            features = self.clip_model.encode_image(image_input).float()
+            features /= features.norm(dim=-1, keepdim=True)
+        return list(features.cpu())
+
+    async def _caption_batch(self, images: List[Image.Image]) -> List[str]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._caption, images)
+
+    def _caption(self, images: List[Image.Image]) -> List[str]:
+        """Gera descrições BLIP para um lote (o processor redimensiona todas para o mesmo tamanho)"""
+        inputs = self.blip_processor(
+            images=[model_input(img, BLIP_INPUT_SIDE) for img in images], return_tensors="pt"
+        )
+        if self.device == "cuda":
+            inputs = {k: v.to(self.device) for k, v in inputs.items()}
         
-        for i in range(len(similarity_matrix)):
-            for j in range(i + 1, len(similarity_matrix[i])):
-                if similarity_matrix[i][j] < min_sim:
-                    min_sim = similarity_matrix[i][j]
-                    min_pair = (i, j)
+        with torch.no_grad():
+            out = self.blip_model.generate(**inputs, max_length=100)
         
-        return (*min_pair, min_sim)
+        return self.blip_processor.batch_decode(out, skip_special_tokens=True)
 
 # Instância global
 image_analyzer = ImageAnalyzer()
\ No newline at end of file
@@ -31,9 +31,13 @@ import os
 from .media_generator import MediaGenerator, MediaGenerationRequest, MediaType
 from .image_analyzer import ImageAnalyzer, ImageAnalysisRequest, ImageAnalysisType
 from ..api.schemas import ImageStyle, VideoQuality
+from ..utils.image_features import ImageFeatureContext
 
 logger = logging.getLogger("PyLab.ImageInputProcessor")
 
+# Maior lado decodificado das entradas de geração (mais resolução que a análise)
+IMAGE_INPUT_MAX_SIDE = int(os.getenv("IMAGE_INPUT_MAX_SIDE", "4096"))
+
 class ImageInputType(str, Enum):
     """Tipos de entrada de imagem"""
     BASE64 = "base64"
@@ -226,24 +230,18 @@ class ImageInputProcessor:
                     # Remove data URL prefix
                     image_input = image_input.split(',')[1]
                 
-                image_bytes = base64.b64decode(image_input)
-                image = Image.open(io.BytesIO(image_bytes))
+                image = await self.image_analyzer.load_image(image_input, max_side=IMAGE_INPUT_MAX_SIDE)
                 
             elif input_type == ImageInputType.FILE_PATH:
-                image = Image.open(image_input)
+                image = await self.image_analyzer.load_image("", image_input, max_side=IMAGE_INPUT_MAX_SIDE)
                 
             elif input_type == ImageInputType.URL:
-                import requests
-                response = requests.get(image_input)
-                image = Image.open(io.BytesIO(response.content))
+                # Download assíncrono (pool de conexões) e decodificação no pool de CPU
+                image = await self.image_analyzer.load_image(image_input, max_side=IMAGE_INPUT_MAX_SIDE)
                 
             else:
                 raise ValueError(f"Tipo de entrada não suportado: {input_type}")
             
-            # Converter para RGB se necessário
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
             logger.info(f"📸 Imagem carregada: {image.size} - {image.mode}")
             return image
             
@@ -254,21 +252,18 @@ class ImageInputProcessor:
     async def _analyze_input_image(self, image: Image.Image) -> Dict[str, Any]:
         """Analisar imagem de entrada para extrair informações"""
         try:
-            # Converter para base64 para análise
-            img_byte_arr = io.BytesIO()
-            image.save(img_byte_arr, format='PNG')
-            img_base64 = base64.b64encode(img_byte_arr.getvalue()).decode()
-            
-            # Usar o image_analyzer para análise completa
+            # Usar o image_analyzer para análise completa (imagem já decodificada, sem ida e volta em PNG/base64)
             analysis_request = ImageAnalysisRequest(
-                image_data=img_base64,
+                image_data="",
                 analysis_type=ImageAnalysisType.CONTENT_ANALYSIS
             )
             
-            analysis_result = await self.image_analyzer.analyze(analysis_request)
+            # Mesmo contexto de características para o analyzer e as análises técnicas
+            features = await self.image_analyzer.run_cpu(ImageFeatureContext, image)
+            analysis_result = await self.image_analyzer.analyze(analysis_request, features=features, image=image)
             
             # Adicionar análises técnicas extras
-            extra_analysis = self._extract_technical_features(image)
+            extra_analysis = await self.image_analyzer.run_cpu(self._extract_technical_features, image, features)
             
             return {
                 "ai_analysis": analysis_result.insights if analysis_result else {},
@@ -281,23 +276,27 @@ class ImageInputProcessor:
             logger.error(f"❌ Erro na análise da imagem: {e}")
             return {"error": str(e)}
     
-    def _extract_technical_features(self, image: Image.Image) -> Dict[str, Any]:
+    def _extract_technical_features(
+        self,
+        image: Image.Image,
+        features: Optional[ImageFeatureContext] = None
+    ) -> Dict[str, Any]:
         """Extrair características técnicas da imagem"""
         try:
-            # Converter para numpy para análise
-            img_array = np.array(image)
+            # Características calculadas uma vez sobre a cópia de trabalho reduzida
+            features = features or ImageFeatureContext(image)
             
             # Análise de cores
-            color_analysis = self._analyze_color_distribution(img_array)
+            color_analysis = self._analyze_color_distribution(features)
             
             # Análise de composição
-            composition_analysis = self._analyze_composition(img_array)
+            composition_analysis = self._analyze_composition(features)
             
             # Análise de textura
-            texture_analysis = self._analyze_texture(img_array)
+            texture_analysis = self._analyze_texture(features)
             
             # Detecção de objetos principais
-            object_detection = self._detect_main_objects(img_array)
+            object_detection = self._detect_main_objects(features)
             
             return {
                 "dimensions": {"width": image.width, "height": image.height},
@@ -306,27 +305,18 @@ class ImageInputProcessor:
                 "composition": composition_analysis,
                 "texture": texture_analysis,
                 "objects": object_detection,
-                "complexity_score": self._calculate_complexity_score(img_array)
+                "complexity_score": self._calculate_complexity_score(features)
             }
             
         except Exception as e:
             logger.error(f"Erro na análise técnica: {e}")
             return {}
     
-    def _analyze_color_distribution(self, img_array: np.ndarray) -> Dict[str, Any]:
+    def _analyze_color_distribution(self, features: ImageFeatureContext) -> Dict[str, Any]:
         """Analisar distribuição de cores"""
         try:
-            # Cores dominantes usando K-means
-            resized = cv2.resize(img_array, (100, 100))
-            data = resized.reshape((-1, 3)).astype(np.float32)
-            
-            criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
-            k = 5
-            _, labels, centers = cv2.kmeans(data, k, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
-            
-            # Calcular percentuais
-            unique, counts = np.unique(labels, return_counts=True)
-            percentages = counts / len(labels)
+            # Cores dominantes (paleta determinística, com o percentual de cada uma)
+            centers, percentages = features.dominant_colors(5)
             
             dominant_colors = []
             for i, center in enumerate(centers):
@@ -337,35 +327,29 @@ class ImageInputProcessor:
                 })
             
             # Análise de temperatura de cor
-            avg_color = np.mean(img_array, axis=(0, 1))
+            avg_color = features.mean_rgb
             warmth = "warm" if avg_color[0] > avg_color[2] else "cool"
             
-            # Brilho e contraste
-            gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-            brightness = np.mean(gray)
-            contrast = np.std(gray)
-            
             return {
                 "dominant_colors": sorted(dominant_colors, key=lambda x: x["percentage"], reverse=True),
                 "color_temperature": warmth,
-                "brightness": float(brightness),
-                "contrast": float(contrast),
-                "saturation": float(np.std(img_array))
+                "brightness": features.brightness,
+                "contrast": features.contrast,
+                "saturation": float(np.std(features.rgb))
             }
             
         except Exception as e:
             logger.error(f"Erro na análise de cores: {e}")
             return {}
     
-    def _analyze_composition(self, img_array: np.ndarray) -> Dict[str, Any]:
+    def _analyze_composition(self, features: ImageFeatureContext) -> Dict[str, Any]:
         """Analisar composição da imagem"""
         try:
-            height, width = img_array.shape[:2]
-            gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+            width, height = features.size
+            gray = features.gray
             
             # Detecção de bordas
-            edges = cv2.Canny(gray, 50, 150)
-            edge_density = np.sum(edges > 0) / edges.size
+            edge_density = features.edge_density(50, 150)
             
             # Análise de regra dos terços
             third_h, third_w = height // 3, width // 3
@@ -381,15 +365,12 @@ class ImageInputProcessor:
                             interest_points.append(float(np.std(region)))
             
             # Simetria
-            left_half = gray[:, :width//2]
-            right_half = cv2.flip(gray[:, width//2:], 1)
-            symmetry = cv2.matchTemplate(left_half, right_half[:, :left_half.shape[1]], 
-                                       cv2.TM_CCOEFF_NORMED)[0][0]
+            symmetry = features.symmetry
             
             return {
-                "edge_density": float(edge_density),
+                "edge_density": edge_density,
                 "rule_of_thirds_score": float(np.mean(interest_points)) if interest_points else 0.0,
-                "symmetry_score": float(symmetry),
+                "symmetry_score": symmetry,
                 "composition_balance": "balanced" if 0.3 < symmetry < 0.7 else "asymmetric"
             }
             
@@ -397,17 +378,11 @@ class ImageInputProcessor:
             logger.error(f"Erro na análise de composição: {e}")
             return {}
     
-    def _analyze_texture(self, img_array: np.ndarray) -> Dict[str, Any]:
+    def _analyze_texture(self, features: ImageFeatureContext) -> Dict[str, Any]:
         """Analisar textura da imagem"""
         try:
-            gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-            
             # Variância local para textura
-            kernel = np.ones((9, 9), np.float32) / 81
-            local_mean = cv2.filter2D(gray.astype(np.float32), -1, kernel)
-            local_var = cv2.filter2D((gray.astype(np.float32) - local_mean)**2, -1, kernel)
-            
-            texture_measure = np.mean(local_var)
+            texture_measure = np.mean(features.local_variance)
             
             # Classificar tipo de textura
             if texture_measure < 100:
@@ -427,23 +402,19 @@ class ImageInputProcessor:
             logger.error(f"Erro na análise de textura: {e}")
             return {}
     
-    def _detect_main_objects(self, img_array: np.ndarray) -> List[Dict[str, Any]]:
+    def _detect_main_objects(self, features: ImageFeatureContext) -> List[Dict[str, Any]]:
         """Detectar objetos principais na imagem"""
         try:
-            # Implementação simplificada usando contornos
-            gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-            
-            # Aplicar blur e threshold
-            blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-            _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            
-            # Encontrar contornos
-            contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            # Implementação simplificada usando contornos (blur + Otsu)
+            contours, _ = cv2.findContours(features.otsu_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
             
             objects = []
-            height, width = img_array.shape[:2]
+            width, height = features.size
             min_area = (width * height) * 0.01  # Mínimo 1% da imagem
             
+            # Medidas voltam para a escala da imagem original
+            scale = features.scale
+            
             for i, contour in enumerate(contours[:10]):  # Máximo 10 objetos
                 area = cv2.contourArea(contour)
                 if area > min_area:
@@ -451,8 +422,11 @@ class ImageInputProcessor:
                     
                     objects.append({
                         "id": i,
-                        "area": float(area),
-                        "bbox": {"x": int(x), "y": int(y), "width": int(w), "height": int(h)},
+                        "area": float(area * scale * scale),
+                        "bbox": {
+                            "x": int(x * scale), "y": int(y * scale),
+                            "width": int(w * scale), "height": int(h * scale)
+                        },
                         "area_percentage": float(area / (width * height) * 100),
                         "aspect_ratio": float(w / h) if h > 0 else 0
                     })
@@ -463,15 +437,13 @@ class ImageInputProcessor:
             logger.error(f"Erro na detecção de objetos: {e}")
             return []
     
-    def _calculate_complexity_score(self, img_array: np.ndarray) -> float:
+    def _calculate_complexity_score(self, features: ImageFeatureContext) -> float:
         """Calcular score de complexidade da imagem"""
         try:
-            gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-            
             # Fatores de complexidade
-            edge_density = np.sum(cv2.Canny(gray, 50, 150) > 0) / gray.size
-            color_variance = np.var(img_array)
-            texture_variance = np.var(cv2.Laplacian(gray, cv2.CV_64F))
+            edge_density = features.edge_density(50, 150)
+            color_variance = np.var(features.rgb)
+            texture_variance = features.sharpness
             
             # Score combinado (0-10)
             complexity = (edge_density * 3 + color_variance / 10000 + texture_variance / 1000) * 2
@@ -983,7 +955,7 @@ class ImageInputProcessor:
         """Analisar imagem gerada para métricas"""
         try:
             # Análise técnica básica
-            return self._extract_technical_features(image)
+            return await self.image_analyzer.run_cpu(self._extract_technical_features, image)
         except Exception as e:
             logger.error(f"Erro na análise da imagem gerada: {e}")
             return {}
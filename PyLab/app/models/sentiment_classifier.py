@@ -0,0 +1,179 @@
+"""
+💬 SENTIMENT CLASSIFIER - Modelo local destilado para classificação rápida
+
+Capacidades:
+- Classificação de sentimento em CPU (positivo/neutro/negativo)
+- Inferência em lote com agrupamento automático de chamadas concorrentes
+- Backend ONNX Runtime opcional (modelo exportado) ou PyTorch
+"""
+
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from ..utils.micro_batcher import MicroBatcher
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Rótulos do modelo (inglês) para o vocabulário dos prompts
+LABEL_MAP = {
+    "positive": "positivo",
+    "neutral": "neutro",
+    "negative": "negativo",
+}
+
+class LocalSentimentClassifier:
+    """
+    Classificador de sentimento local.
+
+    Usa um transformer destilado multilíngue (SENTIMENT_LOCAL_MODEL). Se
+    SENTIMENT_ONNX_PATH apontar para um diretório com ``model.onnx`` e o
+    tokenizer exportados, e onnxruntime estiver instalado, a inferência
+    roda no ONNX Runtime. Chamadas concorrentes são agrupadas em lotes
+    (MicroBatcher) e cada lote roda numa thread dedicada.
+    """
+
+    def __init__(self):
+        self.model_name = os.getenv(
+            "SENTIMENT_LOCAL_MODEL", "lxyuan/distilbert-base-multilingual-cased-sentiments-student"
+        )
+        self.onnx_path = os.getenv("SENTIMENT_ONNX_PATH")
+        self.max_length = int(os.getenv("SENTIMENT_MAX_LENGTH", "256"))
+        self.num_threads = int(os.getenv("SENTIMENT_NUM_THREADS", "4"))
+
+        self.tokenizer = None
+        self.model = None
+        self.session = None
+        self.labels: List[str] = []
+        self.backend: Optional[str] = None
+        self._load_failed = False
+
+        # Uma thread: lotes em sequência, o runtime paraleliza cada lote internamente
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pylab-sentiment")
+        self._batcher = MicroBatcher(
+            self._classify_batch,
+            max_batch_size=int(os.getenv("SENTIMENT_BATCH_SIZE", "32")),
+            max_wait=float(os.getenv("SENTIMENT_BATCH_WAIT_MS", "10")) / 1000
+        )
+        self._load_lock = asyncio.Lock()
+
+    @property
+    def available(self) -> bool:
+        """False se o modelo falhou ao carregar (o roteador usa o LLM)"""
+        return not self._load_failed
+
+    async def classify(self, text: str) -> Dict[str, Any]:
+        """
+        Classificar o sentimento de um texto
+
+        Args:
+            text: Texto a classificar
+
+        Returns:
+            Dict com label (positivo/neutro/negativo), confidence e scores por rótulo
+        """
+        await self._ensure_loaded()
+        return await self._batcher.submit(text)
+
+    async def classify_many(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """Classificar vários textos (em lotes)"""
+        await self._ensure_loaded()
+        return await self._batcher.submit_many(texts)
+
+    # === MÉTODOS PRIVADOS ===
+
+    async def _ensure_loaded(self):
+        if self.backend is not None:
+            return
+        if self._load_failed:
+            raise RuntimeError("Modelo local de sentimento indisponível")
+        async with self._load_lock:
+            if self.backend is None and not self._load_failed:
+                loop = asyncio.get_running_loop()
+                try:
+                    await loop.run_in_executor(self._executor, self._load_model)
+                except Exception as e:
+                    self._load_failed = True
+                    logger.error(f"Erro ao carregar modelo local de sentimento: {e}")
+                    raise
+
+    def _load_model(self):
+        """Carrega o modelo (ONNX se configurado e disponível, senão PyTorch)"""
+        from transformers import AutoConfig, AutoTokenizer
+
+        if self.onnx_path:
+            try:
+                import onnxruntime as ort
+
+                self.tokenizer = AutoTokenizer.from_pretrained(self.onnx_path)
+                config = AutoConfig.from_pretrained(self.onnx_path)
+                # Threads da própria sessão: não altera os demais modelos do processo
+                options = ort.SessionOptions()
+                options.intra_op_num_threads = self.num_threads
+                options.inter_op_num_threads = 1
+                self.session = ort.InferenceSession(
+                    os.path.join(self.onnx_path, "model.onnx"),
+                    sess_options=options,
+                    providers=["CPUExecutionProvider"]
+                )
+                self.labels = [config.id2label[i] for i in range(len(config.id2label))]
+                self.backend = "onnx"
+                logger.info(f"✅ Modelo de sentimento ONNX carregado: {self.onnx_path}")
+                return
+            except ImportError:
+                logger.warning("onnxruntime não instalado, usando PyTorch")
+
+        # PyTorch: o número de threads é global do processo (CLIP, Whisper...),
+        # então fica com o padrão do runtime em vez de ser alterado aqui
+        from transformers import AutoModelForSequenceClassification
+
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        self.model = AutoModelForSequenceClassification.from_pretrained(self.model_name)
+        self.model.eval()
+        self.labels = [self.model.config.id2label[i] for i in range(self.model.config.num_labels)]
+        self.backend = "torch"
+        logger.info(f"✅ Modelo de sentimento carregado: {self.model_name}")
+
+    async def _classify_batch(self, texts: List[str]) -> List[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._infer, texts)
+
+    def _infer(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """Tokenização e inferência de um lote inteiro (padding até o maior texto do lote)"""
+        import numpy as np
+
+        if self.backend == "onnx":
+            encoded = self.tokenizer(
+                texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+            )
+            input_names = {i.name for i in self.session.get_inputs()}
+            logits = self.session.run(None, {k: v for k, v in encoded.items() if k in input_names})[0]
+        else:
+            import torch
+
+            encoded = self.tokenizer(
+                texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="pt"
+            )
+            with torch.inference_mode():
+                logits = self.model(**encoded).logits.numpy()
+
+        # Softmax estável
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        probabilities = exp / exp.sum(axis=1, keepdims=True)
+
+        results = []
+        for row in probabilities:
+            scores = {LABEL_MAP.get(label.lower(), label.lower()): float(p) for label, p in zip(self.labels, row)}
+            best = int(row.argmax())
+            results.append({
+                "label": LABEL_MAP.get(self.labels[best].lower(), self.labels[best].lower()),
+                "confidence": float(row[best]),
+                "scores": scores
+            })
+        return results
+
+# Instância global
+sentiment_classifier = LocalSentimentClassifier()
@@ -30,7 +30,10 @@ import wave
 import webrtcvad
 from pydub import AudioSegment
 from pydub.silence import split_on_silence
-import openai
+
+from ..utils.llm_gateway import llm_gateway
+from ..utils.metrics import current_usage, instrument
+from ..utils.prompt_builder import prepare_input
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -93,7 +96,7 @@ class SpeechProcessor:
         self.vad = webrtcvad.Vad(2)  # Agressividade média
         
         # Cliente OpenAI para análises avançadas
-        self.openai_client = openai.AsyncOpenAI()
+        self.llm = llm_gateway  # Cliente LLM compartilhado (pool, rate limit, retries)
 
     def _load_models(self):
         """Carrega os modelos necessários"""
@@ -110,17 +113,25 @@ class SpeechProcessor:
             logger.error(f"Erro ao carregar modelos: {e}")
             raise
 
-    async def analyze(self, request: SpeechAnalysisRequest) -> SpeechAnalysisResult:
-        """Analisa áudio usando Whisper e outros modelos"""
+    @instrument("speech", "analysis_type")
+    async def analyze(self, request: SpeechAnalysisRequest, audio_path: Optional[str] = None) -> SpeechAnalysisResult:
+        """
+        Analisa áudio usando Whisper e outros modelos
+        
+        Args:
+            request: Requisição de análise
+            audio_path: Arquivo local já resolvido pelo servidor (lido direto pelo Whisper,
+                tem prioridade sobre audio_data); nunca vem do corpo da requisição
+        """
         start_time = asyncio.get_event_loop().time()
         
         try:
-            # Carregar e preprocessar áudio
-            audio_path = await self._load_audio(request.audio_data)
+            # Carregar e preprocessar áudio (arquivo armazenado é lido direto, sem cópia temporária)
+            source_path = audio_path or await self._load_audio(request.audio_data)
             
             # Transcrição base
             transcription = await self._transcribe_audio(
-                audio_path, 
+                source_path, 
                 request.language,
                 request.analysis_type
             )
@@ -140,8 +151,9 @@ class SpeechProcessor:
                 request.business_domain
             )
             
-            # Limpeza
-            os.unlink(audio_path)
+            # Limpeza (apenas do temporário criado a partir do base64)
+            if not audio_path:
+                os.unlink(source_path)
             
             processing_time = asyncio.get_event_loop().time() - start_time
             
@@ -156,7 +168,9 @@ class SpeechProcessor:
                     "models_used": ["Whisper", "GPT-4"],
                     "device": self.device,
                     "language_detected": transcription[0].language if transcription else None,
-                    "duration": insights.get("audio_duration", 0)
+                    "duration": insights.get("audio_duration", 0),
+                    "tokens_used": current_usage().total_tokens,
+                    "prompt_trims": current_usage().prompt_trims
                 },
                 processing_time=processing_time
             )
@@ -243,18 +257,26 @@ class SpeechProcessor:
             "segment_count": len(transcription)
         }
         
+        # Texto enviado aos prompts: um segmento por linha, repetições removidas, dentro do orçamento
+        prompt_text = prepare_input(
+            "\n".join(seg.text for seg in transcription),
+            "gpt-4-turbo-preview",
+            label="transcript",
+            kind="transcript"
+        )
+        
         if analysis_type == SpeechAnalysisType.MEETING_ANALYSIS:
-            specialized = await self._analyze_meeting(full_text, transcription, context)
+            specialized = await self._analyze_meeting(prompt_text, transcription, context)
         elif analysis_type == SpeechAnalysisType.SALES_CALL_ANALYSIS:
-            specialized = await self._analyze_sales_call(full_text, transcription, context)
+            specialized = await self._analyze_sales_call(prompt_text, transcription, context)
         elif analysis_type == SpeechAnalysisType.CUSTOMER_FEEDBACK:
-            specialized = await self._analyze_customer_feedback(full_text, context)
+            specialized = await self._analyze_customer_feedback(prompt_text, context)
         elif analysis_type == SpeechAnalysisType.SENTIMENT_ANALYSIS:
-            specialized = await self._analyze_sentiment(full_text)
+            specialized = await self._analyze_sentiment(prompt_text)
         elif analysis_type == SpeechAnalysisType.EMOTION_DETECTION:
-            specialized = await self._detect_emotions(full_text, transcription)
+            specialized = await self._detect_emotions(prompt_text, transcription)
         elif analysis_type == SpeechAnalysisType.CONVERSATION_SUMMARY:
-            specialized = await self._summarize_conversation(full_text, context)
+            specialized = await self._summarize_conversation(prompt_text, context)
         else:
             specialized = {}
         
@@ -290,7 +312,7 @@ class SpeechProcessor:
             }}
             """
             
-            response = await self.openai_client.chat.completions.create(
+            response = await self.llm.chat_completion(
                 model="gpt-4-turbo-preview",
                 messages=[{"role": "user", "content": prompt}],
                 response_format={"type": "json_object"},
@@ -333,7 +355,7 @@ class SpeechProcessor:
             }}
             """
             
-            response = await self.openai_client.chat.completions.create(
+            response = await self.llm.chat_completion(
                 model="gpt-4-turbo-preview",
                 messages=[{"role": "user", "content": prompt}],
                 response_format={"type": "json_object"},
@@ -373,7 +395,7 @@ class SpeechProcessor:
             }}
             """
             
-            response = await self.openai_client.chat.completions.create(
+            response = await self.llm.chat_completion(
                 model="gpt-4-turbo-preview",
                 messages=[{"role": "user", "content": prompt}],
                 response_format={"type": "json_object"},
@@ -406,7 +428,7 @@ class SpeechProcessor:
             }}
             """
             
-            response = await self.openai_client.chat.completions.create(
+            response = await self.llm.chat_completion(
                 model="gpt-4-turbo-preview",
                 messages=[{"role": "user", "content": prompt}],
                 response_format={"type": "json_object"},
@@ -444,7 +466,7 @@ class SpeechProcessor:
                 }}
                 """
                 
-                response = await self.openai_client.chat.completions.create(
+                response = await self.llm.chat_completion(
                     model="gpt-4-turbo-preview",
                     messages=[{"role": "user", "content": prompt}],
                     response_format={"type": "json_object"},
@@ -493,7 +515,7 @@ class SpeechProcessor:
             }}
             """
             
-            response = await self.openai_client.chat.completions.create(
+            response = await self.llm.chat_completion(
                 model="gpt-4-turbo-preview",
                 messages=[{"role": "user", "content": prompt}],
                 response_format={"type": "json_object"},
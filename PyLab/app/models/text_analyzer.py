@@ -9,19 +9,39 @@ Capacidades:
 - Geração de relatórios executivos
 """
 
-import openai
 import asyncio
 import logging
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Any, Tuple
+from dataclasses import dataclass, replace
 from enum import Enum
 import json
+import os
 import re
+import time
+from collections import OrderedDict
 from datetime import datetime
 
+from ..utils.llm_gateway import llm_gateway
+from ..utils.metrics import current_usage, instrument, record_cache_lookup
+from ..utils.prompt_builder import compact_json, compact_text, prepare_input
+from ..utils.response_cache import ResponseCache, make_cache_key
+from ..utils.streaming import IncrementalJSONParser
+from ..utils.text_chunker import chunk_text
+from ..utils.tokenizer import count_message_tokens, count_tokens
+from .sentiment_classifier import sentiment_classifier
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Orçamento de saída de uma análise (também por tipo nas chamadas combinadas)
+ANALYSIS_MAX_TOKENS = 2000
+
+# Streaming: campos mais úteis para a interface chegam primeiro
+STREAM_FIELD_ORDER_HINT = """
+        
+        Responda com as chaves nesta ordem: "summary", "insights", "confidence_score", "recommendations".
+        """
+
 class AnalysisType(Enum):
     SENTIMENT = "sentiment"
     BUSINESS_INSIGHTS = "business_insights"
@@ -40,6 +60,15 @@ class TextAnalysisRequest:
     language: str = "pt-BR"
     business_domain: Optional[str] = None
 
+@dataclass
+class ConversationState:
+    """Estado incremental de uma conversa: análise atual e quantas mensagens ela cobre"""
+    message_count: int
+    prefix_hash: str
+    result_data: Dict[str, Any]
+    updates_since_full: int
+    updated_at: float
+
 @dataclass
 class TextAnalysisResult:
     analysis_type: AnalysisType
@@ -50,10 +79,52 @@ class TextAnalysisResult:
     metadata: Dict[str, Any]
     processing_time: float
 
+# Tipos que o classificador local resolve (sentimento); os demais sempre vão ao LLM
+LOCAL_ANALYSIS_TYPES = {AnalysisType.SENTIMENT, AnalysisType.CUSTOMER_FEEDBACK}
+
 class TextAnalyzer:
+    # Incrementar ao alterar os prompts: invalida respostas em cache
+    PROMPT_VERSION = "2"
+    
     def __init__(self):
-        self.client = openai.AsyncOpenAI()
+        self.llm = llm_gateway  # Cliente LLM compartilhado (pool, rate limit, retries)
         self.model = "gpt-4-turbo-preview"
+        self.embedding_model = os.getenv("TEXT_CACHE_EMBEDDING_MODEL", "text-embedding-3-small")
+        
+        # Documentos longos: map (partes em paralelo, modelo mais barato) + reduce hierárquico
+        self.map_model = os.getenv("TEXT_MAP_MODEL", "gpt-3.5-turbo-1106")
+        self.long_document_tokens = int(os.getenv("TEXT_LONG_DOCUMENT_TOKENS", "12000"))
+        self.chunk_tokens = int(os.getenv("TEXT_CHUNK_TOKENS", "3000"))
+        self.reduce_input_tokens = int(os.getenv("TEXT_REDUCE_INPUT_TOKENS", "6000"))
+        
+        # Caminho rápido: classificador local para textos curtos, LLM só quando a confiança é baixa
+        self.local_classifier = sentiment_classifier
+        self.local_routing = os.getenv("TEXT_LOCAL_ROUTING", "true").lower() == "true"
+        self.local_confidence_threshold = float(os.getenv("TEXT_LOCAL_CONFIDENCE", "0.85"))
+        self.local_max_tokens = int(os.getenv("TEXT_LOCAL_MAX_TOKENS", "512"))
+        
+        # Conversas: análise incremental das novas mensagens sobre o estado anterior,
+        # com uma passada completa a cada N atualizações
+        self.conversation_full_refresh = int(os.getenv("TEXT_CONVERSATION_FULL_REFRESH", "10"))
+        self.conversation_max_states = int(os.getenv("TEXT_CONVERSATION_MAX_STATES", "1000"))
+        self.conversation_ttl = float(os.getenv("TEXT_CONVERSATION_TTL", "86400"))
+        self._conversations: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self._conversation_locks: Dict[str, asyncio.Lock] = {}
+        
+        # Cache de respostas (exato; camada por similaridade opcional via TEXT_CACHE_SEMANTIC)
+        semantic = os.getenv("TEXT_CACHE_SEMANTIC", "false").lower() == "true"
+        self.response_cache = ResponseCache(
+            max_entries=int(os.getenv("TEXT_CACHE_SIZE", "1024")),
+            ttl=float(os.getenv("TEXT_CACHE_TTL", "3600")),
+            embed=self._embed_text if semantic else None,
+            similarity_threshold=float(os.getenv("TEXT_CACHE_SIMILARITY", "0.97"))
+        )
+        
+        # Várias análises por chamada, até o limite de saída do modelo
+        self.multi_max_tokens = int(os.getenv("TEXT_MULTI_MAX_TOKENS", "4096"))
+        
+        # Orçamento do contexto extra enviado junto com o texto
+        self.context_max_tokens = int(os.getenv("TEXT_CONTEXT_MAX_TOKENS", "1000"))
         
         # Prompts especializados para cada tipo de análise
         self.prompts = {
@@ -66,7 +137,10 @@ class TextAnalyzer:
             AnalysisType.CUSTOMER_FEEDBACK: self._get_customer_feedback_prompt(),
             AnalysisType.FINANCIAL_ANALYSIS: self._get_financial_analysis_prompt(),
         }
+        # Indentação dos templates é só custo em tokens
+        self.prompts = {analysis_type: compact_text(prompt) for analysis_type, prompt in self.prompts.items()}
 
+    @instrument("text", "analysis_type")
     async def analyze(self, request: TextAnalysisRequest) -> TextAnalysisResult:
         """Analisa texto usando GPT-4 especializado"""
         start_time = asyncio.get_event_loop().time()
@@ -74,56 +148,594 @@ class TextAnalyzer:
         try:
             # Preparar prompt especializado
             system_prompt = self.prompts[request.analysis_type]
-            user_prompt = self._prepare_user_prompt(request)
             
-            # Chamar GPT-4
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.3,  # Mais determinístico para análises
-                max_tokens=2000,
-                response_format={"type": "json_object"}
-            )
+            # Consultar cache (chave: versão do prompt + modelo + prompt de sistema + texto completo normalizado)
+            cache_key = self._cache_key(request, system_prompt)
+            cache_scope = self._cache_scope(request, system_prompt)
+            result_data, cache_match, run_info = await self._cached_analysis(request, cache_key, cache_scope)
+            tokens_used = 0
+            
+            if result_data is None:
+                result_data, tokens_used, run_info = await self._run_analysis(request, system_prompt)
+                await self._cache_put(request, cache_key, cache_scope, result_data, run_info)
             
-            # Processar resposta
-            result_data = json.loads(response.choices[0].message.content)
             processing_time = asyncio.get_event_loop().time() - start_time
             
-            return TextAnalysisResult(
-                analysis_type=request.analysis_type,
-                insights=result_data.get("insights", {}),
-                summary=result_data.get("summary", ""),
-                confidence_score=result_data.get("confidence_score", 0.0),
-                recommendations=result_data.get("recommendations", []),
-                metadata={
-                    "model_used": self.model,
-                    "language": request.language,
-                    "business_domain": request.business_domain,
-                    "tokens_used": response.usage.total_tokens if response.usage else 0
-                },
-                processing_time=processing_time
-            )
+            return self._build_result(request, result_data, tokens_used, cache_match, run_info, processing_time)
             
         except Exception as e:
             logger.error(f"Erro na análise de texto: {e}")
             raise
 
-    def _prepare_user_prompt(self, request: TextAnalysisRequest) -> str:
-        """Prepara prompt do usuário com contexto"""
-        prompt = f"""
-        Texto para análise:
-        {request.text}
-        
-        Contexto adicional:
-        - Idioma: {request.language}
-        - Domínio de negócio: {request.business_domain or 'Geral'}
+    @instrument("text.multi")
+    async def analyze_multi(
+        self,
+        request: TextAnalysisRequest,
+        analysis_types: List[AnalysisType]
+    ) -> List[TextAnalysisResult]:
+        """
+        Executar várias análises do mesmo texto em uma única chamada
+        
+        Os tipos já em cache são reaproveitados; os demais são pedidos
+        juntos com um schema combinado (uma chave por tipo), de modo que o
+        documento é enviado uma vez só. Cada resultado também é gravado no
+        cache do seu tipo, servindo aos endpoints individuais.
+        
+        Args:
+            request: Texto e contexto (analysis_type é ignorado)
+            analysis_types: Tipos de análise desejados
+            
+        Returns:
+            Um TextAnalysisResult por tipo, na ordem pedida
+        """
+        start_time = asyncio.get_event_loop().time()
+        analysis_types = list(dict.fromkeys(analysis_types))
+        
+        try:
+            results_data: Dict[AnalysisType, Dict[str, Any]] = {}
+            cache_matches: Dict[AnalysisType, Optional[str]] = {}
+            cache_infos: Dict[AnalysisType, Dict[str, Any]] = {}
+            pending: List[AnalysisType] = []
+            
+            for analysis_type in analysis_types:
+                system_prompt = self.prompts[analysis_type]
+                cached, cache_match, cache_info = await self._cached_analysis(
+                    replace(request, analysis_type=analysis_type),
+                    self._cache_key(request, system_prompt),
+                    self._cache_scope(request, system_prompt)
+                )
+                if cached is not None:
+                    results_data[analysis_type] = cached
+                    cache_matches[analysis_type] = cache_match
+                    cache_infos[analysis_type] = cache_info
+                else:
+                    pending.append(analysis_type)
+            
+            runs = await self._run_multi(request, pending) if pending else {}
+            
+            for analysis_type in pending:
+                system_prompt = self.prompts[analysis_type]
+                results_data[analysis_type], _, run_info = runs[analysis_type]
+                if results_data[analysis_type]:
+                    await self._cache_put(
+                        replace(request, analysis_type=analysis_type),
+                        self._cache_key(request, system_prompt),
+                        self._cache_scope(request, system_prompt),
+                        results_data[analysis_type],
+                        run_info
+                    )
+            
+            processing_time = asyncio.get_event_loop().time() - start_time
+            
+            return [
+                self._build_result(
+                    replace(request, analysis_type=analysis_type),
+                    results_data[analysis_type],
+                    runs[analysis_type][1] if analysis_type in pending else 0,
+                    cache_matches.get(analysis_type),
+                    runs[analysis_type][2] if analysis_type in pending else cache_infos[analysis_type],
+                    processing_time
+                )
+                for analysis_type in analysis_types
+            ]
+            
+        except Exception as e:
+            logger.error(f"Erro na análise múltipla de texto: {e}")
+            raise
+
+    @instrument("text", "analysis_type")
+    async def analyze_stream(self, request: TextAnalysisRequest) -> AsyncIterator[Dict[str, Any]]:
         """
+        Versão streaming de ``analyze``
+
+        Produz eventos à medida que a resposta chega: trechos do summary
+        ("delta"), cada campo concluído ("field") e, no fim, o resultado
+        estruturado completo ("result"). Cache hits e documentos longos
+        (map-reduce) emitem apenas o resultado final.
+        """
+        start_time = asyncio.get_event_loop().time()
+
+        system_prompt = self.prompts[request.analysis_type]
+        cache_key = self._cache_key(request, system_prompt)
+        cache_scope = self._cache_scope(request, system_prompt)
+
+        if count_tokens(request.text, self.model) > self.long_document_tokens:
+            # Map-reduce não tem saída incremental útil
+            yield {"type": "result", "result": await self.analyze(request)}
+            return
+
+        cached, cache_match, cache_info = await self._cached_analysis(request, cache_key, cache_scope)
+        if cached is not None:
+            yield {
+                "type": "result",
+                "result": self._build_result(
+                    request, cached, 0, cache_match, cache_info,
+                    asyncio.get_event_loop().time() - start_time
+                )
+            }
+            return
+
+        local_data, local_info = await self._try_local(request)
+        if local_data is not None:
+            await self._cache_put(request, cache_key, cache_scope, local_data, local_info)
+            yield {
+                "type": "result",
+                "result": self._build_result(
+                    request, local_data, 0, None, local_info,
+                    asyncio.get_event_loop().time() - start_time
+                )
+            }
+            return
+
+        parser = IncrementalJSONParser()
+        messages = [
+            {"role": "system", "content": system_prompt + STREAM_FIELD_ORDER_HINT},
+            {"role": "user", "content": self._prepare_user_prompt(request)}
+        ]
+        try:
+            async for delta in self.llm.chat_completion_stream(
+                model=self.model,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=ANALYSIS_MAX_TOKENS,
+                response_format={"type": "json_object"}
+            ):
+                for event in parser.feed(delta):
+                    yield event
+        except Exception as e:
+            logger.error(f"Erro na análise de texto (streaming): {e}")
+            raise
+
+        # Só uma resposta completa e válida vai para o cache; JSON truncado
+        # (ex.: limite de max_tokens) entrega os campos concluídos sem cachear
+        try:
+            result_data = json.loads(parser.buffer)
+        except json.JSONDecodeError:
+            result_data = None
+        if isinstance(result_data, dict):
+            await self.response_cache.put(cache_key, result_data, cache_scope, request.text)
+        else:
+            logger.warning("Resposta em streaming incompleta, resultado parcial não cacheado")
+            result_data = parser.result()
+
+        # Streams não trazem usage: estimativa pelo tokenizer
+        tokens_used = count_message_tokens(messages, self.model) + count_tokens(parser.buffer, self.model)
+        yield {
+            "type": "result",
+            "result": self._build_result(
+                request, result_data, tokens_used, None, {"streamed": True},
+                asyncio.get_event_loop().time() - start_time
+            )
+        }
+
+    def _build_result(
+        self,
+        request: TextAnalysisRequest,
+        result_data: Dict[str, Any],
+        tokens_used: int,
+        cache_match: Optional[str],
+        run_info: Dict[str, Any],
+        processing_time: float
+    ) -> TextAnalysisResult:
+        """Montar o TextAnalysisResult a partir do JSON do modelo"""
+        usage = current_usage()
+        if usage is not None and usage.prompt_trims:
+            run_info = {**run_info, "prompt_trims": usage.prompt_trims}
+        return TextAnalysisResult(
+            analysis_type=request.analysis_type,
+            insights=result_data.get("insights", {}),
+            summary=result_data.get("summary", ""),
+            confidence_score=result_data.get("confidence_score", 0.0),
+            recommendations=result_data.get("recommendations", []),
+            metadata={
+                "model_used": self.model,
+                "language": request.language,
+                "business_domain": request.business_domain,
+                "tokens_used": tokens_used,
+                "cache_hit": cache_match is not None,
+                "cache_match": cache_match,
+                **run_info
+            },
+            processing_time=processing_time
+        )
+
+    async def _run_analysis(
+        self,
+        request: TextAnalysisRequest,
+        system_prompt: str,
+        max_tokens: int = ANALYSIS_MAX_TOKENS,
+        allow_local: bool = True
+    ) -> Tuple[Dict[str, Any], int, Dict[str, Any]]:
+        """Executar a análise: modelo local, chamada única ou map-reduce para documentos longos"""
+        local_data, local_info = await self._try_local(request) if allow_local else (None, {})
+        if local_data is not None:
+            return local_data, 0, local_info
+        
+        if count_tokens(request.text, self.model) > self.long_document_tokens:
+            # Cada parte vai inteira no seu prompt: o texto completo não passa pelo corte do orçamento
+            return await self._map_reduce(request, system_prompt, max_tokens)
+        
+        # Chamar GPT-4
+        result_data, tokens_used = await self._complete_json(
+            self.model, system_prompt, self._prepare_user_prompt(request), max_tokens=max_tokens
+        )
+        return result_data, tokens_used, local_info
+
+    async def _run_multi(
+        self,
+        request: TextAnalysisRequest,
+        analysis_types: List[AnalysisType]
+    ) -> Dict[AnalysisType, Tuple[Dict[str, Any], int, Dict[str, Any]]]:
+        """
+        Executar vários tipos de análise em chamadas combinadas
+        
+        Cada tipo mantém o orçamento de saída da análise individual; os
+        tipos são agrupados até o limite de saída do modelo e os grupos
+        rodam em paralelo. Chaves ausentes ou vazias na resposta combinada
+        são refeitas com a análise individual do tipo.
+        
+        Returns:
+            (dados, tokens, metadata) de cada tipo
+        """
+        per_call = max(1, self.multi_max_tokens // ANALYSIS_MAX_TOKENS)
+        groups = [analysis_types[i:i + per_call] for i in range(0, len(analysis_types), per_call)]
+        
+        async def run_group(group: List[AnalysisType]):
+            if len(group) == 1:
+                return {group[0]: await self._run_analysis(
+                    replace(request, analysis_type=group[0]), self.prompts[group[0]]
+                )}
+            
+            combined, tokens_used, run_info = await self._run_analysis(
+                request,
+                self._get_multi_prompt(group),
+                max_tokens=ANALYSIS_MAX_TOKENS * len(group),
+                allow_local=False
+            )
+            shared_info = {**run_info, "multi_analysis": [t.value for t in group]}
+            # Tokens da chamada compartilhada divididos entre os tipos
+            share = tokens_used // len(group)
+            
+            runs = {}
+            missing = []
+            for analysis_type in group:
+                data = combined.get(analysis_type.value)
+                if isinstance(data, dict) and data:
+                    runs[analysis_type] = (data, share, shared_info)
+                else:
+                    missing.append(analysis_type)
+            
+            if missing:
+                logger.warning(
+                    f"Resposta combinada sem {[t.value for t in missing]}, refazendo individualmente"
+                )
+                retries = await asyncio.gather(*(
+                    self._run_analysis(replace(request, analysis_type=t), self.prompts[t]) for t in missing
+                ))
+                for analysis_type, (data, tokens, info) in zip(missing, retries):
+                    runs[analysis_type] = (data, share + tokens, {**info, "multi_fallback": True})
+            return runs
+        
+        runs = {}
+        for group_runs in await asyncio.gather(*(run_group(group) for group in groups)):
+            runs.update(group_runs)
+        return runs
+
+    async def _try_local(self, request: TextAnalysisRequest) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Roteador do caminho local
+        
+        Textos curtos de sentimento/feedback vão primeiro ao classificador
+        local; o resultado só é aceito com confiança acima do limiar. Caso
+        contrário a análise é escalada para o LLM (registrado em metadata).
+        
+        Returns:
+            Tupla (dados no schema do prompt ou None, informações do roteamento)
+        """
+        if not self._local_eligible(request):
+            return None, {}
+        
+        try:
+            prediction = await self.local_classifier.classify(request.text)
+        except Exception as e:
+            logger.warning(f"Classificador local indisponível, usando LLM: {e}")
+            return None, {}
+        
+        if prediction["confidence"] < self.local_confidence_threshold:
+            return None, {"escalated": True, "local_confidence": prediction["confidence"]}
+        
+        return self._local_result(request.analysis_type, prediction), self._local_info()
+
+    def _local_eligible(self, request: TextAnalysisRequest) -> bool:
+        """Texto curto de sentimento/feedback com o classificador local disponível"""
+        return (
+            self.local_routing
+            and request.analysis_type in LOCAL_ANALYSIS_TYPES
+            and self.local_classifier.available
+            and count_tokens(request.text, self.model) <= self.local_max_tokens
+        )
+
+    def _local_info(self) -> Dict[str, Any]:
+        return {"model_used": self.local_classifier.model_name, "local_model": True}
+
+    def _local_result(self, analysis_type: AnalysisType, prediction: Dict[str, Any]) -> Dict[str, Any]:
+        """Converter a predição local para o schema JSON do tipo de análise"""
+        label = prediction["label"]
+        confidence = prediction["confidence"]
+        
+        if analysis_type == AnalysisType.CUSTOMER_FEEDBACK:
+            satisfaction, nps, churn = {
+                "positivo": ("alta", "promotor", "baixo"),
+                "neutro": ("média", "neutro", "médio"),
+                "negativo": ("baixa", "detrator", "alto"),
+            }.get(label, ("média", "neutro", "médio"))
+            # O classificador só dá a polaridade: listas do schema ficam vazias
+            insights = {
+                "satisfaction_level": satisfaction,
+                "common_complaints": [],
+                "praised_features": [],
+                "improvement_requests": [],
+                "churn_risk": churn,
+                "loyalty_indicators": [],
+                "nps_sentiment": nps,
+                "sentiment_scores": prediction["scores"]
+            }
+            summary = f"Feedback {label} (classificação local, confiança {confidence:.0%})"
+        else:
+            insights = {
+                "sentiment_overall": label,
+                # Escala do prompt: 0 = negativo, 1 = positivo
+                "sentiment_score": round(
+                    prediction["scores"].get("positivo", 0.0) + 0.5 * prediction["scores"].get("neutro", 0.0), 4
+                ),
+                "emotions_detected": [],
+                "key_themes": [],
+                "urgency_level": None,
+                "sentiment_scores": prediction["scores"]
+            }
+            summary = f"Sentimento {label} (classificação local, confiança {confidence:.0%})"
+        
+        return {
+            "insights": insights,
+            "summary": summary,
+            "confidence_score": confidence,
+            "recommendations": []
+        }
+
+    async def _complete_json(
+        self,
+        model: str,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int
+    ) -> Tuple[Dict[str, Any], int]:
+        """Chamada com resposta JSON; retorna (dados, tokens usados)"""
+        response = await self.llm.chat_completion(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.3,  # Mais determinístico para análises
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"}
+        )
+        
+        result_data = json.loads(response.choices[0].message.content)
+        tokens_used = response.usage.total_tokens if response.usage else 0
+        return result_data, tokens_used
+
+    async def _map_reduce(
+        self,
+        request: TextAnalysisRequest,
+        system_prompt: str,
+        max_tokens: int = ANALYSIS_MAX_TOKENS
+    ) -> Tuple[Dict[str, Any], int, Dict[str, Any]]:
+        """
+        Analisar documento longo em partes
+        
+        Map: cada parte (dividida por seções/parágrafos) é analisada em
+        paralelo com o modelo mais barato, no mesmo schema JSON.
+        Reduce: análises parciais são combinadas em grupos que cabem no
+        contexto, nível a nível, até restar uma; o último nível usa o
+        modelo principal.
+        """
+        chunks = chunk_text(request.text, self.chunk_tokens, self.map_model)
+        total = len(chunks)
+        logger.info(f"Documento longo: {total} partes para análise map-reduce")
+        
+        # Map
+        mapped = await asyncio.gather(*[
+            self._complete_json(
+                self.map_model,
+                system_prompt,
+                self._prepare_user_prompt(replace(request, text=chunk))
+                + f"\n- Esta é a parte {index + 1} de {total} de um documento maior",
+                max_tokens=max_tokens // 2
+            )
+            for index, chunk in enumerate(chunks)
+        ])
+        partials = [data for data, _ in mapped]
+        tokens_used = sum(tokens for _, tokens in mapped)
+        
+        # Reduce hierárquico
+        levels = 0
+        reduce_system = self._get_reduce_prompt(system_prompt)
+        while len(partials) > 1:
+            groups = self._group_for_reduce(partials)
+            model = self.model if len(groups) == 1 else self.map_model
+            reduced = await asyncio.gather(*[
+                self._complete_json(
+                    model,
+                    reduce_system,
+                    "Análises parciais (na ordem do documento):\n"
+                    + json.dumps(group, ensure_ascii=False, separators=(",", ":")),
+                    max_tokens=max_tokens
+                )
+                for group in groups
+            ])
+            partials = [data for data, _ in reduced]
+            tokens_used += sum(tokens for _, tokens in reduced)
+            levels += 1
+        
+        return partials[0], tokens_used, {
+            "chunks": total,
+            "map_model": self.map_model,
+            "reduce_levels": levels
+        }
+
+    def _group_for_reduce(self, partials: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Agrupar análises parciais respeitando o orçamento de entrada do reduce"""
+        groups: List[List[Dict[str, Any]]] = []
+        current: List[Dict[str, Any]] = []
+        current_tokens = 0
+        
+        for partial in partials:
+            partial_tokens = count_tokens(
+                json.dumps(partial, ensure_ascii=False, separators=(",", ":")), self.model
+            )
+            # Pelo menos duas parciais por grupo para garantir que o reduce converge
+            if len(current) >= 2 and current_tokens + partial_tokens > self.reduce_input_tokens:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(partial)
+            current_tokens += partial_tokens
+        
+        if current:
+            if len(current) == 1 and groups:
+                groups[-1].append(current[0])
+            else:
+                groups.append(current)
+        return groups
+
+    def _get_reduce_prompt(self, system_prompt: str) -> str:
+        return f"""
+        Você recebe análises parciais em JSON de partes consecutivas de um mesmo documento.
+        
+        Combine-as em uma única análise do documento inteiro, no mesmo formato JSON abaixo:
+        - Una listas removendo duplicatas e mantendo os itens mais relevantes
+        - Em campos categóricos, escolha o valor que representa o documento como um todo
+        - O summary deve cobrir o documento inteiro, não cada parte
+        - confidence_score deve refletir a consistência entre as partes
+        
+        Formato esperado:
+        {system_prompt}
+        """
+
+    def _get_multi_prompt(self, analysis_types: List[AnalysisType]) -> str:
+        """Prompt combinado: uma chave no JSON de resposta para cada tipo de análise"""
+        keys = ", ".join(f'"{t.value}": {{...}}' for t in analysis_types)
+        sections = "\n".join(
+            f'        Análise "{t.value}":{self.prompts[t]}' for t in analysis_types
+        )
+        return f"""
+        Você fará várias análises independentes do mesmo texto de uma só vez.
+        
+        Retorne um único JSON com uma chave por análise:
+        {{{keys}}}
+        
+        O valor de cada chave segue o formato e as instruções da análise correspondente:
+{sections}
+        """
+
+    async def _cache_get(self, key: str, scope: str, text: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Consulta ao cache com registro de hit/miss nas métricas"""
+        value, match = await self.response_cache.get(key, scope, text)
+        record_cache_lookup(match)
+        return value, match
+
+    async def _cached_analysis(
+        self,
+        request: TextAnalysisRequest,
+        cache_key: str,
+        cache_scope: str
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str], Dict[str, Any]]:
+        """
+        Consultar o cache do LLM e, para textos do caminho local, o do classificador
+        
+        Returns:
+            Tupla (dados ou None, tipo de match, informações do roteamento)
+        """
+        value, match = await self._cache_get(cache_key, cache_scope, request.text)
+        if value is None and self._local_eligible(request):
+            local_key, local_scope = self._local_cache_entry(cache_key, cache_scope)
+            value, match = await self._cache_get(local_key, local_scope, request.text)
+            if value is not None:
+                return value, match, self._local_info()
+        return value, match, {}
+
+    async def _cache_put(
+        self,
+        request: TextAnalysisRequest,
+        cache_key: str,
+        cache_scope: str,
+        result_data: Dict[str, Any],
+        run_info: Dict[str, Any]
+    ):
+        """Gravar no cache; resultados do classificador local vão para chave e escopo próprios"""
+        if run_info.get("local_model"):
+            cache_key, cache_scope = self._local_cache_entry(cache_key, cache_scope)
+        await self.response_cache.put(cache_key, result_data, cache_scope, request.text)
+
+    def _local_cache_entry(self, cache_key: str, cache_scope: str) -> Tuple[str, str]:
+        # Resultado reduzido do classificador não pode responder por uma análise do LLM
+        model_name = self.local_classifier.model_name
+        return make_cache_key(cache_key, model_name), make_cache_key(cache_scope, model_name)
+
+    def _cache_key(self, request: TextAnalysisRequest, system_prompt: str) -> str:
+        """Chave exata: escopo + texto completo (o user prompt pode ter sido cortado pelo orçamento)"""
+        return make_cache_key(self._cache_scope(request, system_prompt), request.text)
+
+    def _cache_scope(self, request: TextAnalysisRequest, system_prompt: str) -> str:
+        """Escopo da busca por similaridade: tudo do prompt exceto o texto analisado"""
+        return make_cache_key(
+            self.PROMPT_VERSION,
+            self.model,
+            system_prompt,
+            request.language,
+            request.business_domain or "",
+            json.dumps(request.context, sort_keys=True) if request.context else ""
+        )
+
+    async def _embed_text(self, text: str) -> List[float]:
+        """Embedding para a camada semântica do cache"""
+        return await self.llm.embedding(self.embedding_model, text)
+
+    def _prepare_user_prompt(self, request: TextAnalysisRequest) -> str:
+        """Prepara prompt do usuário com contexto (compactado e dentro do orçamento de tokens)"""
+        text = prepare_input(request.text, self.model, label="text")
+        prompt = f"""Texto para análise:
+{text}
+
+Contexto adicional:
+- Idioma: {request.language}
+- Domínio de negócio: {request.business_domain or 'Geral'}"""
         
         if request.context:
-            prompt += f"\n- Contexto específico: {json.dumps(request.context, indent=2)}"
+            context = prepare_input(
+                compact_json(request.context), self.model, self.context_max_tokens, label="context"
+            )
+            prompt += f"\n- Contexto específico: {context}"
             
         return prompt
 
@@ -297,22 +909,162 @@ class TextAnalyzer:
         }
         """
 
-    async def batch_analyze(self, requests: List[TextAnalysisRequest]) -> List[TextAnalysisResult]:
-        """Análise em lote para maior eficiência"""
+    async def batch_analyze(
+        self,
+        requests: List[TextAnalysisRequest],
+        return_exceptions: bool = False
+    ) -> List[TextAnalysisResult]:
+        """Análise em lote para maior eficiência (com return_exceptions, falhas vêm por item)"""
         tasks = [self.analyze(request) for request in requests]
-        return await asyncio.gather(*tasks)
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
 
-    async def analyze_conversation(self, messages: List[Dict[str, str]]) -> TextAnalysisResult:
-        """Analisa uma conversa completa"""
-        conversation_text = "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
+    @instrument("text.conversation")
+    async def analyze_conversation(
+        self,
+        messages: List[Dict[str, str]],
+        conversation_id: Optional[str] = None
+    ) -> TextAnalysisResult:
+        """
+        Analisa uma conversa
+        
+        Sem ``conversation_id`` a conversa inteira é analisada. Com ele, o
+        estado da última análise é mantido e cada chamada envia ao modelo
+        apenas as mensagens novas junto com a análise anterior - o custo
+        por atualização não cresce com o tamanho da conversa. Uma passada
+        completa é feita a cada TEXT_CONVERSATION_FULL_REFRESH atualizações,
+        ou quando o histórico enviado não continua o já analisado.
+        """
+        if conversation_id is None:
+            return await self.analyze(self._conversation_request(messages))
         
-        request = TextAnalysisRequest(
-            text=conversation_text,
+        lock = self._conversation_locks.setdefault(conversation_id, asyncio.Lock())
+        async with lock:
+            return await self._analyze_conversation_incremental(conversation_id, messages)
+
+    async def _analyze_conversation_incremental(
+        self,
+        conversation_id: str,
+        messages: List[Dict[str, str]]
+    ) -> TextAnalysisResult:
+        start_time = asyncio.get_event_loop().time()
+        state = self._get_conversation_state(conversation_id)
+        
+        can_update = (
+            state is not None
+            and len(messages) >= state.message_count
+            and state.updates_since_full < self.conversation_full_refresh
+            and self._messages_hash(messages[:state.message_count]) == state.prefix_hash
+        )
+        
+        if not can_update:
+            # Passada completa (primeira análise, refresh periódico ou histórico divergente)
+            result = await self.analyze(self._conversation_request(messages))
+            self._save_conversation_state(conversation_id, ConversationState(
+                message_count=len(messages),
+                prefix_hash=self._messages_hash(messages),
+                result_data={
+                    "insights": result.insights,
+                    "summary": result.summary,
+                    "confidence_score": result.confidence_score,
+                    "recommendations": result.recommendations
+                },
+                updates_since_full=0,
+                updated_at=time.time()
+            ))
+            result.metadata.update(conversation_id=conversation_id, incremental=False)
+            return result
+        
+        new_messages = messages[state.message_count:]
+        tokens_used = 0
+        if new_messages:
+            result_data, tokens_used = await self._complete_json(
+                self.model,
+                self._get_incremental_conversation_prompt(),
+                "Análise atual da conversa:\n"
+                + json.dumps(state.result_data, ensure_ascii=False, separators=(",", ":"))
+                + f"\n\nNovas mensagens ({len(new_messages)} de {len(messages)}):\n"
+                + self._format_messages(new_messages),
+                max_tokens=ANALYSIS_MAX_TOKENS
+            )
+            state = ConversationState(
+                message_count=len(messages),
+                prefix_hash=self._messages_hash(messages),
+                result_data=result_data,
+                updates_since_full=state.updates_since_full + 1,
+                updated_at=time.time()
+            )
+            self._save_conversation_state(conversation_id, state)
+        
+        return self._build_result(
+            self._conversation_request(messages),
+            state.result_data,
+            tokens_used,
+            None,
+            {
+                "conversation_id": conversation_id,
+                "incremental": True,
+                "new_messages": len(new_messages),
+                "updates_since_full": state.updates_since_full
+            },
+            asyncio.get_event_loop().time() - start_time
+        )
+
+    def _conversation_request(self, messages: List[Dict[str, str]]) -> TextAnalysisRequest:
+        return TextAnalysisRequest(
+            text=self._format_messages(messages),
             analysis_type=AnalysisType.BUSINESS_INSIGHTS,
             context={"type": "conversation", "message_count": len(messages)}
         )
+
+    @staticmethod
+    def _format_messages(messages: List[Dict[str, str]]) -> str:
+        return "\n".join([f"{msg['role']}: {msg['content']}" for msg in messages])
+
+    @staticmethod
+    def _messages_hash(messages: List[Dict[str, str]]) -> str:
+        return make_cache_key(*(f"{msg['role']}: {msg['content']}" for msg in messages))
+
+    def _get_conversation_state(self, conversation_id: str) -> Optional[ConversationState]:
+        state = self._conversations.get(conversation_id)
+        if state is None:
+            return None
+        if time.time() - state.updated_at > self.conversation_ttl:
+            self._drop_conversation(conversation_id)
+            return None
+        self._conversations.move_to_end(conversation_id)
+        return state
+
+    def _save_conversation_state(self, conversation_id: str, state: ConversationState):
+        self._conversations[conversation_id] = state
+        self._conversations.move_to_end(conversation_id)
+        # Ordem LRU: expirados e excedentes ficam no início
+        expires_before = time.time() - self.conversation_ttl
+        while self._conversations:
+            old_id, old_state = next(iter(self._conversations.items()))
+            if len(self._conversations) <= self.conversation_max_states and old_state.updated_at >= expires_before:
+                break
+            self._drop_conversation(old_id)
+
+    def _drop_conversation(self, conversation_id: str):
+        """Remover o estado de uma conversa e o seu lock, se não estiver em uso"""
+        self._conversations.pop(conversation_id, None)
+        lock = self._conversation_locks.get(conversation_id)
+        if lock is not None and not lock.locked():
+            del self._conversation_locks[conversation_id]
+
+    def _get_incremental_conversation_prompt(self) -> str:
+        return f"""
+        Você mantém a análise contínua de uma conversa.
         
-        return await self.analyze(request)
+        Você recebe a análise atual (que cobre todas as mensagens anteriores) e as
+        mensagens novas. Atualize a análise para refletir a conversa inteira:
+        - Preserve o que continua válido e incorpore o que as novas mensagens trazem
+        - Remova itens que as novas mensagens tornaram obsoletos
+        - O summary deve descrever a conversa inteira, não só as mensagens novas
+        
+        Retorne a análise completa no mesmo formato JSON:
+        {self.prompts[AnalysisType.BUSINESS_INSIGHTS]}
+        """
 
 # Instância global
 text_analyzer = TextAnalyzer()
\ No newline at end of file
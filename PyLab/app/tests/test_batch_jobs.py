@@ -0,0 +1,121 @@
+import asyncio
+import json
+
+import pytest
+
+from PyLab.app.utils.batch_jobs import BatchJobManager
+from PyLab.app.utils.storage_backends import LocalFilesystemBackend
+
+
+async def _echo(payload):
+    return {"echo": payload["i"]}, {"tokens": 1, "cost": 0.001}
+
+
+async def _wait_for(predicate, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not await predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timeout"
+        await asyncio.sleep(0.01)
+
+
+def _jsonl(count):
+    return "\n".join(json.dumps({"i": i}) for i in range(count)).encode()
+
+
+@pytest.mark.asyncio
+async def test_completed_job_is_listed(tmp_path):
+    manager = BatchJobManager(LocalFilesystemBackend(str(tmp_path)), window_size=2)
+    manager.register("echo", _echo)
+    job = await manager.create_job("echo", _jsonl(3))
+
+    async def completed():
+        return (await manager.get_job(job["job_id"]))["status"] == "completed"
+    await _wait_for(completed)
+
+    jobs = await manager.list_jobs()
+    assert [j["job_id"] for j in jobs] == [job["job_id"]]
+    assert jobs[0]["succeeded"] == 3
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_interrupted_job_resumes_after_restart(tmp_path):
+    backend = LocalFilesystemBackend(str(tmp_path))
+    blocked = asyncio.Event()
+
+    async def stalls_after_first_window(payload):
+        if payload["i"] >= 2:
+            await blocked.wait()
+        return await _echo(payload)
+
+    manager = BatchJobManager(backend, window_size=2)
+    manager.register("echo", stalls_after_first_window)
+    job_id = (await manager.create_job("echo", _jsonl(5)))["job_id"]
+
+    async def first_window_saved():
+        return (await manager.get_job(job_id))["next_window"] == 1
+    await _wait_for(first_window_saved)
+
+    # Queda do processo: o estado fica "running" com o checkpoint da primeira janela
+    await manager.close()
+    assert (await manager.get_job(job_id))["status"] == "running"
+
+    restarted = BatchJobManager(backend, window_size=2)
+    restarted.register("echo", _echo)
+    assert await restarted.resume_jobs() == 1
+
+    async def completed():
+        return (await restarted.get_job(job_id))["status"] == "completed"
+    await _wait_for(completed)
+
+    state = await restarted.get_job(job_id)
+    assert (state["processed"], state["succeeded"], state["tokens_used"]) == (5, 5, 5)
+
+    results = b"".join([chunk async for chunk in restarted.stream_results(job_id)])
+    assert [json.loads(line)["result"]["echo"] for line in results.splitlines()] == [0, 1, 2, 3, 4]
+    assert await restarted.resume_jobs() == 0
+    await restarted.close()
+
+
+@pytest.mark.asyncio
+async def test_create_list_and_cancel(tmp_path):
+    blocked = asyncio.Event()
+
+    async def stalls_after_first_window(payload):
+        if payload["i"] >= 2:
+            await blocked.wait()
+        return await _echo(payload)
+
+    manager = BatchJobManager(LocalFilesystemBackend(str(tmp_path)), window_size=2)
+    manager.register("echo", stalls_after_first_window)
+
+    with pytest.raises(ValueError):
+        await manager.create_job("unknown", _jsonl(1))
+    with pytest.raises(ValueError):
+        await manager.create_job("echo", b"\n\n")
+
+    first = await manager.create_job("echo", _jsonl(5))
+    second = await manager.create_job("echo", _jsonl(1))
+    assert (first["status"], first["total"], first["windows"]) == ("queued", 5, 3)
+
+    async def first_window_saved():
+        return (await manager.get_job(first["job_id"]))["next_window"] == 1
+    await _wait_for(first_window_saved)
+
+    jobs = {job["job_id"]: job for job in await manager.list_jobs()}
+    assert set(jobs) == {first["job_id"], second["job_id"]}
+    assert jobs[first["job_id"]]["status"] == "running"
+
+    assert await manager.cancel_job(first["job_id"])
+    state = await manager.get_job(first["job_id"])
+    assert state["status"] == "cancelled" and state["finished_at"] is not None
+    # A janela concluída antes do cancelamento continua disponível
+    assert state["processed"] == 2
+    results = b"".join([chunk async for chunk in manager.stream_results(first["job_id"])])
+    assert len(results.splitlines()) == 2
+
+    # Cancelado não é cancelado de novo nem retomado
+    assert not await manager.cancel_job(first["job_id"])
+    assert not await manager.cancel_job("missing")
+    assert await manager.resume_jobs() == 0
+    await manager.close()
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from PyLab.app.utils import embedding_index as embedding_index_module
+from PyLab.app.utils.embedding_index import EmbeddingIndex
+
+
+def _vectors(count, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def _brute_force(vectors, keys, query, k):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ (query / np.linalg.norm(query))
+    return [keys[i] for i in np.argsort(-scores)[:k]]
+
+
+@pytest.mark.asyncio
+async def test_search_matches_brute_force_across_blocks(tmp_path, monkeypatch):
+    # Blocos pequenos e capacidade inicial baixa: exercita a união entre blocos e o crescimento do memmap
+    monkeypatch.setattr(embedding_index_module, "SCAN_BLOCK_ROWS", 7)
+    monkeypatch.setattr(embedding_index_module, "INITIAL_CAPACITY", 4)
+    index = EmbeddingIndex(tmp_path, dim=8)
+    vectors = _vectors(40)
+    keys = [f"img_{i}.png" for i in range(40)]
+    for key, vector in zip(keys, vectors):
+        await index.add(key, vector)
+
+    query = _vectors(1, seed=1)[0]
+    results = await index.search(query, k=5)
+    assert [key for key, _ in results] == _brute_force(vectors, keys, query, 5)
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+    # exclude e min_score
+    results = await index.search(vectors[3], k=3, exclude="img_3.png")
+    assert "img_3.png" not in [key for key, _ in results] and len(results) == 3
+    assert [key for key, _ in await index.search(vectors[3], k=3, min_score=0.999)] == ["img_3.png"]
+    await index.close()
+
+
+@pytest.mark.asyncio
+async def test_remove_and_replace_persist(tmp_path):
+    index = EmbeddingIndex(tmp_path, dim=8)
+    vectors = _vectors(3)
+    await index.add("a.png", vectors[0])
+    await index.add("b.png", vectors[1])
+    # Mesma chave: substitui o vetor, sem nova linha
+    await index.add("a.png", vectors[2])
+
+    assert await index.remove("b.png")
+    assert not await index.remove("b.png")
+    assert [key for key, _ in await index.search(vectors[1], k=5)] == ["a.png"]
+    await index.close()
+
+    reopened = EmbeddingIndex(tmp_path, dim=8)
+    assert len(reopened) == 1 and "b.png" not in reopened
+    stored = await reopened.get("a.png")
+    np.testing.assert_allclose(stored, vectors[2] / np.linalg.norm(vectors[2]), rtol=1e-6)
+    matrix, missing = await reopened.get_many(["a.png", "b.png"])
+    assert matrix.shape == (1, 8) and missing == ["b.png"]
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_dimension_mismatch_is_rejected(tmp_path):
+    index = EmbeddingIndex(tmp_path, dim=8)
+    with pytest.raises(ValueError):
+        await index.add("a.png", np.ones(4, dtype=np.float32))
+    await index.close()
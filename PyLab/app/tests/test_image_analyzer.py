@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("clip")
+pytest.importorskip("transformers")
+
+from PyLab.app.models.image_analyzer import ImageAnalysisRequest, ImageAnalysisType, ImageAnalyzer
+
+QUERIES = {
+    ImageAnalysisType.CONTENT_ANALYSIS: ["a photo", "a drawing", "a chart"],
+    ImageAnalysisType.QUALITY_ANALYSIS: ["a sharp image", "a blurry image"],
+}
+
+
+def _analyzer(monkeypatch, tmp_path, encoded):
+    """ImageAnalyzer sem carregar modelos: só o necessário para as queries CLIP"""
+    monkeypatch.setenv("CACHE_PATH", str(tmp_path))
+    analyzer = ImageAnalyzer.__new__(ImageAnalyzer)
+    analyzer.clip_model_name = "ViT-B/32"
+    analyzer.device = "cpu"
+    analyzer.analysis_prompts = dict(QUERIES)
+
+    def encode_texts(texts):
+        encoded.append(list(texts))
+        features = torch.randn(len(texts), 8)
+        return features / features.norm(dim=-1, keepdim=True)
+
+    analyzer._encode_texts = encode_texts
+    return analyzer
+
+
+def test_query_features_are_encoded_once_and_persisted(monkeypatch, tmp_path):
+    encoded = []
+    first = _analyzer(monkeypatch, tmp_path, encoded)._load_text_features()
+    assert len(encoded) == 2
+    assert len(os.listdir(tmp_path / "clip_text_features")) == 1
+
+    second = _analyzer(monkeypatch, tmp_path, encoded)._load_text_features()
+    assert len(encoded) == 2
+    for analysis_type in QUERIES:
+        assert torch.equal(first[analysis_type], second[analysis_type])
+
+
+def test_changed_queries_or_corrupt_cache_are_re_encoded(monkeypatch, tmp_path):
+    encoded = []
+    _analyzer(monkeypatch, tmp_path, encoded)._load_text_features()
+
+    changed = _analyzer(monkeypatch, tmp_path, encoded)
+    changed.analysis_prompts[ImageAnalysisType.QUALITY_ANALYSIS] = ["a noisy image", "a clean image"]
+    changed._load_text_features()
+    assert len(encoded) == 4
+    assert len(os.listdir(tmp_path / "clip_text_features")) == 2
+
+    for cache_file in (tmp_path / "clip_text_features").iterdir():
+        cache_file.write_bytes(b"corrompido")
+    _analyzer(monkeypatch, tmp_path, encoded)._load_text_features()
+    assert len(encoded) == 6
+
+
+
+@pytest.mark.asyncio
+async def test_multi_type_analysis_shares_work_and_matches_single_type_scores(monkeypatch, tmp_path):
+    analyzer = _analyzer(monkeypatch, tmp_path, [])
+    analyzer.text_features = analyzer._load_text_features()
+    analyzer._text_feature_slices = {
+        ImageAnalysisType.CONTENT_ANALYSIS: slice(0, 3),
+        ImageAnalysisType.QUALITY_ANALYSIS: slice(3, 5),
+    }
+    analyzer._all_text_features = torch.cat([analyzer.text_features[t] for t in QUERIES])
+
+    image_features = torch.randn(1, 8)
+    image_features /= image_features.norm(dim=-1, keepdim=True)
+    calls = []
+
+    async def shared_step(name, value):
+        calls.append(name)
+        return value
+
+    async def build_result(request, analysis_type, image, description, visual_elements, clip_analysis,
+                           start_time, shared_types=None, index_key=None):
+        return analysis_type, clip_analysis, shared_types
+
+    analyzer.load_image = lambda data: shared_step("decode", "imagem")
+    analyzer._generate_description = lambda image: shared_step("caption", "uma foto")
+    analyzer._encode_image = lambda image, key=None: shared_step("clip", image_features)
+    analyzer._extract_visual_elements = lambda image, features=None: shared_step("opencv", {})
+    analyzer._build_result = build_result
+
+    types = [ImageAnalysisType.QUALITY_ANALYSIS, ImageAnalysisType.CONTENT_ANALYSIS]
+    results = await analyzer.analyze_multi(
+        ImageAnalysisRequest(image_data="...", analysis_type=ImageAnalysisType.CONTENT_ANALYSIS), types
+    )
+
+    assert sorted(calls) == ["caption", "clip", "decode", "opencv"]
+    assert [r[0] for r in results] == types
+    assert all(r[2] == types for r in results)
+    for analysis_type, clip_analysis, _ in results:
+        # Mesmo resultado da análise de um tipo só
+        single = analyzer._clip_scores(
+            analysis_type, (100.0 * image_features @ analyzer.text_features[analysis_type].T)[0]
+        )
+        assert clip_analysis["top_concept"] == single["top_concept"]
+        assert clip_analysis["clip_analysis"] == pytest.approx(single["clip_analysis"])
@@ -0,0 +1,42 @@
+import numpy as np
+
+from PyLab.app.utils.image_features import dominant_palette
+
+
+def _three_color_pixels():
+    rng = np.random.default_rng(0)
+    red = np.tile([230, 20, 20], (6000, 1))
+    green = np.tile([20, 200, 40], (3000, 1))
+    blue = np.tile([30, 40, 220], (1000, 1))
+    pixels = np.concatenate([red, green, blue]) + rng.integers(-6, 7, size=(10000, 3))
+    return np.clip(pixels, 0, 255).astype(np.uint8)
+
+
+def test_palette_is_deterministic_and_order_independent():
+    pixels = _three_color_pixels()
+    centers, fractions = dominant_palette(pixels, k=3)
+
+    again_centers, again_fractions = dominant_palette(pixels.copy(), k=3)
+    np.testing.assert_array_equal(centers, again_centers)
+    np.testing.assert_array_equal(fractions, again_fractions)
+
+    # Embaralhar os pixels não muda o histograma, logo nem a paleta
+    shuffled = np.random.default_rng(1).permutation(pixels)
+    shuffled_centers, shuffled_fractions = dominant_palette(shuffled, k=3)
+    np.testing.assert_allclose(shuffled_centers, centers, atol=1e-3)
+    np.testing.assert_allclose(shuffled_fractions, fractions, atol=1e-9)
+
+
+def test_palette_finds_dominant_colors_by_frequency():
+    centers, fractions = dominant_palette(_three_color_pixels(), k=3)
+
+    np.testing.assert_allclose(fractions, [0.6, 0.3, 0.1], atol=1e-9)
+    np.testing.assert_allclose(centers, [[230, 20, 20], [20, 200, 40], [30, 40, 220]], atol=2.0)
+
+
+def test_palette_caps_k_at_distinct_colors():
+    pixels = np.array([[0, 0, 0]] * 5 + [[255, 255, 255]] * 3, dtype=np.uint8)
+    centers, fractions = dominant_palette(pixels, k=5)
+
+    assert centers.shape == (2, 3)
+    np.testing.assert_allclose(fractions, [5 / 8, 3 / 8])
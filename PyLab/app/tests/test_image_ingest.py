@@ -0,0 +1,72 @@
+import io
+
+from PIL import Image
+
+from PyLab.app.utils.image_ingest import decode_image, fit_image, model_input, original_size
+
+
+def _encoded(size, fmt="JPEG", orientation=None):
+    image = Image.new("RGB", size, (200, 30, 30))
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, exif=exif)
+    buffer.seek(0)
+    return buffer
+
+
+def test_decode_caps_the_longest_side_and_keeps_the_original_size():
+    image = decode_image(_encoded((4000, 2000)), max_side=1000)
+
+    assert image.size == (1000, 500)
+    assert image.mode == "RGB"
+    assert original_size(image) == (4000, 2000)
+
+
+def test_decode_applies_exif_orientation_to_both_sizes():
+    image = decode_image(_encoded((400, 200), orientation=6), max_side=100)
+
+    assert image.size == (50, 100)
+    assert original_size(image) == (200, 400)
+
+
+def test_decode_without_limit_keeps_full_resolution():
+    image = decode_image(_encoded((640, 480), fmt="PNG"), max_side=None)
+
+    assert image.size == (640, 480)
+    assert original_size(image) == (640, 480)
+
+
+def test_fit_image_downscales_large_images():
+    image = fit_image(Image.new("RGBA", (3000, 1500)), max_side=1024)
+
+    assert image.size == (1024, 512)
+    assert image.mode == "RGB"
+    assert original_size(image) == (3000, 1500)
+
+
+def test_fit_image_leaves_small_images_alone():
+    source = Image.new("RGB", (800, 600))
+
+    image = fit_image(source, max_side=1024)
+
+    assert image is source
+    assert original_size(image) == (800, 600)
+
+
+def test_fit_image_keeps_the_size_recorded_at_decode():
+    decoded = decode_image(_encoded((4000, 3000)), max_side=2000)
+
+    image = fit_image(decoded, max_side=1000)
+
+    assert image.size == (1000, 750)
+    assert original_size(image) == (4000, 3000)
+
+
+def test_model_input_picks_the_smallest_level_covering_the_model():
+    image = Image.new("RGB", (1024, 768))
+
+    assert model_input(image, 224).size == (342, 256)
+    assert model_input(image, 384).size == (512, 384)
+    assert model_input(Image.new("RGB", (300, 300)), 224).size == (300, 300)
@@ -0,0 +1,249 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+pytest.importorskip("openai")
+
+from PyLab.app.utils.llm_gateway import (
+    AdaptiveConcurrencyLimiter, LLMGateway, ModelLimits, TokenBucket, _ModelState
+)
+from PyLab.app.utils.tokenizer import count_tokens
+
+MODEL = "gpt-test"
+
+
+def completion_body(total_tokens=100):
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": MODEL,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": total_tokens - 10, "completion_tokens": 10, "total_tokens": total_tokens}
+    }
+
+
+class StubLLM:
+    """Endpoint /v1/chat/completions que responde conforme um roteiro"""
+
+    def __init__(self, script):
+        # Cada passo: ("ok", total_tokens) | (status, headers) | ("sleep", segundos)
+        self.script = list(script)
+        self.calls = 0
+        self.received = asyncio.Event()
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle)
+        return app
+
+    async def handle(self, request):
+        await request.read()
+        self.calls += 1
+        self.received.set()
+        kind, value = self.script.pop(0) if self.script else ("ok", 100)
+        if kind == "ok":
+            return web.json_response(completion_body(value))
+        if kind == "sleep":
+            await asyncio.sleep(value)
+            return web.json_response(completion_body())
+        return web.json_response(
+            {"error": {"message": "stub", "type": "stub", "code": None}}, status=kind, headers=value
+        )
+
+
+@asynccontextmanager
+async def stub_gateway(script, tokens_per_minute=60_000, **kwargs):
+    stub = StubLLM(script)
+    server = TestServer(stub.app())
+    await server.start_server()
+    gateway = LLMGateway(
+        api_key="test",
+        base_url=str(server.make_url("/v1")),
+        base_backoff=0.01,
+        max_backoff=0.05,
+        limits={MODEL: ModelLimits(requests_per_minute=6_000, tokens_per_minute=tokens_per_minute, max_concurrency=8)},
+        **kwargs
+    )
+    try:
+        yield stub, gateway
+    finally:
+        await gateway.close()
+        await server.close()
+
+
+MESSAGES = [{"role": "user", "content": "olá"}]
+
+
+# === TokenBucket ===
+
+@pytest.mark.asyncio
+async def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(rate_per_minute=6_000, capacity=10)  # 100/s
+    await bucket.acquire(10)
+
+    started = time.monotonic()
+    await bucket.acquire(5)
+    elapsed = time.monotonic() - started
+
+    assert 0.04 <= elapsed < 0.5
+    assert bucket._tokens == pytest.approx(0, abs=1)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_caps_requests_and_refunds_at_capacity():
+    bucket = TokenBucket(rate_per_minute=60, capacity=10)
+    # Pedido maior que a capacidade é limitado a ela em vez de bloquear
+    await asyncio.wait_for(bucket.acquire(50), timeout=1)
+    bucket.refund(4)
+    assert bucket._tokens == pytest.approx(4, abs=0.1)
+    bucket.refund(100)
+    assert bucket._tokens == 10
+
+
+# === AIMD ===
+
+def test_concurrency_limiter_halves_and_recovers():
+    limiter = AdaptiveConcurrencyLimiter(max_limit=16)
+    assert limiter.limit == 8
+
+    limiter.on_rate_limited()
+    assert limiter.limit == 4
+    # Aditivo: ~+1 a cada "limite" sucessos
+    for _ in range(4):
+        limiter.on_success()
+    assert 4.9 < limiter.limit < 5.1
+
+    for _ in range(10):
+        limiter.on_rate_limited()
+    assert limiter.limit == limiter.min_limit
+    for _ in range(1000):
+        limiter.on_success()
+    assert limiter.limit == limiter.max_limit
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_call_backs_off_and_retries():
+    async with stub_gateway([(429, {"retry-after": "0"}), ("ok", 100)]) as (stub, gateway):
+        response = await gateway.chat_completion(MODEL, MESSAGES, max_tokens=50)
+
+        assert response.choices[0].message.content == "ok"
+        assert stub.calls == 2
+        # Limite inicial 4 (metade do máximo) → 2 no 429, depois +1/2 no sucesso
+        assert gateway._state(MODEL).concurrency.limit == pytest.approx(2.5)
+
+
+# === Retries ===
+
+def test_backoff_is_jittered_and_bounded():
+    gateway = LLMGateway(base_backoff=0.5, max_backoff=3.0)
+    delays = [gateway._backoff(attempt) for attempt in range(1, 8) for _ in range(20)]
+
+    assert all(0 <= d <= 3.0 for d in delays)
+    assert all(d <= 1.0 for d in delays[:20])  # attempt 1: até 0.5 * 2
+    assert len(set(delays)) > 100
+
+
+@pytest.mark.asyncio
+async def test_server_errors_are_retried_until_success():
+    async with stub_gateway([(500, {}), (503, {}), ("ok", 100)]) as (stub, gateway):
+        response = await gateway.chat_completion(MODEL, MESSAGES, max_tokens=50)
+
+        assert response.usage.total_tokens == 100
+        assert stub.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_timeouts_are_retried():
+    async with stub_gateway([("sleep", 0.5), ("ok", 100)], timeout=0.2) as (stub, gateway):
+        response = await gateway.chat_completion(MODEL, MESSAGES, max_tokens=50)
+
+        assert response.choices[0].message.content == "ok"
+        assert stub.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_retries_give_up_after_max_retries():
+    import openai
+
+    async with stub_gateway([(500, {})] * 3, max_retries=2) as (stub, gateway):
+        with pytest.raises(openai.InternalServerError):
+            await gateway.chat_completion(MODEL, MESSAGES, max_tokens=50)
+        assert stub.calls == 3
+
+
+# === Reserva de tokens ===
+
+@pytest.mark.asyncio
+async def test_success_charges_reported_usage():
+    async with stub_gateway([("ok", 100)], tokens_per_minute=1_000) as (stub, gateway):
+        await gateway.chat_completion(MODEL, MESSAGES, max_tokens=500)
+
+        # Reserva de ~500 ajustada ao usage (100); reposição de ~17/s
+        assert gateway._state(MODEL).tokens._tokens == pytest.approx(900, abs=5)
+
+
+@pytest.mark.asyncio
+async def test_failed_call_refunds_reservation():
+    import openai
+
+    async with stub_gateway([(400, {})], tokens_per_minute=1_000) as (stub, gateway):
+        with pytest.raises(openai.BadRequestError):
+            await gateway.chat_completion(MODEL, MESSAGES, max_tokens=500)
+
+        assert gateway._state(MODEL).tokens._tokens == pytest.approx(1_000, abs=1)
+
+
+@pytest.mark.asyncio
+async def test_exhausted_retries_refund_every_attempt():
+    import openai
+
+    async with stub_gateway([(500, {})] * 3, tokens_per_minute=1_000, max_retries=2) as (stub, gateway):
+        with pytest.raises(openai.InternalServerError):
+            await gateway.chat_completion(MODEL, MESSAGES, max_tokens=300)
+
+        assert gateway._state(MODEL).tokens._tokens == pytest.approx(1_000, abs=1)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_call_refunds_reservation():
+    async with stub_gateway([("sleep", 0.5)], tokens_per_minute=1_000) as (stub, gateway):
+        task = asyncio.create_task(gateway.chat_completion(MODEL, MESSAGES, max_tokens=500))
+        await asyncio.wait_for(stub.received.wait(), timeout=5)
+        assert gateway._state(MODEL).tokens._tokens < 600
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        state = gateway._state(MODEL)
+        assert state.tokens._tokens == pytest.approx(1_000, abs=1)
+        assert state.concurrency._in_flight == 0
+
+
+# === Streams ===
+
+@pytest.mark.asyncio
+async def test_settle_stream_charges_generated_tokens():
+    state = _ModelState(ModelLimits(requests_per_minute=60, tokens_per_minute=1_000))
+    await state.tokens.acquire(600)
+    completion = ["Olá, ", "tudo bem por aí?"]
+
+    completion_tokens = LLMGateway._settle_stream(state, MODEL, 600, 100, completion)
+
+    assert completion_tokens == count_tokens("".join(completion), MODEL)
+    # Fica debitado só o prompt e o texto recebido
+    assert state.tokens._tokens == pytest.approx(1_000 - 100 - completion_tokens, abs=1)
+
+
+@pytest.mark.asyncio
+async def test_settle_stream_refunds_when_nothing_was_generated():
+    state = _ModelState(ModelLimits(requests_per_minute=60, tokens_per_minute=1_000))
+    await state.tokens.acquire(600)
+
+    assert LLMGateway._settle_stream(state, MODEL, 600, 100, []) == 0
+    assert state.tokens._tokens == pytest.approx(1_000, abs=1)
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from PyLab.app.utils.media_fetcher import FetchedMedia, MediaFetcher
+
+
+def _fetcher(tmp_path, monkeypatch, download):
+    fetcher = MediaFetcher(cache_dir=str(tmp_path))
+    monkeypatch.setattr(fetcher, "_get", download)
+    return fetcher
+
+
+@pytest.mark.asyncio
+async def test_cancelling_the_first_caller_does_not_cancel_the_shared_download(tmp_path, monkeypatch):
+    started, release = asyncio.Event(), asyncio.Event()
+    calls = []
+
+    async def download(url):
+        calls.append(url)
+        started.set()
+        await release.wait()
+        return FetchedMedia(url=url, content=b"data", version="v1")
+
+    fetcher = _fetcher(tmp_path, monkeypatch, download)
+    first = asyncio.ensure_future(fetcher.get("http://example.com/a.png"))
+    await started.wait()
+    second = asyncio.ensure_future(fetcher.get("http://example.com/a.png"))
+    await asyncio.sleep(0)
+
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+    release.set()
+    assert (await second).content == b"data"
+    assert calls == ["http://example.com/a.png"]
+    assert fetcher._inflight == {}
+
+
+@pytest.mark.asyncio
+async def test_download_errors_reach_every_caller_and_are_not_kept(tmp_path, monkeypatch):
+    calls = []
+
+    async def download(url):
+        calls.append(url)
+        await asyncio.sleep(0.01)
+        raise IOError("HTTP 500")
+
+    fetcher = _fetcher(tmp_path, monkeypatch, download)
+    results = await asyncio.gather(
+        fetcher.get("http://example.com/b.png"),
+        fetcher.get("http://example.com/b.png"),
+        return_exceptions=True
+    )
+    assert [type(r) for r in results] == [OSError, OSError]
+    assert len(calls) == 1
+
+    # Nova chamada depois da falha: novo download
+    with pytest.raises(IOError):
+        await fetcher.get("http://example.com/b.png")
+    assert len(calls) == 2
@@ -0,0 +1,54 @@
+import pytest
+from fastapi import HTTPException
+
+from PyLab.app.utils.media_serving import build_media_response, parse_range_header
+from PyLab.app.utils.storage import StorageManager
+from PyLab.app.utils.storage_backends import LocalFilesystemBackend
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("", None),
+    ("items=0-10", None),
+    ("bytes=0-99,200-299", None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-500", (500, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=999-999", (999, 999)),
+])
+def test_parse_range_header(header, expected):
+    assert parse_range_header(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", [
+    "bytes=1000-",
+    "bytes=500-100",
+    "bytes=-0",
+    "bytes=abc-10",
+    "bytes=-",
+])
+def test_parse_range_header_rejects_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range_header(header, 1000)
+
+
+@pytest.mark.asyncio
+async def test_media_response_uses_the_current_file_size(tmp_path):
+    storage = StorageManager(str(tmp_path), backend=LocalFilesystemBackend(str(tmp_path)))
+    await storage.save_video(b"x" * 100, "clip.mp4")
+    # Arquivo trocado depois de indexado (o índice ainda diz 100 bytes)
+    path = storage.backend.local_path("videos/clip.mp4")
+    path.unlink()
+    path.write_bytes(b"y" * 40)
+
+    response = await build_media_response(storage, "clip.mp4", "bytes=10-")
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 10-39/40"
+    assert response.headers["content-length"] == "30"
+
+    with pytest.raises(HTTPException) as error:
+        await build_media_response(storage, "clip.mp4", "bytes=50-")
+    assert error.value.status_code == 416
+    await storage.close()
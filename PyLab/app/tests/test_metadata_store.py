@@ -0,0 +1,69 @@
+import pytest
+
+from PyLab.app.utils.metadata_store import MetadataStore
+
+
+def _record(filename, media_type="image", modified=1000.0, metadata=None):
+    return {
+        "filename": filename,
+        "media_type": media_type,
+        "size": 10,
+        "created": modified,
+        "modified": modified,
+        "metadata": metadata
+    }
+
+
+@pytest.mark.asyncio
+async def test_pending_record_is_readable_before_flush(tmp_path):
+    store = MetadataStore(tmp_path / "metadata.db", flush_interval=60)
+    await store.put(_record("a.png", metadata={"prompt": "cat"}))
+
+    record = await store.get("a.png")
+    assert record["metadata"] == {"prompt": "cat"}
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_records_persist_across_instances(tmp_path):
+    store = MetadataStore(tmp_path / "metadata.db")
+    await store.put(_record("a.png", metadata={"prompt": "cat"}))
+    await store.put(_record("b.mp4", media_type="video"))
+    await store.delete("b.mp4")
+    await store.close()
+
+    reopened = MetadataStore(tmp_path / "metadata.db")
+    assert (await reopened.get("a.png"))["metadata"] == {"prompt": "cat"}
+    assert await reopened.get("b.mp4") is None
+    await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_list_filters_and_orders_by_modified(tmp_path):
+    store = MetadataStore(tmp_path / "metadata.db")
+    await store.put(_record("img_1.png", modified=100.0))
+    await store.put(_record("img_2.png", modified=300.0))
+    await store.put(_record("imgX3.png", modified=200.0))
+    await store.put(_record("vid_1.mp4", media_type="video", modified=400.0))
+
+    names = [r["filename"] for r in await store.list()]
+    assert names == ["vid_1.mp4", "img_2.png", "imgX3.png", "img_1.png"]
+
+    # "_" é literal no prefixo, não curinga do LIKE
+    assert [r["filename"] for r in await store.list(prefix="img_")] == ["img_2.png", "img_1.png"]
+    assert [r["filename"] for r in await store.list(media_type="video")] == ["vid_1.mp4"]
+    assert [r["filename"] for r in await store.list(since=200.0, media_type="image")] == ["img_2.png", "imgX3.png"]
+    assert len(await store.list(limit=2)) == 2
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_cache_is_bounded(tmp_path):
+    store = MetadataStore(tmp_path / "metadata.db", cache_size=2)
+    for i in range(5):
+        await store.put(_record(f"{i}.png"))
+    await store.flush()
+
+    assert len(store._cache) == 2
+    assert (await store.get("0.png"))["filename"] == "0.png"
+    await store.close()
@@ -0,0 +1,80 @@
+import asyncio
+from enum import Enum
+
+import pytest
+
+from PyLab.app.utils import metrics
+from PyLab.app.utils.llm_gateway import estimate_cost
+from PyLab.app.utils.metrics import (
+    current_usage, instrument, record_llm_call, record_llm_retry, track_operation
+)
+
+
+class Kind(Enum):
+    SENTIMENT = "sentiment"
+
+
+class Request:
+    kind = Kind.SENTIMENT
+
+
+class Service:
+    @instrument("text", "kind")
+    async def analyze(self, request):
+        # Chamadas em tasks filhas somam ao uso da mesma operação
+        await asyncio.gather(
+            asyncio.create_task(self._call()), asyncio.create_task(self._call())
+        )
+        return current_usage()
+
+    @instrument("text.stream")
+    async def stream(self, request):
+        await self._call()
+        yield current_usage()
+
+    async def _call(self):
+        record_llm_call("gpt-4", 100, 20, 0.1)
+
+
+def test_track_operation_accumulates_usage_and_cost():
+    with track_operation("text.sentiment") as usage:
+        record_llm_call("gpt-4", 100, 50, 0.2)
+        record_llm_retry("gpt-4", "RateLimitError")
+        record_llm_call("gpt-4", 30, 20, 0.1)
+
+    assert (usage.prompt_tokens, usage.completion_tokens, usage.total_tokens) == (130, 70, 200)
+    assert usage.llm_calls == 2 and usage.retries == 1
+    assert usage.cost == pytest.approx(estimate_cost("gpt-4", 200))
+    assert current_usage() is None
+
+
+def test_calls_outside_an_operation_are_not_attributed():
+    record_llm_call("gpt-4", 100, 50, 0.2)
+    with track_operation("text.sentiment") as usage:
+        pass
+    assert usage.total_tokens == 0
+
+
+@pytest.mark.asyncio
+async def test_instrument_labels_by_type_and_shares_usage_with_child_tasks():
+    service = Service()
+
+    usage = await service.analyze(Request())
+    assert usage.operation == "text.sentiment"
+    assert (usage.llm_calls, usage.total_tokens) == (2, 240)
+
+    streamed = [item async for item in service.stream(Request())]
+    assert streamed[0].operation == "text.stream" and streamed[0].llm_calls == 1
+    assert current_usage() is None
+
+
+def test_prometheus_exposition():
+    pytest.importorskip("prometheus_client")
+
+    with track_operation("test.metrics"):
+        record_llm_call("gpt-4", 10, 5, 0.3)
+    body, content_type = metrics.render_metrics()
+
+    assert content_type.startswith("text/plain")
+    assert b'pylab_llm_tokens_total{kind="prompt",model="gpt-4",operation="test.metrics"} 10.0' in body
+    assert b'pylab_operations_total{operation="test.metrics",status="ok"} 1.0' in body
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from PyLab.app.utils.micro_batcher import MicroBatcher
+
+
+def _recording_batcher(batches, **kwargs):
+    async def process(items):
+        batches.append(list(items))
+        if any(item < 0 for item in items):
+            raise ValueError("item inválido")
+        return [item * 10 for item in items]
+
+    return MicroBatcher(process, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_flushed_without_waiting():
+    batches = []
+    batcher = _recording_batcher(batches, max_batch_size=4, max_wait=10)
+
+    results = await asyncio.wait_for(batcher.submit_many([1, 2, 3, 4, 5, 6, 7, 8]), timeout=1)
+
+    assert results == [10, 20, 30, 40, 50, 60, 70, 80]
+    assert batches == [[1, 2, 3, 4], [5, 6, 7, 8]]
+
+
+@pytest.mark.asyncio
+async def test_partial_batch_is_flushed_after_max_wait():
+    batches = []
+    batcher = _recording_batcher(batches, max_batch_size=32, max_wait=0.05)
+
+    started = asyncio.get_running_loop().time()
+    results = await asyncio.gather(batcher.submit(1), batcher.submit(2), batcher.submit(3))
+    elapsed = asyncio.get_running_loop().time() - started
+
+    assert results == [10, 20, 30]
+    assert batches == [[1, 2, 3]]
+    assert 0.04 <= elapsed < 1
+
+
+@pytest.mark.asyncio
+async def test_failing_item_does_not_fail_the_rest_of_the_batch():
+    batches = []
+    batcher = _recording_batcher(batches, max_batch_size=3, max_wait=10)
+
+    results = await asyncio.gather(
+        batcher.submit(1), batcher.submit(-1), batcher.submit(3), return_exceptions=True
+    )
+
+    assert results[0] == 10 and results[2] == 30
+    assert isinstance(results[1], ValueError)
+    # Lote inteiro, depois item a item
+    assert batches == [[1, -1, 3], [1], [-1], [3]]
+
+
+@pytest.mark.asyncio
+async def test_short_result_list_does_not_leave_items_waiting():
+    async def process(items):
+        return items[:1]
+
+    batcher = MicroBatcher(process, max_batch_size=2, max_wait=10)
+    results = await asyncio.wait_for(
+        asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True), timeout=1
+    )
+
+    assert results == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_items_are_not_processed():
+    batches = []
+    batcher = _recording_batcher(batches, max_batch_size=32, max_wait=0.02)
+
+    cancelled = asyncio.ensure_future(batcher.submit(1))
+    kept = asyncio.ensure_future(batcher.submit(2))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+
+    assert await kept == 20
+    assert batches == [[2]]
@@ -0,0 +1,48 @@
+import pytest
+
+from PyLab.app.utils.response_cache import ResponseCache, make_cache_key
+
+
+def test_cache_key_normalizes_whitespace():
+    assert make_cache_key("system", "a  b\n c ") == make_cache_key("system", "a b c")
+    assert make_cache_key("system", "a b c") != make_cache_key("system", "a b d")
+
+
+def test_cache_key_parts_do_not_collide_by_concatenation():
+    assert make_cache_key("ab", "c") != make_cache_key("a", "bc")
+
+
+@pytest.mark.asyncio
+async def test_exact_lookup_and_lru_eviction():
+    cache = ResponseCache(max_entries=2)
+    await cache.put("a", {"v": 1})
+    await cache.put("b", {"v": 2})
+    assert await cache.get("a") == ({"v": 1}, "exact")
+
+    # "b" é o menos usado recentemente
+    await cache.put("c", {"v": 3})
+    assert await cache.get("b") == (None, None)
+    assert await cache.get("a") == ({"v": 1}, "exact")
+    assert cache.stats() == {"entries": 2, "hits": 2, "semantic_hits": 0, "misses": 1}
+
+
+@pytest.mark.asyncio
+async def test_expired_entries_are_misses():
+    cache = ResponseCache(ttl=-1)
+    await cache.put("a", {"v": 1})
+    assert await cache.get("a") == (None, None)
+
+
+@pytest.mark.asyncio
+async def test_semantic_lookup_is_limited_to_scope_and_threshold():
+    vectors = {"original text": [1.0, 0.0], "edited text": [0.99, 0.05], "other text": [0.0, 1.0]}
+
+    async def embed(text):
+        return vectors[text]
+
+    cache = ResponseCache(embed=embed, similarity_threshold=0.97)
+    await cache.put(make_cache_key("original text"), "result", scope="sentiment", text="original text")
+
+    assert await cache.get(make_cache_key("edited text"), "sentiment", "edited text") == ("result", "semantic")
+    assert await cache.get(make_cache_key("edited text"), "summary", "edited text") == (None, None)
+    assert await cache.get(make_cache_key("other text"), "sentiment", "other text") == (None, None)
@@ -0,0 +1,39 @@
+import itertools
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from PyLab.app.utils.similarity import pairwise_similarity_stats
+
+
+def _brute_force(features):
+    n = features.shape[0]
+    matrix = features @ features.T
+    return sorted(
+        ((i, j, float(matrix[i, j])) for i, j in itertools.combinations(range(n), 2)),
+        key=lambda pair: pair[2]
+    )
+
+
+@pytest.mark.parametrize("n,block_size", [(2, 256), (7, 3), (20, 4), (33, 32)])
+def test_matches_brute_force(n, block_size):
+    generator = torch.Generator().manual_seed(n)
+    features = torch.nn.functional.normalize(torch.randn(n, 16, generator=generator), dim=1)
+    expected = _brute_force(features)
+    top_k = 5
+
+    stats = pairwise_similarity_stats(features, top_k, block_size, include_matrix=True)
+
+    k = min(top_k, len(expected))
+    assert [pair[:2] for pair in stats["top_pairs"]] == [pair[:2] for pair in expected[::-1][:k]]
+    assert [pair[:2] for pair in stats["bottom_pairs"]] == [pair[:2] for pair in expected[:k]]
+    assert stats["most_similar_pair"][:2] == expected[-1][:2]
+    assert stats["least_similar_pair"][:2] == expected[0][:2]
+    assert stats["average_similarity"] == pytest.approx(sum(p[2] for p in expected) / len(expected), abs=1e-5)
+    assert torch.allclose(torch.tensor(stats["similarity_matrix"]), features @ features.T, atol=1e-6)
+
+
+def test_matrix_is_optional():
+    features = torch.nn.functional.normalize(torch.randn(4, 8), dim=1)
+    assert pairwise_similarity_stats(features, 3, 2, include_matrix=False)["similarity_matrix"] is None
@@ -0,0 +1,76 @@
+import pytest
+
+for dependency in ("whisper", "librosa", "webrtcvad", "pydub"):
+    pytest.importorskip(dependency)
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from PyLab.app.models import speech_processor as speech_module
+from PyLab.app.models.speech_processor import SpeechAnalysisRequest, SpeechAnalysisType, SpeechProcessor
+
+
+def _processor(monkeypatch, opened):
+    processor = SpeechProcessor.__new__(SpeechProcessor)
+
+    async def load_audio(audio_data):
+        return str(opened["tmp"])
+
+    async def transcribe(path, language=None, analysis_type=None):
+        opened["path"] = path
+        return [speech_module.TranscriptionSegment(0.0, 1.0, "olá", 0.9)]
+
+    async def nothing(*args, **kwargs):
+        return {}
+
+    async def no_recommendations(*args, **kwargs):
+        return []
+
+    async def summary(*args, **kwargs):
+        return ""
+
+    monkeypatch.setattr(processor, "_load_audio", load_audio)
+    monkeypatch.setattr(processor, "_transcribe_audio", transcribe)
+    monkeypatch.setattr(processor, "_perform_specialized_analysis", nothing)
+    monkeypatch.setattr(processor, "_generate_recommendations", no_recommendations)
+    monkeypatch.setattr(processor, "_generate_summary", summary)
+    return processor
+
+
+def test_audio_path_in_request_body_is_ignored(tmp_path, monkeypatch):
+    opened = {"tmp": tmp_path / "upload.wav"}
+    opened["tmp"].write_bytes(b"RIFF")
+    processor = _processor(monkeypatch, opened)
+
+    app = FastAPI()
+
+    @app.post("/analyze/speech/transcribe")
+    async def transcribe(request: SpeechAnalysisRequest):
+        await processor.analyze(request)
+        return {"has_audio_path": hasattr(request, "audio_path")}
+
+    response = TestClient(app).post("/analyze/speech/transcribe", json={
+        "audio_data": "UklGRg==",
+        "analysis_type": SpeechAnalysisType.TRANSCRIPTION.value,
+        "audio_path": "/etc/passwd"
+    })
+
+    assert response.status_code == 200
+    assert response.json()["has_audio_path"] is False
+    # Só o temporário criado a partir do base64 foi aberto
+    assert opened["path"] == str(opened["tmp"])
+
+
+@pytest.mark.asyncio
+async def test_server_resolved_audio_path_is_read_in_place(tmp_path, monkeypatch):
+    stored = tmp_path / "stored.wav"
+    stored.write_bytes(b"RIFF")
+    opened = {"tmp": tmp_path / "unused.wav"}
+    processor = _processor(monkeypatch, opened)
+
+    request = SpeechAnalysisRequest(audio_data="", analysis_type=SpeechAnalysisType.TRANSCRIPTION)
+    await processor.analyze(request, audio_path=str(stored))
+
+    assert opened["path"] == str(stored)
+    # Arquivo do storage não é apagado como um temporário
+    assert stored.exists()
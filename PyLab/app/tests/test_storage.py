@@ -0,0 +1,133 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from PyLab.app.utils import storage as storage_module
+from PyLab.app.utils.storage import StorageManager
+from PyLab.app.utils.storage_backends import LocalFilesystemBackend
+
+
+def _manager(tmp_path):
+    return StorageManager(str(tmp_path), backend=LocalFilesystemBackend(str(tmp_path)))
+
+
+def _refcount(manager, digest):
+    row = manager.deduplicator._conn.execute(
+        "SELECT refcount FROM content_blobs WHERE digest = ?", (digest,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+@pytest.mark.asyncio
+async def test_duplicate_content_shares_one_blob(tmp_path):
+    manager = _manager(tmp_path)
+    digest, reused = await manager.deduplicator.store(b"same bytes", "images/a.png")
+    assert not reused
+    _, reused = await manager.deduplicator.store(b"same bytes", "images/b.png")
+    assert reused
+    assert _refcount(manager, digest) == 2
+
+    blob = manager.backend.local_path(manager.deduplicator._blob_key(digest))
+    assert await manager.delete_file("a.png")
+    assert _refcount(manager, digest) == 1
+    assert blob.exists()
+
+    assert await manager.delete_file("b.png")
+    assert _refcount(manager, digest) == 0
+    assert not blob.exists()
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_overwriting_a_key_moves_its_reference(tmp_path):
+    manager = _manager(tmp_path)
+    old_digest, _ = await manager.deduplicator.store(b"first", "images/a.png")
+    new_digest, _ = await manager.deduplicator.store(b"second", "images/a.png")
+
+    assert _refcount(manager, old_digest) == 0
+    assert _refcount(manager, new_digest) == 1
+    assert (await manager.backend.get("images/a.png")) == b"second"
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_cleanup_uses_save_time_not_shared_blob_mtime(tmp_path):
+    manager = _manager(tmp_path)
+    await manager.save_video(b"video bytes", "old.mp4")
+    old = manager.backend.local_path("videos/old.mp4")
+    # Blob (e todos os hard links dele) com mtime de 3 dias atrás
+    three_days_ago = time.time() - 72 * 3600
+    os.utime(old, (three_days_ago, three_days_ago))
+
+    await manager.save_video(b"video bytes", "new.mp4")
+    assert manager.backend.local_path("videos/new.mp4").stat().st_mtime < time.time() - 48 * 3600
+
+    assert await manager.cleanup_old_files(24) == 0
+    assert [f["filename"] for f in await manager.list_files(since=time.time() - 60)] == ["new.mp4", "old.mp4"]
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_stores_of_one_key_keep_refcounts_consistent(tmp_path):
+    import asyncio
+
+    manager = _manager(tmp_path)
+    payloads = [b"one", b"two", b"one", b"three", b"two"]
+    await asyncio.gather(*[manager.deduplicator.store(data, "images/a.png") for data in payloads])
+
+    rows = manager.deduplicator._conn.execute("SELECT digest, refcount FROM content_blobs").fetchall()
+    assert [refcount for _, refcount in rows] == [1]
+    assert await manager.deduplicator.release("images/a.png")
+    assert manager.deduplicator._conn.execute("SELECT COUNT(*) FROM content_blobs").fetchone()[0] == 0
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_delete_listeners_see_deleted_and_expired_files(tmp_path):
+    manager = _manager(tmp_path)
+    removed = []
+
+    async def listener(filename):
+        removed.append(filename)
+
+    async def failing_listener(filename):
+        raise RuntimeError("indisponível")
+
+    manager.add_delete_listener(failing_listener)
+    manager.add_delete_listener(listener)
+    await manager.deduplicator.store(b"a", "images/a.png")
+    await manager.deduplicator.store(b"b", "images/b.png")
+
+    assert await manager.delete_file("a.png")
+    assert not await manager.delete_file("missing.png")
+    assert await manager.cleanup_old_files(max_age_hours=-1) == 1
+    assert removed == ["a.png", "b.png"]
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_large_image_is_optimized_off_the_event_loop(tmp_path, monkeypatch):
+    image = Image.frombytes("RGB", (3000, 1200), os.urandom(3000 * 1200 * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=0)
+    assert buffer.tell() > 10 * 1024 * 1024
+
+    threads = []
+    original = StorageManager._optimize_image_sync
+
+    def recording(image_data):
+        threads.append(threading.current_thread())
+        return original(image_data)
+
+    monkeypatch.setattr(storage_module.StorageManager, "_optimize_image_sync", staticmethod(recording))
+    manager = _manager(tmp_path)
+    filename = await manager.save_image(buffer.getvalue(), "big.png")
+
+    assert threads and threads[0] is not threading.main_thread()
+    with Image.open(manager.get_file_path(filename)) as saved:
+        assert max(saved.size) == 2048
+    await manager.close()
@@ -0,0 +1,269 @@
+import hashlib
+import hmac
+import os
+import re
+from contextlib import asynccontextmanager
+from urllib.parse import quote, unquote
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from PyLab.app.utils.storage_backends import LocalFilesystemBackend, S3StorageBackend
+
+
+@pytest.mark.asyncio
+async def test_local_list_is_recursive_under_prefix(tmp_path):
+    backend = LocalFilesystemBackend(str(tmp_path))
+    for key in ["jobs/a/state.json", "jobs/a/results/000000.jsonl", "jobs/b/state.json",
+                "jobs.txt", "images/x.png", ".blobs/ab/abc"]:
+        await backend.put(key, b"data")
+
+    assert sorted(obj.key for obj in await backend.list("jobs/")) == [
+        "jobs/a/results/000000.jsonl", "jobs/a/state.json", "jobs/b/state.json"
+    ]
+    # Sem barra: prefixo de chave, como no S3
+    assert sorted(obj.key for obj in await backend.list("jobs")) == [
+        "jobs.txt", "jobs/a/results/000000.jsonl", "jobs/a/state.json", "jobs/b/state.json"
+    ]
+    assert sorted(obj.key for obj in await backend.list("jobs/a/res")) == ["jobs/a/results/000000.jsonl"]
+    # Diretórios ocultos (blobs da deduplicação) ficam fora da listagem geral
+    assert sorted(obj.key for obj in await backend.list("")) == [
+        "images/x.png", "jobs.txt", "jobs/a/results/000000.jsonl", "jobs/a/state.json", "jobs/b/state.json"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_local_stream_honours_inclusive_range(tmp_path):
+    backend = LocalFilesystemBackend(str(tmp_path))
+    await backend.put("videos/v.mp4", bytes(range(100)))
+
+    chunks = [chunk async for chunk in backend.stream("videos/v.mp4", 10, 19, chunk_size=4)]
+    assert b"".join(chunks) == bytes(range(10, 20))
+    assert await backend.stat("videos/missing.mp4") is None
+
+
+# === S3 (servidor local no estilo MinIO) ===
+
+S3_NS = "http://s3.amazonaws.com/doc/2006-03-01/"
+ACCESS_KEY, SECRET_KEY, REGION = "test-access", "test-secret", "us-east-1"
+
+
+class FakeS3:
+    """Bucket em memória que valida a assinatura SigV4 de cada requisição"""
+
+    def __init__(self, page_size=2):
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+        self.requests = []
+        self.page_size = page_size
+        self.fail_part = None
+
+    def app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/{bucket}", self.handle_bucket)
+        app.router.add_route("*", "/{bucket}/{key:.+}", self.handle_object)
+        return app
+
+    async def verify(self, request):
+        body = await request.read()
+        auth = request.headers["Authorization"]
+        assert auth.startswith("AWS4-HMAC-SHA256 ")
+        fields = dict(item.split("=", 1) for item in auth[len("AWS4-HMAC-SHA256 "):].split(", "))
+        access_key, date_stamp, region, service, terminal = fields["Credential"].split("/")
+        assert (access_key, region, service, terminal) == (ACCESS_KEY, REGION, "s3", "aws4_request")
+        assert request.headers["x-amz-content-sha256"] == hashlib.sha256(body).hexdigest()
+
+        signed = fields["SignedHeaders"].split(";")
+        assert {"host", "x-amz-date", "x-amz-content-sha256"} <= set(signed)
+        # Como o S3: parâmetros decodificados e recodificados (RFC 3986), em ordem
+        canonical_query = "&".join(
+            f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(request.query.items())
+        )
+        canonical_request = "\n".join([
+            request.method,
+            request.raw_path.split("?", 1)[0],
+            canonical_query,
+            "".join(f"{name}:{request.headers[name].strip()}\n" for name in signed),
+            fields["SignedHeaders"],
+            request.headers["x-amz-content-sha256"]
+        ])
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", request.headers["x-amz-date"], f"{date_stamp}/{REGION}/s3/aws4_request",
+            hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+        key = f"AWS4{SECRET_KEY}".encode()
+        for part in (date_stamp, REGION, "s3", "aws4_request"):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        assert fields["Signature"] == hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+        self.requests.append((request.method, request.path, dict(request.query)))
+        return body
+
+    async def handle_bucket(self, request):
+        await self.verify(request)
+        assert request.query["list-type"] == "2"
+        keys = sorted(k for k in self.objects if k.startswith(request.query.get("prefix", "")))
+        start = int(request.query.get("continuation-token", "0"))
+        page = keys[start:start + self.page_size]
+        truncated = start + self.page_size < len(keys)
+        contents = "".join(
+            f"<Contents><Key>{k}</Key><LastModified>2024-01-02T03:04:05.000Z</LastModified>"
+            f"<ETag>&quot;{hashlib.md5(self.objects[k]).hexdigest()}&quot;</ETag>"
+            f"<Size>{len(self.objects[k])}</Size></Contents>"
+            for k in page
+        )
+        token = f"<NextContinuationToken>{start + self.page_size}</NextContinuationToken>" if truncated else ""
+        return web.Response(
+            text=f'<ListBucketResult xmlns="{S3_NS}"><IsTruncated>{str(truncated).lower()}</IsTruncated>'
+                 f"{contents}{token}</ListBucketResult>",
+            content_type="application/xml"
+        )
+
+    async def handle_object(self, request):
+        body = await self.verify(request)
+        key, query = request.match_info["key"], request.query
+
+        if request.method == "POST" and "uploads" in query:
+            upload_id = f"upload-{len(self.uploads) + 1}"
+            self.uploads[upload_id] = {}
+            return web.Response(
+                text=f'<InitiateMultipartUploadResult xmlns="{S3_NS}"><UploadId>{upload_id}</UploadId>'
+                     "</InitiateMultipartUploadResult>",
+                content_type="application/xml"
+            )
+        if request.method == "POST" and "uploadId" in query:
+            parts = self.uploads.pop(query["uploadId"])
+            numbers = [int(n) for n in re.findall(r"<PartNumber>(\d+)</PartNumber>", body.decode())]
+            assert numbers == sorted(parts)
+            self.objects[key] = b"".join(parts[n] for n in numbers)
+            return web.Response(text="<CompleteMultipartUploadResult/>", content_type="application/xml")
+        if request.method == "PUT" and "partNumber" in query:
+            number = int(query["partNumber"])
+            if number == self.fail_part:
+                return web.Response(status=500, text="<Error>InternalError</Error>")
+            self.uploads[query["uploadId"]][number] = body
+            return web.Response(headers={"ETag": f'"etag-{number}"'})
+        if request.method == "DELETE" and "uploadId" in query:
+            self.uploads.pop(query["uploadId"], None)
+            self.aborted.append(query["uploadId"])
+            return web.Response(status=204)
+
+        if request.method == "PUT":
+            source = request.headers.get("x-amz-copy-source")
+            if source is not None:
+                source_key = unquote(source).split("/", 2)[2]
+                if source_key not in self.objects:
+                    return web.Response(status=404, text="<Error>NoSuchKey</Error>")
+                self.objects[key] = self.objects[source_key]
+                return web.Response(text="<CopyObjectResult/>", content_type="application/xml")
+            self.objects[key] = body
+            return web.Response()
+        if request.method == "DELETE":
+            self.objects.pop(key, None)
+            return web.Response(status=204)
+        if key not in self.objects:
+            return web.Response(status=404)
+        data = self.objects[key]
+        headers = {"ETag": f'"{hashlib.md5(data).hexdigest()}"', "Last-Modified": "Tue, 02 Jan 2024 03:04:05 GMT"}
+        if request.method == "HEAD":
+            return web.Response(headers={**headers, "Content-Length": str(len(data))})
+        byte_range = request.headers.get("Range")
+        if byte_range:
+            start, _, end = byte_range[len("bytes="):].partition("-")
+            data = data[int(start):int(end) + 1 if end else None]
+            return web.Response(status=206, body=data, headers=headers)
+        return web.Response(body=data, headers=headers)
+
+
+@asynccontextmanager
+async def s3_backend():
+    fake = FakeS3()
+    server = TestServer(fake.app())
+    await server.start_server()
+    backend = S3StorageBackend(
+        str(server.make_url("")), "media", ACCESS_KEY, SECRET_KEY, REGION,
+        multipart_threshold=5 * 1024 * 1024, part_size=5 * 1024 * 1024
+    )
+    try:
+        yield fake, backend
+    finally:
+        await backend.close()
+        await server.close()
+
+
+@pytest.mark.asyncio
+async def test_s3_signed_put_get_stream_and_stat():
+    async with s3_backend() as (fake, backend):
+        # Chave com espaço e acento: caminho canônico precisa bater com o assinado
+        await backend.put("images/foto 1ç.png", b"0123456789", content_type="image/png")
+
+        assert await backend.get("images/foto 1ç.png") == b"0123456789"
+        assert b"".join([c async for c in backend.stream("images/foto 1ç.png", 2, 5)]) == b"2345"
+        stat = await backend.stat("images/foto 1ç.png")
+        assert stat.size == 10 and stat.etag == hashlib.md5(b"0123456789").hexdigest()
+        assert stat.modified == 1704164645.0
+
+
+@pytest.mark.asyncio
+async def test_s3_missing_object_head_is_none():
+    async with s3_backend() as (fake, backend):
+        assert await backend.stat("images/missing.png") is None
+        assert not await backend.exists("images/missing.png")
+        assert not await backend.delete("images/missing.png")
+        with pytest.raises(IOError):
+            await backend.get("images/missing.png")
+
+
+@pytest.mark.asyncio
+async def test_s3_multipart_upload():
+    async with s3_backend() as (fake, backend):
+        data = os.urandom(12 * 1024 * 1024)
+        assert await backend.put("videos/big.mp4", data) == len(data)
+
+        assert fake.objects["videos/big.mp4"] == data
+        part_numbers = sorted(int(q["partNumber"]) for m, _, q in fake.requests if "partNumber" in q)
+        assert part_numbers == [1, 2, 3]
+        assert fake.uploads == {} and fake.aborted == []
+
+
+@pytest.mark.asyncio
+async def test_s3_failed_part_aborts_the_upload():
+    async with s3_backend() as (fake, backend):
+        fake.fail_part = 2
+
+        with pytest.raises(IOError):
+            await backend.put("videos/big.mp4", os.urandom(12 * 1024 * 1024))
+
+        assert fake.aborted == ["upload-1"]
+        assert "videos/big.mp4" not in fake.objects
+
+
+@pytest.mark.asyncio
+async def test_s3_list_follows_continuation_tokens():
+    async with s3_backend() as (fake, backend):
+        for name in ["a", "b", "c", "d", "e"]:
+            await backend.put(f"jobs/{name}/state.json", name.encode())
+        await backend.put("images/x.png", b"x")
+
+        objects = await backend.list("jobs/")
+        assert [obj.key for obj in objects] == [f"jobs/{n}/state.json" for n in "abcde"]
+        assert [obj.size for obj in objects] == [1] * 5
+        list_calls = [q for m, path, q in fake.requests if path == "/media"]
+        assert [q.get("continuation-token") for q in list_calls] == [None, "2", "4"]
+
+
+@pytest.mark.asyncio
+async def test_s3_link_is_a_server_side_copy():
+    async with s3_backend() as (fake, backend):
+        await backend.put(".blobs/ab/abcdef", b"blob")
+        requests_before = len(fake.requests)
+
+        await backend.link(".blobs/ab/abcdef", "images/copy.png")
+
+        assert fake.objects["images/copy.png"] == b"blob"
+        # Uma única requisição PUT, sem corpo
+        assert fake.requests[requests_before:] == [("PUT", "/media/images/copy.png", {})]
+        with pytest.raises(IOError):
+            await backend.link(".blobs/ab/missing", "images/other.png")
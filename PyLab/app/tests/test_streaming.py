@@ -0,0 +1,49 @@
+import json
+
+from PyLab.app.utils.streaming import IncrementalJSONParser, sse_event
+
+
+def _feed_in_chunks(parser, text, size):
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    return events
+
+
+def test_fields_are_emitted_as_they_close():
+    document = {
+        "summary": "Clientes satisfeitos, com \"ressalvas\" e acentuação",
+        "insights": {"sentiment_overall": "positivo", "themes": ["preço", "suporte"]},
+        "confidence_score": 0.87,
+        "recommendations": ["manter", "melhorar"]
+    }
+    text = json.dumps(document, ensure_ascii=False)
+
+    for size in (1, 3, 7, len(text)):
+        parser = IncrementalJSONParser()
+        events = _feed_in_chunks(parser, text, size)
+
+        fields = [event["field"] for event in events if event["type"] == "field"]
+        assert fields == ["summary", "insights", "confidence_score", "recommendations"]
+        assert parser.fields == document
+        assert parser.result() == document
+
+
+def test_summary_deltas_rebuild_the_string():
+    parser = IncrementalJSONParser()
+    text = json.dumps({"summary": "linha 1\nlinha \u00e9 2", "confidence_score": 1}, ensure_ascii=True)
+    events = _feed_in_chunks(parser, text, 2)
+
+    deltas = "".join(event["text"] for event in events if event["type"] == "delta")
+    assert deltas == "linha 1\nlinha é 2"
+
+
+def test_truncated_stream_returns_only_closed_fields():
+    parser = IncrementalJSONParser()
+    parser.feed('{"summary": "ok", "insights": {"a": [1, 2')
+
+    assert parser.result() == {"summary": "ok"}
+
+
+def test_sse_event_format():
+    assert sse_event({"type": "field", "value": 1}, "field") == 'event: field\ndata: {"type": "field", "value": 1}\n\n'
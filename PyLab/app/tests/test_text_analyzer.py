@@ -0,0 +1,314 @@
+import pytest
+
+from PyLab.app.models import text_analyzer as text_analyzer_module
+from PyLab.app.models.text_analyzer import AnalysisType, TextAnalysisRequest, TextAnalyzer
+
+
+def _analyzer(monkeypatch, calls):
+    analyzer = TextAnalyzer()
+    analyzer.local_routing = False
+
+    async def fake_complete(model, system_prompt, user_prompt, max_tokens=2000):
+        calls.append(user_prompt)
+        return {"insights": {}, "summary": f"resumo {len(calls)}", "confidence_score": 0.9, "recommendations": []}, 10
+
+    monkeypatch.setattr(analyzer, "_complete_json", fake_complete)
+    return analyzer
+
+
+def _document(middle):
+    return " ".join(["início"] * 200 + [middle] + ["fim"] * 200)
+
+
+def test_cache_key_covers_the_full_text():
+    analyzer = TextAnalyzer()
+    system_prompt = analyzer.prompts[AnalysisType.SENTIMENT]
+    first = TextAnalysisRequest(text=_document("alfa"), analysis_type=AnalysisType.SENTIMENT)
+    second = TextAnalysisRequest(text=_document("beta"), analysis_type=AnalysisType.SENTIMENT)
+    spaced = TextAnalysisRequest(text=_document("alfa").replace(" ", "   "), analysis_type=AnalysisType.SENTIMENT)
+
+    assert analyzer._cache_key(first, system_prompt) != analyzer._cache_key(second, system_prompt)
+    # Normalização: diferenças só de espaços usam a mesma entrada
+    assert analyzer._cache_key(first, system_prompt) == analyzer._cache_key(spaced, system_prompt)
+
+
+@pytest.mark.asyncio
+async def test_documents_differing_in_the_middle_do_not_share_cache(monkeypatch):
+    # Orçamento pequeno: o user prompt de ambos é cortado no mesmo prefixo/sufixo
+    monkeypatch.setattr(text_analyzer_module, "prepare_input", lambda text, model, *a, **kw: text[:50])
+    calls = []
+    analyzer = _analyzer(monkeypatch, calls)
+
+    first = await analyzer.analyze(TextAnalysisRequest(text=_document("alfa"), analysis_type=AnalysisType.SENTIMENT))
+    second = await analyzer.analyze(TextAnalysisRequest(text=_document("beta"), analysis_type=AnalysisType.SENTIMENT))
+
+    assert not second.metadata["cache_hit"]
+    assert (first.summary, second.summary) == ("resumo 1", "resumo 2")
+
+
+@pytest.mark.asyncio
+async def test_map_reduce_does_not_truncate_the_full_text(monkeypatch):
+    prepared = []
+    original_prepare = text_analyzer_module.prepare_input
+
+    def recording_prepare(text, model, *args, **kwargs):
+        prepared.append(text)
+        return original_prepare(text, model, *args, **kwargs)
+
+    monkeypatch.setattr(text_analyzer_module, "prepare_input", recording_prepare)
+    calls = []
+    analyzer = _analyzer(monkeypatch, calls)
+    analyzer.long_document_tokens = 100
+    analyzer.chunk_tokens = 60
+
+    text = _document("meio")
+    result = await analyzer.analyze(TextAnalysisRequest(text=text, analysis_type=AnalysisType.DOCUMENT_SUMMARY))
+
+    assert len(calls) > 2
+    assert text not in prepared
+    # Só ajustes das partes são reportados, nunca um corte do documento inteiro
+    assert all(trim["original_tokens"] <= analyzer.chunk_tokens for trim in result.metadata.get("prompt_trims", []))
+
+
+MULTI_TYPES = [AnalysisType.BUSINESS_INSIGHTS, AnalysisType.DOCUMENT_SUMMARY, AnalysisType.COMPETITOR_ANALYSIS]
+
+
+def _multi_analyzer(monkeypatch, calls, omit=()):
+    analyzer = TextAnalyzer()
+    analyzer.local_routing = False
+    prompt_types = {analyzer.prompts[t]: t for t in MULTI_TYPES}
+
+    async def fake_complete(model, system_prompt, user_prompt, max_tokens=2000):
+        if system_prompt in prompt_types:
+            analysis_type = prompt_types[system_prompt]
+            calls.append(([analysis_type], max_tokens))
+            return {"insights": {}, "summary": f"individual {analysis_type.value}", "confidence_score": 0.8}, 10
+        group = [t for t in MULTI_TYPES if f'"{t.value}"' in system_prompt]
+        calls.append((group, max_tokens))
+        return {
+            t.value: {"insights": {}, "summary": f"combinado {t.value}", "confidence_score": 0.9}
+            for t in group if t not in omit
+        }, 30
+
+    monkeypatch.setattr(analyzer, "_complete_json", fake_complete)
+    return analyzer
+
+
+@pytest.mark.asyncio
+async def test_multi_analysis_keeps_the_single_type_budget(monkeypatch):
+    calls = []
+    analyzer = _multi_analyzer(monkeypatch, calls)
+    request = TextAnalysisRequest(text="Relatório trimestral", analysis_type=AnalysisType.SENTIMENT)
+
+    results = await analyzer.analyze_multi(request, MULTI_TYPES)
+
+    # 4096 tokens de saída comportam dois tipos de 2000; o terceiro vai sozinho
+    assert sorted((len(group), max_tokens) for group, max_tokens in calls) == [(1, 2000), (2, 4000)]
+    assert [r.analysis_type for r in results] == MULTI_TYPES
+    assert all(r.summary for r in results)
+
+
+@pytest.mark.asyncio
+async def test_multi_analysis_falls_back_for_missing_keys(monkeypatch):
+    calls = []
+    analyzer = _multi_analyzer(monkeypatch, calls, omit={AnalysisType.DOCUMENT_SUMMARY})
+    analyzer.multi_max_tokens = 6000
+    request = TextAnalysisRequest(text="Relatório trimestral", analysis_type=AnalysisType.SENTIMENT)
+
+    results = {r.analysis_type: r for r in await analyzer.analyze_multi(request, MULTI_TYPES)}
+
+    assert calls == [(MULTI_TYPES, 6000), ([AnalysisType.DOCUMENT_SUMMARY], 2000)]
+    assert results[AnalysisType.DOCUMENT_SUMMARY].summary == "individual document_summary"
+    assert results[AnalysisType.DOCUMENT_SUMMARY].metadata["multi_fallback"]
+    assert results[AnalysisType.DOCUMENT_SUMMARY].metadata["tokens_used"] == 30 // 3 + 10
+    assert results[AnalysisType.BUSINESS_INSIGHTS].summary == "combinado business_insights"
+
+    # O resultado refeito vai para o cache do tipo
+    cached = await analyzer.analyze_multi(request, [AnalysisType.DOCUMENT_SUMMARY])
+    assert len(calls) == 2
+    assert cached[0].summary == "individual document_summary"
+
+
+# === Caminho local (classificador de sentimento) ===
+
+class FakeClassifier:
+    model_name = "fake/sentiment"
+    available = True
+
+    def __init__(self, label="positivo", confidence=0.95):
+        self.prediction = {
+            "label": label,
+            "confidence": confidence,
+            "scores": {
+                name: confidence if name == label else (1 - confidence) / 2
+                for name in ("positivo", "neutro", "negativo")
+            }
+        }
+        self.calls = []
+
+    async def classify(self, text):
+        self.calls.append(text)
+        return self.prediction
+
+
+def _local_analyzer(monkeypatch, llm_calls, classifier):
+    analyzer = _analyzer(monkeypatch, llm_calls)
+    analyzer.local_routing = True
+    analyzer.local_classifier = classifier
+    analyzer.local_max_tokens = 10
+    return analyzer
+
+
+@pytest.mark.asyncio
+async def test_local_routing_stops_at_the_token_limit(monkeypatch):
+    llm_calls, classifier = [], FakeClassifier()
+    analyzer = _local_analyzer(monkeypatch, llm_calls, classifier)
+
+    short = await analyzer.analyze(TextAnalysisRequest(text="Produto ótimo!", analysis_type=AnalysisType.SENTIMENT))
+    long = await analyzer.analyze(
+        TextAnalysisRequest(text="Produto ótimo, entrega rápida e suporte atencioso. " * 3, analysis_type=AnalysisType.SENTIMENT)
+    )
+
+    assert short.metadata["local_model"] and short.metadata["model_used"] == "fake/sentiment"
+    assert short.metadata["tokens_used"] == 0
+    assert not long.metadata.get("local_model")
+    assert classifier.calls == ["Produto ótimo!"]
+    assert len(llm_calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_low_confidence_is_escalated_to_the_llm(monkeypatch):
+    llm_calls, classifier = [], FakeClassifier(confidence=0.6)
+    analyzer = _local_analyzer(monkeypatch, llm_calls, classifier)
+
+    result = await analyzer.analyze(TextAnalysisRequest(text="Sei lá.", analysis_type=AnalysisType.SENTIMENT))
+
+    assert result.metadata["escalated"] and result.metadata["local_confidence"] == 0.6
+    assert len(llm_calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_local_result_follows_the_prompt_schema(monkeypatch):
+    analyzer = _local_analyzer(monkeypatch, [], FakeClassifier(label="negativo", confidence=0.9))
+
+    sentiment = await analyzer.analyze(TextAnalysisRequest(text="Péssimo.", analysis_type=AnalysisType.SENTIMENT))
+    feedback = await analyzer.analyze(TextAnalysisRequest(text="Péssimo.", analysis_type=AnalysisType.CUSTOMER_FEEDBACK))
+
+    assert set(sentiment.insights) == {
+        "sentiment_overall", "sentiment_score", "emotions_detected", "key_themes", "urgency_level", "sentiment_scores"
+    }
+    assert sentiment.insights["sentiment_overall"] == "negativo"
+    assert sentiment.insights["sentiment_score"] == pytest.approx(0.05 + 0.5 * 0.05)
+    assert set(feedback.insights) == {
+        "satisfaction_level", "common_complaints", "praised_features", "improvement_requests",
+        "churn_risk", "loyalty_indicators", "nps_sentiment", "sentiment_scores"
+    }
+    assert (feedback.insights["satisfaction_level"], feedback.insights["nps_sentiment"]) == ("baixa", "detrator")
+    for result in (sentiment, feedback):
+        assert result.confidence_score == 0.9
+        assert result.recommendations == []
+        assert "negativo" in result.summary
+
+
+@pytest.mark.asyncio
+async def test_local_results_use_their_own_cache_entry(monkeypatch):
+    llm_calls, classifier = [], FakeClassifier()
+    analyzer = _local_analyzer(monkeypatch, llm_calls, classifier)
+    request = TextAnalysisRequest(text="Produto ótimo!", analysis_type=AnalysisType.SENTIMENT)
+    system_prompt = analyzer.prompts[AnalysisType.SENTIMENT]
+    cache_key, cache_scope = analyzer._cache_key(request, system_prompt), analyzer._cache_scope(request, system_prompt)
+
+    await analyzer.analyze(request)
+
+    local_key, local_scope = analyzer._local_cache_entry(cache_key, cache_scope)
+    assert (local_key, local_scope) != (cache_key, cache_scope)
+    assert (await analyzer.response_cache.get(cache_key, cache_scope, request.text))[0] is None
+    assert (await analyzer.response_cache.get(local_key, local_scope, request.text))[0] is not None
+
+    # Segunda chamada elegível: hit no cache local, sem reclassificar
+    cached = await analyzer.analyze(request)
+    assert cached.metadata["cache_hit"] and cached.metadata["local_model"]
+    assert len(classifier.calls) == 1
+
+    # Sem o caminho local, o resultado reduzido não responde pela análise do LLM
+    analyzer.local_routing = False
+    full = await analyzer.analyze(request)
+    assert not full.metadata["cache_hit"]
+    assert len(llm_calls) == 1
+
+
+# === Conversas incrementais ===
+
+def _messages(count, first="Olá, preciso de ajuda com o pedido"):
+    messages = [{"role": "user", "content": first}]
+    messages += [
+        {"role": "assistant" if i % 2 else "user", "content": f"mensagem {i}"} for i in range(1, count)
+    ]
+    return messages
+
+
+@pytest.mark.asyncio
+async def test_conversation_update_sends_only_new_messages(monkeypatch):
+    calls = []
+    analyzer = _analyzer(monkeypatch, calls)
+
+    first = await analyzer.analyze_conversation(_messages(3), conversation_id="c1")
+    update = await analyzer.analyze_conversation(_messages(5), conversation_id="c1")
+
+    assert not first.metadata["incremental"]
+    assert update.metadata["incremental"] and update.metadata["new_messages"] == 2
+    delta_prompt = calls[-1]
+    assert "mensagem 3" in delta_prompt and "mensagem 4" in delta_prompt
+    assert "preciso de ajuda" not in delta_prompt and "mensagem 2" not in delta_prompt
+    # A análise anterior vai junto, no lugar do histórico
+    assert "resumo 1" in delta_prompt
+
+    # Sem mensagens novas: nada é enviado
+    await analyzer.analyze_conversation(_messages(5), conversation_id="c1")
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_conversation_full_refresh_after_n_updates(monkeypatch):
+    calls = []
+    analyzer = _analyzer(monkeypatch, calls)
+    analyzer.conversation_full_refresh = 2
+
+    results = [
+        await analyzer.analyze_conversation(_messages(count), conversation_id="c1")
+        for count in (2, 3, 4, 5, 6)
+    ]
+
+    assert [r.metadata["incremental"] for r in results] == [False, True, True, False, True]
+    assert "preciso de ajuda" in calls[3]
+
+
+@pytest.mark.asyncio
+async def test_conversation_with_a_different_history_is_reanalysed(monkeypatch):
+    calls = []
+    analyzer = _analyzer(monkeypatch, calls)
+
+    await analyzer.analyze_conversation(_messages(3), conversation_id="c1")
+    edited = await analyzer.analyze_conversation(_messages(4, first="Outro assunto"), conversation_id="c1")
+    shorter = await analyzer.analyze_conversation(_messages(2, first="Outro assunto"), conversation_id="c1")
+
+    assert not edited.metadata["incremental"] and not shorter.metadata["incremental"]
+    assert "Outro assunto" in calls[1]
+
+
+@pytest.mark.asyncio
+async def test_expired_conversations_release_their_locks(monkeypatch):
+    analyzer = _analyzer(monkeypatch, [])
+
+    await analyzer.analyze_conversation(_messages(2), conversation_id="old")
+    await analyzer.analyze_conversation(_messages(2), conversation_id="stale")
+    analyzer._conversations["old"].updated_at -= analyzer.conversation_ttl + 1
+    analyzer._conversations["stale"].updated_at -= analyzer.conversation_ttl + 1
+
+    assert analyzer._get_conversation_state("old") is None
+    assert "old" not in analyzer._conversation_locks
+
+    # Estados expirados que ninguém consulta saem na próxima gravação
+    await analyzer.analyze_conversation(_messages(2), conversation_id="new")
+    assert list(analyzer._conversations) == ["new"]
+    assert set(analyzer._conversation_locks) == {"new"}
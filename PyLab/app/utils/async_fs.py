@@ -0,0 +1,218 @@
+"""
+🤖 PyLab - Async Filesystem
+Operações de filesystem sem bloquear o event loop
+"""
+
+import os
+import asyncio
+import contextlib
+import functools
+import logging
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger("PyLab.AsyncFS")
+
+PathLike = Union[str, Path]
+
+# Pool dedicado: I/O de storage lento não disputa threads com o executor padrão
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("STORAGE_IO_THREADS", "16")),
+    thread_name_prefix="pylab-fs"
+)
+
+SCAN_BATCH_SIZE = 256
+
+
+async def run_io(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Executar chamada bloqueante de filesystem no pool de I/O"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def _stat_or_none(path: PathLike) -> Optional[os.stat_result]:
+    try:
+        return os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+async def stat(path: PathLike) -> Optional[os.stat_result]:
+    """stat() de um caminho; None se não existir"""
+    return await run_io(_stat_or_none, path)
+
+
+async def stat_many(paths: Iterable[PathLike]) -> List[Optional[os.stat_result]]:
+    """
+    stat() de vários caminhos com um único salto de thread
+
+    Args:
+        paths: Caminhos a consultar
+
+    Returns:
+        Lista na mesma ordem, com None para caminhos inexistentes
+    """
+    paths = list(paths)
+    if not paths:
+        return []
+    return await run_io(lambda: [_stat_or_none(p) for p in paths])
+
+
+async def unlink(path: PathLike) -> bool:
+    """Remover arquivo; retorna True se existia"""
+    def _unlink() -> bool:
+        try:
+            os.unlink(path)
+            return True
+        except FileNotFoundError:
+            return False
+    return await run_io(_unlink)
+
+
+async def makedirs(path: PathLike, mode: Optional[int] = None):
+    """Criar diretório (e pais) se não existir"""
+    def _makedirs():
+        os.makedirs(path, exist_ok=True)
+        if mode is not None:
+            os.chmod(path, mode)
+    await run_io(_makedirs)
+
+
+async def read_bytes(path: PathLike) -> bytes:
+    """Ler arquivo completo"""
+    return await run_io(Path(path).read_bytes)
+
+
+async def scan_dir(
+    directory: PathLike,
+    name_prefix: str = "",
+    batch_size: int = SCAN_BATCH_SIZE,
+    recursive: bool = False
+) -> AsyncIterator[Tuple[Path, os.stat_result]]:
+    """
+    Percorrer arquivos de um diretório sem bloquear o event loop
+
+    As entradas são lidas com os.scandir em lotes de ``batch_size``
+    (incluindo o stat), um salto de thread por lote.
+
+    Args:
+        directory: Diretório inicial
+        name_prefix: Filtro de nome das entradas do diretório inicial
+        batch_size: Entradas por salto de thread
+        recursive: Descer nos subdiretórios (exceto ocultos, ex.: ``.blobs``)
+
+    Yields:
+        Tuplas (caminho, stat) apenas de arquivos regulares
+    """
+    try:
+        iterator = await run_io(os.scandir, directory)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+
+    # Iteradores abertos (busca em profundidade); o prefixo só vale no primeiro nível
+    stack = [(iterator, name_prefix)]
+
+    def _next_batch() -> List[Tuple[Path, os.stat_result]]:
+        batch = []
+        while stack and len(batch) < batch_size:
+            current, prefix = stack[-1]
+            entry = next(current, None)
+            if entry is None:
+                current.close()
+                stack.pop()
+                continue
+            if not entry.name.startswith(prefix):
+                continue
+            try:
+                if entry.is_file():
+                    batch.append((Path(entry.path), entry.stat()))
+                elif recursive and not entry.name.startswith(".") and entry.is_dir(follow_symlinks=False):
+                    stack.append((os.scandir(entry.path), ""))
+            except (FileNotFoundError, NotADirectoryError):
+                # Removido durante a varredura
+                continue
+        return batch
+
+    try:
+        while True:
+            batch = await run_io(_next_batch)
+            if not batch:
+                break
+            for item in batch:
+                yield item
+    finally:
+        for current, _ in stack:
+            current.close()
+
+
+def _temp_path_for(path: Path) -> Path:
+    # Mesmo diretório do destino: os.replace precisa do mesmo filesystem.
+    # Prefixo "." mantém o temporário fora dos padrões de mídia.
+    return path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+
+
+def _write_temp(temp_path: Path, data: bytes):
+    with open(temp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _discard(path: Path):
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+
+
+async def atomic_write(path: PathLike, data: bytes, mode: Optional[int] = None):
+    """
+    Gravar arquivo de forma atômica e segura contra cancelamento
+
+    O conteúdo vai para um temporário no mesmo diretório, recebe fsync e
+    só então é renomeado para o destino com os.replace. Leitores (ex.: o
+    backend Laravel) veem o arquivo antigo ou o novo completo, nunca um
+    arquivo parcial. Se a task for cancelada, o temporário é removido.
+
+    Args:
+        path: Caminho final
+        data: Conteúdo
+        mode: Permissões a aplicar antes do rename (opcional)
+    """
+    path = Path(path)
+    temp_path = _temp_path_for(path)
+    loop = asyncio.get_running_loop()
+
+    def _write():
+        _write_temp(temp_path, data)
+        if mode is not None:
+            os.chmod(temp_path, mode)
+
+    write_future = loop.run_in_executor(_executor, _write)
+    try:
+        # shield: o cancelamento não interrompe a thread, apenas deixa de esperá-la
+        await asyncio.shield(write_future)
+        await run_io(os.replace, temp_path, path)
+    except BaseException:
+        # A thread pode ainda estar escrevendo: limpar quando terminar
+        write_future.add_done_callback(lambda _: _executor.submit(_discard, temp_path))
+        raise
+
+
+async def atomic_copy(src: PathLike, dst: PathLike):
+    """Copiar arquivo para ``dst`` via temporário + rename"""
+    dst = Path(dst)
+    temp_path = _temp_path_for(dst)
+
+    def _copy():
+        try:
+            shutil.copyfile(src, temp_path)
+            with open(temp_path, "rb+") as f:
+                os.fsync(f.fileno())
+            os.replace(temp_path, dst)
+        except BaseException:
+            _discard(temp_path)
+            raise
+
+    await run_io(_copy)
@@ -0,0 +1,286 @@
+"""
+🤖 PyLab - Batch Jobs
+Jobs assíncronos de processamento em lote (JSONL) com checkpoint e retomada
+"""
+
+import json
+import time
+import uuid
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .storage_backends import StorageBackend
+from .streaming import _json_default
+
+logger = logging.getLogger("PyLab.BatchJobs")
+
+# Handler de um item: recebe o payload e retorna (resultado, uso {"tokens", "cost"})
+BatchHandler = Callable[[Dict[str, Any]], Awaitable[Tuple[Dict[str, Any], Dict[str, Any]]]]
+
+# Falhas guardadas no estado do job (as demais ficam só no arquivo de resultados)
+MAX_REPORTED_FAILURES = 100
+
+
+class BatchJobManager:
+    """
+    Gerenciador de jobs em lote.
+
+    O upload JSONL é gravado no backend e processado em janelas de
+    ``window_size`` itens (a vazão fica limitada pelo LLM gateway). Ao fim
+    de cada janela os resultados vão para ``jobs/<id>/results/<janela>.jsonl``
+    e o estado (``jobs/<id>/state.json``) é atualizado - é o checkpoint: um
+    processo reiniciado retoma a partir da primeira janela não gravada.
+
+    Cada item tem resultado próprio ("ok" ou "error"); uma falha não
+    interrompe o job.
+    """
+
+    PREFIX = "jobs"
+
+    def __init__(self, backend: StorageBackend, window_size: int = 50, max_item_retries: int = 1):
+        self.backend = backend
+        self.window_size = window_size
+        self.max_item_retries = max_item_retries
+
+        self._handlers: Dict[str, BatchHandler] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def register(self, job_type: str, handler: BatchHandler):
+        """Registrar o handler de um tipo de job"""
+        self._handlers[job_type] = handler
+
+    async def create_job(self, job_type: str, data: bytes) -> Dict[str, Any]:
+        """
+        Criar e iniciar um job a partir de um upload JSONL
+
+        Args:
+            job_type: Tipo registrado via ``register``
+            data: Conteúdo JSONL (um payload por linha)
+
+        Returns:
+            Estado inicial do job
+        """
+        if job_type not in self._handlers:
+            raise ValueError(f"Tipo de job desconhecido: {job_type}")
+
+        total = sum(1 for line in data.splitlines() if line.strip())
+        if total == 0:
+            raise ValueError("Arquivo JSONL vazio")
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        state = {
+            "job_id": job_id,
+            "job_type": job_type,
+            "status": "queued",
+            "total": total,
+            "processed": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "tokens_used": 0,
+            "cost": 0.0,
+            "next_window": 0,
+            "windows": (total + self.window_size - 1) // self.window_size,
+            "window_size": self.window_size,
+            "elapsed": 0.0,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+            "failures": []
+        }
+
+        await self.backend.put(self._key(job_id, "input.jsonl"), data, "application/x-ndjson")
+        await self._save_state(state)
+        self._start(job_id)
+
+        logger.info(f"Job {job_id} criado: {total} itens ({job_type})")
+        return self._with_metrics(state)
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Estado atual do job, com vazão calculada; None se não existir"""
+        state = await self._load_state(job_id)
+        return self._with_metrics(state) if state else None
+
+    async def list_jobs(self) -> List[Dict[str, Any]]:
+        """Listar jobs (mais recentes primeiro)"""
+        jobs = []
+        for obj in await self.backend.list(self.PREFIX):
+            if obj.key.endswith("/state.json"):
+                state = await self._load_state(obj.key.split("/")[-2])
+                if state:
+                    jobs.append(self._with_metrics(state))
+        return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
+
+    async def cancel_job(self, job_id: str) -> bool:
+        """Cancelar job em andamento (resultados já gravados são mantidos)"""
+        state = await self._load_state(job_id)
+        if state is None or state["status"] not in ("queued", "running"):
+            return False
+
+        task = self._tasks.pop(job_id, None)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            # O checkpoint pode ter avançado até o cancelamento
+            state = await self._load_state(job_id)
+
+        state["status"] = "cancelled"
+        state["finished_at"] = time.time()
+        await self._save_state(state)
+        return True
+
+    async def stream_results(self, job_id: str) -> AsyncIterator[bytes]:
+        """Resultados gravados até agora, em JSONL, na ordem dos itens"""
+        state = await self._load_state(job_id)
+        if state is None:
+            return
+        for window in range(state["next_window"]):
+            yield await self.backend.get(self._window_key(job_id, window))
+
+    async def resume_jobs(self) -> int:
+        """Retomar jobs interrompidos (ex.: após reinício do processo)"""
+        resumed = 0
+        for job in await self.list_jobs():
+            if job["status"] in ("queued", "running") and job["job_id"] not in self._tasks:
+                if job["job_type"] not in self._handlers:
+                    logger.warning(f"Job {job['job_id']} sem handler para {job['job_type']}, não retomado")
+                    continue
+                self._start(job["job_id"])
+                resumed += 1
+        if resumed:
+            logger.info(f"{resumed} job(s) em lote retomado(s)")
+        return resumed
+
+    async def close(self):
+        """Interromper jobs em andamento (retomáveis pelo checkpoint)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    # === MÉTODOS PRIVADOS ===
+
+    def _start(self, job_id: str):
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run(self, job_id: str):
+        state = await self._load_state(job_id)
+        handler = self._handlers[state["job_type"]]
+
+        try:
+            lines = [
+                line for line in (await self.backend.get(self._key(job_id, "input.jsonl"))).splitlines()
+                if line.strip()
+            ]
+
+            state["status"] = "running"
+            await self._save_state(state)
+
+            # Tamanho da janela do próprio job: o checkpoint continua válido se a configuração mudar
+            window_size = state["window_size"]
+            for window in range(state["next_window"], state["windows"]):
+                window_start = time.monotonic()
+                first = window * window_size
+                batch = lines[first:first + window_size]
+
+                outcomes = await asyncio.gather(*[
+                    self._process_item(handler, first + offset, line)
+                    for offset, line in enumerate(batch)
+                ])
+
+                # Resultados antes do estado: o checkpoint só avança com a janela gravada
+                payload = "".join(
+                    json.dumps(outcome, ensure_ascii=False, default=_json_default) + "\n"
+                    for outcome in outcomes
+                ).encode("utf-8")
+                await self.backend.put(self._window_key(job_id, window), payload, "application/x-ndjson")
+
+                for outcome in outcomes:
+                    state["processed"] += 1
+                    state["tokens_used"] += outcome["tokens"]
+                    state["cost"] += outcome["cost"]
+                    if outcome["status"] == "ok":
+                        state["succeeded"] += 1
+                    else:
+                        state["failed"] += 1
+                        if len(state["failures"]) < MAX_REPORTED_FAILURES:
+                            state["failures"].append({"index": outcome["index"], "error": outcome["error"]})
+
+                state["next_window"] = window + 1
+                state["elapsed"] += time.monotonic() - window_start
+                await self._save_state(state)
+
+            state["status"] = "completed"
+            state["finished_at"] = time.time()
+            await self._save_state(state)
+            logger.info(f"Job {job_id} concluído: {state['succeeded']} ok, {state['failed']} com erro")
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Erro no job {job_id}: {e}")
+            state["status"] = "failed"
+            state["error"] = str(e)
+            state["finished_at"] = time.time()
+            await self._save_state(state)
+
+    async def _process_item(self, handler: BatchHandler, index: int, line: bytes) -> Dict[str, Any]:
+        started = time.monotonic()
+        outcome: Dict[str, Any] = {"index": index, "tokens": 0, "cost": 0.0}
+
+        try:
+            payload = json.loads(line)
+        except json.JSONDecodeError as e:
+            return {**outcome, "status": "error", "error": f"JSON inválido: {e}", "processing_time": 0.0}
+
+        for attempt in range(self.max_item_retries + 1):
+            try:
+                result, usage = await handler(payload)
+                outcome.update(
+                    status="ok",
+                    result=result,
+                    tokens=usage.get("tokens", 0),
+                    cost=usage.get("cost", 0.0)
+                )
+                break
+            except Exception as e:
+                # Erros de rate limit/rede já passam pelos retries do gateway
+                outcome.update(status="error", error=str(e))
+                if attempt < self.max_item_retries:
+                    logger.warning(f"Item {index} falhou ({e}), nova tentativa")
+
+        outcome["processing_time"] = time.monotonic() - started
+        return outcome
+
+    def _with_metrics(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        elapsed = state.get("elapsed") or 0.0
+        return {
+            **state,
+            "throughput": state["processed"] / elapsed if elapsed else 0.0,
+            "progress": state["processed"] / state["total"] if state["total"] else 1.0
+        }
+
+    def _key(self, job_id: str, name: str) -> str:
+        return f"{self.PREFIX}/{job_id}/{name}"
+
+    def _window_key(self, job_id: str, window: int) -> str:
+        return self._key(job_id, f"results/{window:06d}.jsonl")
+
+    async def _load_state(self, job_id: str) -> Optional[Dict[str, Any]]:
+        key = self._key(job_id, "state.json")
+        if not await self.backend.exists(key):
+            return None
+        return json.loads(await self.backend.get(key))
+
+    async def _save_state(self, state: Dict[str, Any]):
+        state["updated_at"] = time.time()
+        await self.backend.put(
+            self._key(state["job_id"], "state.json"),
+            json.dumps(state, ensure_ascii=False).encode("utf-8"),
+            "application/json"
+        )
+
@@ -0,0 +1,220 @@
+"""
+🤖 PyLab - Content Deduplication
+Reutilização de conteúdo idêntico via link no backend com contagem de referências
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .async_fs import run_io
+from .storage_backends import StorageBackend
+
+logger = logging.getLogger("PyLab.Dedup")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_digest(data: bytes) -> str:
+    """Calcular SHA-256 do conteúdo processando em blocos"""
+    hasher = hashlib.sha256()
+    view = memoryview(data)
+    for offset in range(0, len(view), HASH_CHUNK_SIZE):
+        hasher.update(view[offset:offset + HASH_CHUNK_SIZE])
+    return hasher.hexdigest()
+
+
+class ContentDeduplicator:
+    """
+    Armazena cada conteúdo distinto uma única vez sob ``blob_prefix``.
+
+    As chaves nomeadas (images/, videos/) são criadas com ``backend.link``:
+    hard link ou reflink no filesystem local, cópia server-side no S3.
+    A contagem de referências fica no índice SQLite e o blob só é
+    removido quando a última referência é liberada.
+
+    Hard links também compartilham o mtime: a data de gravação de cada
+    chave fica em ``content_refs.stored_at`` (``stored_at()``), nunca no stat.
+
+    Como hard links compartilham o inode, arquivos deduplicados nunca
+    devem ser modificados no lugar - qualquer transformação deve ocorrer
+    antes de ``store``.
+    """
+
+    def __init__(self, backend: StorageBackend, db_path: Path, blob_prefix: str = ".blobs"):
+        self.backend = backend
+        self.blob_prefix = blob_prefix.rstrip("/")
+
+        self._db_lock = threading.Lock()
+        self._digest_locks: Dict[str, asyncio.Lock] = {}
+        self._key_locks: Dict[str, asyncio.Lock] = {}
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        """Criar tabelas de blobs e referências"""
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS content_blobs (
+                    digest TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    refcount INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS content_refs (
+                    path TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL REFERENCES content_blobs (digest),
+                    stored_at REAL
+                )
+                """
+            )
+            # Índices criados antes da coluna stored_at
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(content_refs)")}
+            if "stored_at" not in columns:
+                self._conn.execute("ALTER TABLE content_refs ADD COLUMN stored_at REAL")
+
+    async def store(self, data: bytes, key: str, digest: Optional[str] = None) -> Tuple[str, bool]:
+        """
+        Gravar conteúdo em ``key`` reutilizando um blob existente quando possível
+
+        Args:
+            data: Conteúdo do arquivo
+            key: Chave final do arquivo nomeado (ex.: images/img.png)
+            digest: SHA-256 já calculado (opcional)
+
+        Returns:
+            Tupla (digest, reutilizado)
+        """
+        digest = digest or await asyncio.to_thread(content_digest, data)
+
+        blob_key = self._blob_key(digest)
+        # Lock da chave e depois do digest (mesma ordem de release): a
+        # substituição e a nova referência acontecem sem intercalação
+        async with self._lock_for(self._key_locks, key):
+            # Substituir arquivo anterior com o mesmo nome
+            if await self.backend.exists(key):
+                await self.backend.delete(key)
+            await self._release(key)
+
+            async with self._lock_for(self._digest_locks, digest):
+                known = await run_io(self._blob_known, digest)
+                reused = known and await self.backend.exists(blob_key)
+
+                if not reused:
+                    await self.backend.put(blob_key, data)
+
+                await self.backend.link(blob_key, key)
+                await run_io(self._add_ref, key, digest, len(data))
+
+        if reused:
+            logger.info(f"Conteúdo duplicado reutilizado: {key} -> {digest[:12]}")
+        return digest, reused
+
+    async def release(self, key: str) -> bool:
+        """
+        Liberar a referência de ``key`` (o arquivo nomeado já deve ter sido removido)
+
+        Returns:
+            True se o blob foi removido por não ter mais referências
+        """
+        async with self._lock_for(self._key_locks, key):
+            return await self._release(key)
+
+    async def stored_at(self, key: str) -> Optional[float]:
+        """Momento em que ``key`` foi gravada (None se não passou pela deduplicação)"""
+        return await run_io(self._ref_stored_at, key)
+
+    def close(self):
+        self._conn.close()
+
+    # === MÉTODOS PRIVADOS ===
+
+    def _blob_key(self, digest: str) -> str:
+        return f"{self.blob_prefix}/{digest[:2]}/{digest}"
+
+    async def _release(self, key: str) -> bool:
+        """release() sem o lock da chave (o chamador já o detém)"""
+        digest = await run_io(self._ref_digest, key)
+        if digest is None:
+            return False
+
+        async with self._lock_for(self._digest_locks, digest):
+            orphan = await run_io(self._drop_ref, key, digest)
+            if orphan:
+                await self.backend.delete(self._blob_key(digest))
+        return orphan
+
+    @staticmethod
+    def _lock_for(locks: Dict[str, asyncio.Lock], name: str) -> asyncio.Lock:
+        # Locks por chave/digest: operações sobre nomes diferentes não se bloqueiam
+        lock = locks.get(name)
+        if lock is None:
+            lock = locks[name] = asyncio.Lock()
+        if len(locks) > 4096:
+            for stale in [n for n, l in locks.items() if not l.locked() and n != name]:
+                del locks[stale]
+        return lock
+
+    def _blob_known(self, digest: str) -> bool:
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT refcount FROM content_blobs WHERE digest = ?", (digest,)
+            ).fetchone()
+        return row is not None
+
+    def _add_ref(self, key: str, digest: str, size: int):
+        with self._db_lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO content_blobs (digest, size, refcount) VALUES (?, ?, 1)
+                ON CONFLICT(digest) DO UPDATE SET refcount = refcount + 1
+                """,
+                (digest, size)
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO content_refs (path, digest, stored_at) VALUES (?, ?, ?)",
+                (key, digest, time.time())
+            )
+
+    def _drop_ref(self, key: str, digest: str) -> bool:
+        """Remover referência; retorna True se o blob ficou órfão"""
+        with self._db_lock, self._conn:
+            deleted = self._conn.execute(
+                "DELETE FROM content_refs WHERE path = ?", (key,)
+            ).rowcount
+            if not deleted:
+                return False
+            self._conn.execute(
+                "UPDATE content_blobs SET refcount = refcount - 1 WHERE digest = ?", (digest,)
+            )
+            row = self._conn.execute(
+                "SELECT refcount FROM content_blobs WHERE digest = ?", (digest,)
+            ).fetchone()
+            if row is None or row[0] > 0:
+                return False
+            self._conn.execute("DELETE FROM content_blobs WHERE digest = ?", (digest,))
+        return True
+
+    def _ref_digest(self, key: str) -> Optional[str]:
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT digest FROM content_refs WHERE path = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _ref_stored_at(self, key: str) -> Optional[float]:
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT stored_at FROM content_refs WHERE path = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
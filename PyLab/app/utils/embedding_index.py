@@ -0,0 +1,304 @@
+"""
+🤖 PyLab - Embedding Index
+Índice persistente de embeddings CLIP (memmap + SQLite) para busca visual
+"""
+
+import os
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .async_fs import run_io
+
+logger = logging.getLogger("PyLab.EmbeddingIndex")
+
+try:
+    import hnswlib
+    HNSWLIB_AVAILABLE = True
+except ImportError:
+    HNSWLIB_AVAILABLE = False
+
+# Linhas lidas do memmap por bloco na busca exata
+SCAN_BLOCK_ROWS = 65_536
+INITIAL_CAPACITY = 1_024
+
+
+class EmbeddingIndex:
+    """
+    Índice de vetores normalizados (float32) com chave pelo nome do arquivo no storage.
+
+    Os vetores ficam em ``vectors.f32`` (np.memmap, capacidade dobrada quando
+    enche) e o mapeamento chave -> linha em ``embeddings.db`` (SQLite). A busca
+    padrão é exata: produto interno em blocos de ``SCAN_BLOCK_ROWS`` linhas,
+    sem carregar o arquivo inteiro. Com ``ann=True`` e hnswlib instalado, um
+    grafo HNSW (``hnsw.bin``) atende as buscas e a varredura exata fica como
+    fallback.
+
+    Linhas removidas não são reaproveitadas; o vetor é zerado e a chave sai
+    do mapeamento.
+    """
+
+    def __init__(self, index_dir: Path, dim: int = 512, ann: bool = False):
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.vectors_path = self.index_dir / "vectors.f32"
+        self.ann_path = self.index_dir / "hnsw.bin"
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.index_dir / "embeddings.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+        # Mapeamentos em memória (linha -> chave e chave -> linha)
+        self._rows: Dict[str, int] = {}
+        self._keys: List[Optional[str]] = []
+        for key, row in self._conn.execute("SELECT key, row FROM embedding_rows ORDER BY row"):
+            self._rows[key] = row
+        self._size = max(self._rows.values(), default=-1) + 1
+        self._keys = [None] * self._size
+        for key, row in self._rows.items():
+            self._keys[row] = key
+
+        self._vectors = self._open_vectors(max(INITIAL_CAPACITY, self._size))
+
+        self._ann = None
+        if ann:
+            if HNSWLIB_AVAILABLE:
+                self._open_ann()
+            else:
+                logger.warning("hnswlib não instalado, usando busca exata")
+
+        logger.info(f"Índice de embeddings: {len(self._rows)} vetores em {self.index_dir}")
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    # === API ===
+
+    async def add(self, key: str, vector: np.ndarray):
+        """Inserir ou substituir o vetor de uma chave (normalizado aqui)"""
+        await run_io(self._add, key, vector)
+
+    async def remove(self, key: str) -> bool:
+        """Remover uma chave do índice"""
+        return await run_io(self._remove, key)
+
+    async def get(self, key: str) -> Optional[np.ndarray]:
+        """Vetor armazenado de uma chave (cópia) ou None"""
+        return await run_io(self._get, key)
+
+    async def get_many(self, keys: List[str]) -> Tuple[np.ndarray, List[str]]:
+        """
+        Vetores de várias chaves
+
+        Returns:
+            Tupla (matriz (n, dim) das chaves encontradas, chaves ausentes)
+        """
+        return await run_io(self._get_many, keys)
+
+    async def search(
+        self,
+        query: np.ndarray,
+        k: int = 10,
+        exclude: Optional[str] = None,
+        min_score: Optional[float] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Chaves mais próximas de um vetor (similaridade de cosseno)
+
+        Args:
+            query: Vetor de consulta (imagem ou texto CLIP)
+            k: Quantidade de resultados
+            exclude: Chave a ignorar (ex.: a própria imagem consultada)
+            min_score: Similaridade mínima (busca de quase duplicatas)
+
+        Returns:
+            Lista (chave, similaridade) em ordem decrescente
+        """
+        return await run_io(self._search, query, k, exclude, min_score)
+
+    async def flush(self):
+        """Persistir vetores e grafo ANN no disco"""
+        await run_io(self._flush)
+
+    async def close(self):
+        """Persistir e fechar o índice"""
+        await self.flush()
+        with self._lock:
+            self._conn.close()
+
+    # === MÉTODOS PRIVADOS ===
+
+    def _create_schema(self):
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embedding_rows (
+                    key TEXT PRIMARY KEY,
+                    row INTEGER NOT NULL UNIQUE
+                )
+                """
+            )
+
+    def _open_vectors(self, capacity: int) -> np.memmap:
+        """Abrir (criando ou aumentando) o arquivo de vetores com ``capacity`` linhas"""
+        size = capacity * self.dim * 4
+        with open(self.vectors_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+            else:
+                capacity = f.tell() // (self.dim * 4)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _normalize(self, vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        if vector.shape[0] != self.dim:
+            raise ValueError(f"Dimensão do vetor ({vector.shape[0]}) difere do índice ({self.dim})")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _add(self, key: str, vector: np.ndarray):
+        vector = self._normalize(vector)
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                row = self._size
+                if row >= self._vectors.shape[0]:
+                    self._vectors.flush()
+                    self._vectors = self._open_vectors(self._vectors.shape[0] * 2)
+                self._size += 1
+                self._keys.append(key)
+                self._rows[key] = row
+                with self._conn:
+                    self._conn.execute("INSERT INTO embedding_rows (key, row) VALUES (?, ?)", (key, row))
+            self._vectors[row] = vector
+
+            if self._ann is not None:
+                if self._size > self._ann.get_max_elements():
+                    self._ann.resize_index(max(self._size, self._ann.get_max_elements() * 2))
+                self._ann.add_items(vector.reshape(1, -1), np.array([row]))
+
+    def _remove(self, key: str) -> bool:
+        with self._lock:
+            row = self._rows.pop(key, None)
+            if row is None:
+                return False
+            self._keys[row] = None
+            self._vectors[row] = 0.0
+            with self._conn:
+                self._conn.execute("DELETE FROM embedding_rows WHERE key = ?", (key,))
+            if self._ann is not None:
+                try:
+                    self._ann.mark_deleted(row)
+                except RuntimeError:
+                    pass
+            return True
+
+    def _get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._rows.get(key)
+            return np.array(self._vectors[row]) if row is not None else None
+
+    def _get_many(self, keys: List[str]) -> Tuple[np.ndarray, List[str]]:
+        with self._lock:
+            rows = [self._rows[key] for key in keys if key in self._rows]
+            missing = [key for key in keys if key not in self._rows]
+            return np.array(self._vectors[rows]).reshape(len(rows), self.dim), missing
+
+    def _search(
+        self,
+        query: np.ndarray,
+        k: int,
+        exclude: Optional[str],
+        min_score: Optional[float]
+    ) -> List[Tuple[str, float]]:
+        query = self._normalize(query)
+        with self._lock:
+            if not self._rows:
+                return []
+            # Uma vaga extra para a chave excluída
+            wanted = min(k + (1 if exclude else 0), len(self._rows))
+
+            if self._ann is not None:
+                labels, distances = self._ann.knn_query(query.reshape(1, -1), k=wanted)
+                candidates = [(int(row), 1.0 - float(d)) for row, d in zip(labels[0], distances[0])]
+            else:
+                candidates = self._scan(query, wanted)
+
+            results = []
+            for row, score in candidates:
+                key = self._keys[row] if row < len(self._keys) else None
+                if key is None or key == exclude:
+                    continue
+                if min_score is not None and score < min_score:
+                    continue
+                results.append((key, score))
+            return results[:k]
+
+    def _scan(self, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Busca exata em blocos; mantém só os k melhores candidatos de cada bloco"""
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+
+        for start in range(0, self._size, SCAN_BLOCK_ROWS):
+            end = min(start + SCAN_BLOCK_ROWS, self._size)
+            scores = self._vectors[start:end] @ query
+            # Linhas removidas (vetor zerado) nunca entram no resultado
+            valid = np.fromiter((key is not None for key in self._keys[start:end]), bool, end - start)
+            scores[~valid] = -np.inf
+
+            take = min(k, end - start)
+            top = np.argpartition(-scores, take - 1)[:take]
+            best_rows = np.concatenate([best_rows, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+
+            if len(best_rows) > k:
+                keep = np.argpartition(-best_scores, k - 1)[:k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        order = np.argsort(-best_scores)
+        return [
+            (int(best_rows[i]), float(best_scores[i]))
+            for i in order if np.isfinite(best_scores[i])
+        ]
+
+    def _open_ann(self):
+        """Carregar o grafo HNSW salvo ou construí-lo a partir dos vetores"""
+        capacity = max(INITIAL_CAPACITY, self._size * 2)
+        self._ann = hnswlib.Index(space="ip", dim=self.dim)
+
+        if self.ann_path.exists():
+            try:
+                self._ann.load_index(str(self.ann_path), max_elements=capacity)
+                if self._ann.get_current_count() == self._size:
+                    self._ann.set_ef(int(os.getenv("EMBEDDING_INDEX_EF", "64")))
+                    return
+                logger.warning("Grafo HNSW desatualizado, reconstruindo")
+                self._ann = hnswlib.Index(space="ip", dim=self.dim)
+            except RuntimeError as e:
+                logger.warning(f"Erro ao carregar grafo HNSW ({e}), reconstruindo")
+                self._ann = hnswlib.Index(space="ip", dim=self.dim)
+
+        self._ann.init_index(max_elements=capacity, ef_construction=200, M=16)
+        self._ann.set_ef(int(os.getenv("EMBEDDING_INDEX_EF", "64")))
+        for start in range(0, self._size, SCAN_BLOCK_ROWS):
+            end = min(start + SCAN_BLOCK_ROWS, self._size)
+            self._ann.add_items(np.array(self._vectors[start:end]), np.arange(start, end))
+        for row, key in enumerate(self._keys):
+            if key is None:
+                self._ann.mark_deleted(row)
+
+    def _flush(self):
+        with self._lock:
+            self._vectors.flush()
+            if self._ann is not None:
+                self._ann.save_index(str(self.ann_path))
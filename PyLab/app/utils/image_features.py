@@ -0,0 +1,214 @@
+"""
+🤖 PyLab - Image Features
+Extração de características OpenCV compartilhada por requisição (calculadas uma vez)
+"""
+
+import os
+import logging
+from functools import cached_property
+from typing import Dict, List, Tuple, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger("PyLab.ImageFeatures")
+
+# Maior lado da cópia de trabalho (as análises não rodam na resolução original)
+IMAGE_FEATURE_MAX_SIDE = int(os.getenv("IMAGE_FEATURE_MAX_SIDE", "1024"))
+
+# Amostra reduzida para a paleta de cores
+COLOR_SAMPLE_SIZE = (128, 128)
+
+# Bits por canal do histograma 3D de cores (5 -> 32x32x32 células)
+PALETTE_HISTOGRAM_BITS = 5
+PALETTE_MAX_ITER = 20
+
+
+def dominant_palette(pixels: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Paleta dominante determinística: histograma 3D quantizado + k-means ponderado
+
+    Os pixels são agrupados em células do histograma (cada célula representada
+    pela cor média dos seus pixels); o k-means roda sobre as células, com peso
+    pela contagem, semeado por k-means++ determinístico (a próxima semente é a
+    célula de maior peso × distância² até as sementes já escolhidas).
+    Mesma entrada, mesma paleta - o resultado pode ser cacheado.
+
+    Args:
+        pixels: Array (N, 3) RGB
+        k: Quantidade de cores
+
+    Returns:
+        Tupla (centros (k', 3), fração de pixels de cada centro), da mais
+        frequente para a menos; k' < k se a imagem tiver menos cores distintas
+    """
+    pixels = pixels.reshape(-1, 3)
+    shift = 8 - PALETTE_HISTOGRAM_BITS
+    quantized = pixels.astype(np.uint32) >> shift
+    cells = (quantized[:, 0] << (2 * PALETTE_HISTOGRAM_BITS)) | (quantized[:, 1] << PALETTE_HISTOGRAM_BITS) | quantized[:, 2]
+
+    occupied, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+    weights = counts.astype(np.float64)
+    colors = np.stack([
+        np.bincount(inverse.reshape(-1), weights=pixels[:, channel].astype(np.float64), minlength=len(occupied))
+        for channel in range(3)
+    ], axis=1) / weights[:, None]
+
+    k = min(k, len(occupied))
+
+    # Sementes (k-means++ sem aleatoriedade)
+    centers = [colors[np.argmax(weights)]]
+    distances = ((colors - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        centers.append(colors[np.argmax(weights * distances)])
+        distances = np.minimum(distances, ((colors - centers[-1]) ** 2).sum(axis=1))
+    centers = np.array(centers)
+
+    # Lloyd ponderado sobre as células
+    for _ in range(PALETTE_MAX_ITER):
+        labels = ((colors[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        cluster_weights = np.bincount(labels, weights=weights, minlength=k)
+        sums = np.stack([np.bincount(labels, weights=weights * colors[:, c], minlength=k) for c in range(3)], axis=1)
+        updated = np.where(cluster_weights[:, None] > 0, sums / np.maximum(cluster_weights, 1e-12)[:, None], centers)
+        if np.allclose(updated, centers, atol=0.5):
+            centers = updated
+            break
+        centers = updated
+
+    fractions = cluster_weights / weights.sum()
+    order = np.argsort(-fractions, kind="stable")
+    return centers[order].astype(np.float32), fractions[order]
+
+
+class ImageFeatureContext:
+    """
+    Características de uma imagem calculadas sob demanda e reaproveitadas.
+
+    Tudo é derivado de uma cópia RGB com o maior lado limitado a
+    ``max_side`` (INTER_AREA). Tons de cinza, histograma, Laplaciano,
+    bordas (por par de limiares), pirâmide, paleta de cores etc. são
+    calculados na primeira leitura e servem todas as análises da mesma
+    requisição (ImageAnalyzer e ImageInputProcessor).
+
+    Medidas em pixels (bboxes, áreas) ficam na escala da cópia de
+    trabalho; ``scale`` converte para a imagem original.
+    """
+
+    def __init__(self, image: Union[Image.Image, np.ndarray], max_side: int = IMAGE_FEATURE_MAX_SIDE):
+        rgb = np.asarray(image.convert("RGB")) if isinstance(image, Image.Image) else np.asarray(image)
+        height, width = rgb.shape[:2]
+        self.original_size: Tuple[int, int] = (width, height)
+
+        factor = max_side / max(width, height)
+        if factor < 1:
+            rgb = cv2.resize(
+                rgb, (max(1, round(width * factor)), max(1, round(height * factor))),
+                interpolation=cv2.INTER_AREA
+            )
+        else:
+            factor = 1.0
+        # Fator cópia de trabalho -> original
+        self.scale = 1.0 / factor
+        self.rgb = np.ascontiguousarray(rgb)
+
+        self._edges: Dict[Tuple[int, int], np.ndarray] = {}
+        self._palettes: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(largura, altura) da cópia de trabalho"""
+        return self.rgb.shape[1], self.rgb.shape[0]
+
+    @cached_property
+    def gray(self) -> np.ndarray:
+        return cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY)
+
+    @cached_property
+    def gray_float(self) -> np.ndarray:
+        return self.gray.astype(np.float32)
+
+    @cached_property
+    def mean_rgb(self) -> np.ndarray:
+        return self.rgb.reshape(-1, 3).mean(axis=0)
+
+    @cached_property
+    def brightness(self) -> float:
+        return float(self.gray.mean())
+
+    @cached_property
+    def contrast(self) -> float:
+        return float(self.gray.std())
+
+    @cached_property
+    def histogram(self) -> np.ndarray:
+        """Histograma de 256 níveis dos tons de cinza"""
+        return cv2.calcHist([self.gray], [0], None, [256], [0, 256])
+
+    @cached_property
+    def laplacian(self) -> np.ndarray:
+        return cv2.Laplacian(self.gray, cv2.CV_64F)
+
+    @cached_property
+    def sharpness(self) -> float:
+        """Variância do Laplaciano"""
+        return float(self.laplacian.var())
+
+    @cached_property
+    def pyramid(self) -> List[np.ndarray]:
+        """Pirâmide gaussiana dos tons de cinza (nível 0 = cópia de trabalho, até ~64px)"""
+        levels = [self.gray]
+        while min(levels[-1].shape[:2]) >= 128:
+            levels.append(cv2.pyrDown(levels[-1]))
+        return levels
+
+    @cached_property
+    def color_sample(self) -> np.ndarray:
+        """Pixels da amostra reduzida (N, 3) em uint8"""
+        return cv2.resize(self.rgb, COLOR_SAMPLE_SIZE, interpolation=cv2.INTER_AREA).reshape(-1, 3)
+
+    @cached_property
+    def symmetry(self) -> float:
+        """Correlação entre a metade esquerda e a direita espelhada"""
+        width = self.gray.shape[1]
+        left_half = self.gray[:, :width // 2]
+        right_half = cv2.flip(self.gray[:, width // 2:], 1)
+        return float(cv2.matchTemplate(
+            left_half, right_half[:, :left_half.shape[1]], cv2.TM_CCOEFF_NORMED
+        )[0][0])
+
+    @cached_property
+    def local_variance(self) -> np.ndarray:
+        """Variância local em janela 9x9 (textura)"""
+        kernel = np.ones((9, 9), np.float32) / 81
+        local_mean = cv2.filter2D(self.gray_float, -1, kernel)
+        return cv2.filter2D((self.gray_float - local_mean) ** 2, -1, kernel)
+
+    @cached_property
+    def otsu_mask(self) -> np.ndarray:
+        """Máscara binária (blur gaussiano + Otsu) para contornos"""
+        blurred = cv2.GaussianBlur(self.gray, (5, 5), 0)
+        _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return thresh
+
+    def edges(self, low: int, high: int) -> np.ndarray:
+        """Bordas Canny (uma vez por par de limiares)"""
+        key = (low, high)
+        if key not in self._edges:
+            self._edges[key] = cv2.Canny(self.gray, low, high)
+        return self._edges[key]
+
+    def edge_density(self, low: int, high: int) -> float:
+        edges = self.edges(low, high)
+        return float(np.count_nonzero(edges) / edges.size)
+
+    def dominant_colors(self, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Cores dominantes da amostra reduzida (``dominant_palette``)
+
+        Returns:
+            Tupla (centros (k, 3), fração de pixels de cada centro), mais frequente primeiro
+        """
+        if k not in self._palettes:
+            self._palettes[k] = dominant_palette(self.color_sample, k)
+        return self._palettes[k]
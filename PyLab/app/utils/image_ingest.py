@@ -0,0 +1,117 @@
+"""
+🤖 PyLab - Image Ingest
+Decodificação de imagens com resolução limitada (draft JPEG), orientação EXIF e entradas por modelo
+"""
+
+import os
+import logging
+from typing import BinaryIO, Optional, Tuple, Union
+
+from PIL import Image
+
+logger = logging.getLogger("PyLab.ImageIngest")
+
+# Maior lado da imagem de trabalho das análises (CLIP usa 224px, BLIP 384px, cores 128px)
+IMAGE_INGEST_MAX_SIDE = int(os.getenv("IMAGE_INGEST_MAX_SIDE", "1024"))
+
+# Lado menor mínimo da entrada de cada modelo
+CLIP_INPUT_SIDE = 224
+BLIP_INPUT_SIDE = 384
+
+# Tag EXIF Orientation -> transposição que deixa a imagem "em pé"
+_EXIF_ORIENTATION = 0x0112
+_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def decode_image(source: Union[BinaryIO, str], max_side: Optional[int] = IMAGE_INGEST_MAX_SIDE) -> Image.Image:
+    """
+    Decodificar uma imagem já reduzida para no máximo ``max_side`` pixels no maior lado
+
+    JPEGs são decodificados em escala reduzida (draft: 1/2, 1/4, 1/8 direto
+    do DCT), os demais formatos usam ``reduce`` antes do filtro final - a
+    resolução cheia nunca é materializada em RGB. A orientação EXIF é
+    aplicada uma vez aqui; o tamanho original (já orientado) fica em
+    ``image.info["original_size"]``.
+
+    Args:
+        source: Arquivo/buffer (ex.: mmap, BytesIO) ou caminho
+        max_side: Limite do maior lado (None ou 0 = sem limite)
+
+    Returns:
+        Imagem RGB
+    """
+    image = Image.open(source)
+    orientation = image.getexif().get(_EXIF_ORIENTATION, 1)
+    original_size = image.size
+
+    if max_side and max(image.size) > max_side:
+        target = _fit_size(image.size, max_side)
+        # JPEG: o draft escolhe a maior escala DCT que ainda cobre o alvo (mantendo a proporção)
+        image.draft("RGB", target)
+        # Demais formatos: reduce() inteiro antes do LANCZOS (reducing_gap)
+        image = image.resize(target, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+    image = image.convert("RGB")
+
+    transpose = _ORIENTATION_TRANSPOSE.get(orientation)
+    if transpose is not None:
+        image = image.transpose(transpose)
+        if transpose in (Image.Transpose.TRANSPOSE, Image.Transpose.TRANSVERSE,
+                         Image.Transpose.ROTATE_90, Image.Transpose.ROTATE_270):
+            original_size = (original_size[1], original_size[0])
+
+    image.info["original_size"] = original_size
+    return image
+
+
+def fit_image(image: Image.Image, max_side: Optional[int] = IMAGE_INGEST_MAX_SIDE) -> Image.Image:
+    """
+    Aplicar o limite do ingest a uma imagem já decodificada (ex.: entrada da geração)
+
+    Args:
+        image: Imagem já orientada
+        max_side: Limite do maior lado (None ou 0 = sem limite)
+
+    Returns:
+        Imagem RGB, com ``info["original_size"]`` preservado
+    """
+    size = original_size(image)
+    if max_side and max(image.size) > max_side:
+        image = image.resize(_fit_size(image.size, max_side), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.info["original_size"] = size
+    return image
+
+
+def _fit_size(size: Tuple[int, int], max_side: int) -> Tuple[int, int]:
+    width, height = size
+    factor = max_side / max(width, height)
+    return max(1, round(width * factor)), max(1, round(height * factor))
+
+
+def original_size(image: Image.Image) -> Tuple[int, int]:
+    """Tamanho da imagem antes da redução (ou o atual, se não passou pelo ingest)"""
+    return image.info.get("original_size", image.size)
+
+
+def model_input(image: Image.Image, min_side: int) -> Image.Image:
+    """
+    Nível da pirâmide (redução inteira por box filter) adequado a um modelo
+
+    Retorna a menor redução de ``image`` cujo lado menor ainda é
+    ``>= min_side``; o preprocess do modelo faz o ajuste final. Evita
+    que CLIP/BLIP redimensionem a imagem de trabalho inteira com bicúbico.
+    """
+    factor = min(image.size) // min_side
+    if factor < 2:
+        return image
+    return image.reduce(factor)
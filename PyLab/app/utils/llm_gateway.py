@@ -0,0 +1,437 @@
+"""
+🤖 PyLab - LLM Gateway
+Cliente LLM compartilhado com pool de conexões, rate limiting e retries
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from .metrics import record_llm_call, record_llm_error, record_llm_retry
+from .tokenizer import count_message_tokens, count_tokens
+
+logger = logging.getLogger("PyLab.LLMGateway")
+
+# Estimativa de resposta quando a chamada não define max_tokens
+DEFAULT_COMPLETION_TOKENS = 1000
+
+
+@dataclass
+class ModelLimits:
+    """Limites da conta para um modelo (valores por minuto)"""
+    requests_per_minute: int
+    tokens_per_minute: int
+    max_concurrency: int = 16
+
+
+DEFAULT_LIMITS: Dict[str, ModelLimits] = {
+    "gpt-4-turbo-preview": ModelLimits(requests_per_minute=500, tokens_per_minute=300_000, max_concurrency=16),
+    "gpt-4": ModelLimits(requests_per_minute=500, tokens_per_minute=40_000, max_concurrency=8),
+    "gpt-3.5-turbo": ModelLimits(requests_per_minute=3_500, tokens_per_minute=160_000, max_concurrency=32),
+    "gpt-3.5-turbo-1106": ModelLimits(requests_per_minute=3_500, tokens_per_minute=160_000, max_concurrency=32),
+    "text-embedding-3-small": ModelLimits(requests_per_minute=3_000, tokens_per_minute=1_000_000, max_concurrency=32),
+}
+FALLBACK_LIMITS = ModelLimits(requests_per_minute=500, tokens_per_minute=100_000, max_concurrency=8)
+
+# Preço médio (entrada/saída) em USD por 1K tokens, para estimativas de custo
+PRICE_PER_1K_TOKENS: Dict[str, float] = {
+    "gpt-4-turbo-preview": 0.02,
+    "gpt-4": 0.045,
+    "gpt-3.5-turbo": 0.001,
+    "gpt-3.5-turbo-1106": 0.0015,
+    "text-embedding-3-small": 0.00002,
+}
+
+
+def estimate_cost(model: str, tokens: int) -> float:
+    """Custo estimado (USD) de ``tokens`` tokens no modelo; 0 se o preço for desconhecido"""
+    return tokens / 1000 * PRICE_PER_1K_TOKENS.get(model, 0.0)
+
+
+class TokenBucket:
+    """
+    Token bucket com reposição contínua.
+
+    ``acquire`` espera até haver saldo; pedidos maiores que a capacidade
+    são limitados à capacidade para não bloquear para sempre.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        amount = min(amount, self.capacity)
+        # Lock garante ordem FIFO entre chamadas concorrentes
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+
+    def refund(self, amount: float):
+        """Devolver saldo reservado a mais (ou debitar, se negativo)"""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limite de concorrência AIMD.
+
+    Cada sucesso aumenta o limite em 1/limite (≈ +1 por "janela");
+    cada 429 corta o limite pela metade.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, initial: Optional[int] = None):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(initial or max(min_limit, max_limit // 2))
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < int(self.limit))
+            self._in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def on_rate_limited(self):
+        self.limit = max(self.min_limit, self.limit / 2)
+        logger.warning(f"Rate limit atingido, concorrência reduzida para {int(self.limit)}")
+
+
+class _ModelState:
+    def __init__(self, limits: ModelLimits):
+        self.limits = limits
+        self.requests = TokenBucket(limits.requests_per_minute)
+        self.tokens = TokenBucket(limits.tokens_per_minute)
+        self.concurrency = AdaptiveConcurrencyLimiter(limits.max_concurrency)
+
+
+class LLMGateway:
+    """
+    Ponto único de acesso à API de chat.
+
+    - Um único AsyncOpenAI com pool HTTP keep-alive ajustado
+    - Token buckets por modelo para requisições e tokens por minuto
+    - Concorrência adaptativa que recua em 429
+    - Retries com backoff exponencial e jitter (Retry-After é respeitado)
+    - A reserva de tokens de cada tentativa é reconciliada: sucesso debita o
+      uso informado pela API, falha devolve o que não foi consumido
+
+    OPENAI_BASE_URL permite apontar para um servidor mock local em testes.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        timeout: float = 120.0,
+        max_retries: int = 5,
+        base_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        limits: Optional[Dict[str, ModelLimits]] = None
+    ):
+        self.api_key = api_key
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        self.max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", max_connections))
+        self.max_keepalive_connections = max_keepalive_connections
+        self.timeout = timeout
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", max_retries))
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+
+        self._client = None
+        self._models: Dict[str, _ModelState] = {}
+
+    @property
+    def client(self):
+        """AsyncOpenAI compartilhado (criado sob demanda)"""
+        if self._client is None:
+            import httpx
+            import openai
+
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=60.0
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=10.0)
+            )
+            self._client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                # Retries ficam com o gateway, que conhece os limites
+                max_retries=0,
+                http_client=http_client
+            )
+        return self._client
+
+    def set_limits(self, model: str, limits: ModelLimits):
+        """Configurar limites de um modelo"""
+        self.limits[model] = limits
+        self._models.pop(model, None)
+
+    async def chat_completion(self, model: str, messages: List[Dict[str, str]], **kwargs) -> Any:
+        """
+        Executar chat.completions.create respeitando limites e com retries
+
+        Args:
+            model: Nome do modelo
+            messages: Mensagens no formato chat
+            **kwargs: Demais parâmetros da API (temperature, max_tokens, ...)
+
+        Returns:
+            Resposta da API (ChatCompletion)
+        """
+        estimated = count_message_tokens(messages, model) + kwargs.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+        return await self._request_with_retries(
+            model, estimated,
+            lambda: self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+        )
+
+    async def chat_completion_stream(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        Versão streaming de ``chat_completion``: produz o texto à medida que chega
+
+        Retries só acontecem antes do primeiro token; depois disso um erro
+        é propagado para não duplicar conteúdo já entregue.
+        """
+        import openai
+
+        state = self._state(model)
+        completion_budget = kwargs.get("max_tokens", DEFAULT_COMPLETION_TOKENS)
+        prompt_tokens = count_message_tokens(messages, model)
+        estimated = prompt_tokens + completion_budget
+
+        attempt = 0
+        while True:
+            await state.requests.acquire(1)
+            await state.tokens.acquire(estimated)
+
+            started = False
+            completion = []
+            try:
+                async with state.concurrency:
+                    started_at = time.perf_counter()
+                    stream = await self.client.chat.completions.create(
+                        model=model, messages=messages, stream=True, **kwargs
+                    )
+                    async for chunk in stream:
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            started = True
+                            completion.append(delta)
+                            yield delta
+            except openai.RateLimitError as e:
+                if started:
+                    self._settle_stream(state, model, estimated, prompt_tokens, completion)
+                    record_llm_error(model)
+                    raise
+                state.concurrency.on_rate_limited()
+                delay = self._retry_after(e)
+                error = e
+            except (openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError) as e:
+                if started:
+                    self._settle_stream(state, model, estimated, prompt_tokens, completion)
+                    record_llm_error(model)
+                    raise
+                delay = None
+                error = e
+            except Exception:
+                self._settle_stream(state, model, estimated, prompt_tokens, completion)
+                record_llm_error(model)
+                raise
+            except BaseException:
+                # Cancelamento ou consumidor que parou de ler (GeneratorExit)
+                self._settle_stream(state, model, estimated, prompt_tokens, completion)
+                raise
+            else:
+                state.concurrency.on_success()
+                completion_tokens = self._settle_stream(state, model, estimated, prompt_tokens, completion)
+                record_llm_call(model, prompt_tokens, completion_tokens, time.perf_counter() - started_at)
+                return
+
+            # Nada foi gerado: a tentativa rejeitada não consumiu a cota
+            state.tokens.refund(estimated)
+            attempt += 1
+            if attempt > self.max_retries:
+                logger.error(f"Stream de {model} falhou após {attempt} tentativas: {error}")
+                record_llm_error(model)
+                raise error
+            record_llm_retry(model, type(error).__name__)
+
+            delay = delay if delay is not None else self._backoff(attempt)
+            logger.warning(f"Erro em {model} ({type(error).__name__}), nova tentativa em {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def embedding(self, model: str, text: str) -> List[float]:
+        """
+        Gerar embedding de um texto respeitando os limites do modelo
+
+        Args:
+            model: Modelo de embedding (ex.: text-embedding-3-small)
+            text: Texto
+
+        Returns:
+            Vetor do embedding
+        """
+        estimated = count_tokens(text, model)
+        response = await self._request_with_retries(
+            model, estimated,
+            lambda: self.client.embeddings.create(model=model, input=text)
+        )
+        return response.data[0].embedding
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    # === MÉTODOS PRIVADOS ===
+
+    async def _request_with_retries(
+        self,
+        model: str,
+        estimated: int,
+        create: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Executar ``create()`` respeitando os limites do modelo, com retries
+
+        ``estimated`` tokens são reservados a cada tentativa; no sucesso a
+        reserva é ajustada ao ``usage`` da resposta e, em qualquer falha
+        (429, erro de rede, erro da API, cancelamento), devolvida inteira.
+        """
+        import openai
+
+        state = self._state(model)
+
+        attempt = 0
+        while True:
+            await state.requests.acquire(1)
+            await state.tokens.acquire(estimated)
+
+            try:
+                async with state.concurrency:
+                    started_at = time.perf_counter()
+                    response = await create()
+            except openai.RateLimitError as e:
+                state.concurrency.on_rate_limited()
+                delay = self._retry_after(e)
+                error = e
+            except (openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError) as e:
+                delay = None
+                error = e
+            except Exception:
+                state.tokens.refund(estimated)
+                record_llm_error(model)
+                raise
+            except BaseException:
+                state.tokens.refund(estimated)
+                raise
+            else:
+                state.concurrency.on_success()
+                usage = getattr(response, "usage", None)
+                used = getattr(usage, "total_tokens", None) or estimated
+                state.tokens.refund(estimated - used)
+                record_llm_call(
+                    model,
+                    getattr(usage, "prompt_tokens", None) or used,
+                    getattr(usage, "completion_tokens", None) or 0,
+                    time.perf_counter() - started_at
+                )
+                return response
+
+            # Tentativa rejeitada: a reserva volta para o bucket antes do backoff
+            state.tokens.refund(estimated)
+            attempt += 1
+            if attempt > self.max_retries:
+                logger.error(f"Chamada a {model} falhou após {attempt} tentativas: {error}")
+                record_llm_error(model)
+                raise error
+            record_llm_retry(model, type(error).__name__)
+
+            delay = delay if delay is not None else self._backoff(attempt)
+            logger.warning(f"Erro em {model} ({type(error).__name__}), nova tentativa em {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _settle_stream(
+        state: _ModelState,
+        model: str,
+        estimated: int,
+        prompt_tokens: int,
+        completion: List[str]
+    ) -> int:
+        """
+        Reconciliar a reserva de um stream com o que foi gerado
+
+        Streams não trazem usage: o texto recebido é contado. Sem nenhum
+        token gerado, a reserva é devolvida inteira.
+
+        Returns:
+            Tokens de completion contados
+        """
+        if not completion:
+            state.tokens.refund(estimated)
+            return 0
+        completion_tokens = count_tokens("".join(completion), model)
+        state.tokens.refund(estimated - prompt_tokens - completion_tokens)
+        return completion_tokens
+
+    def _state(self, model: str) -> _ModelState:
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = _ModelState(self.limits.get(model, FALLBACK_LIMITS))
+        return state
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: evita que chamadas que falharam juntas voltem juntas
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+
+    def _retry_after(self, error: Exception) -> Optional[float]:
+        response = getattr(error, "response", None)
+        header = response.headers.get("retry-after") if response is not None else None
+        try:
+            return min(self.max_backoff, float(header)) + random.uniform(0, self.base_backoff)
+        except (TypeError, ValueError):
+            return None
+
+
+# Instância global
+llm_gateway = LLMGateway()
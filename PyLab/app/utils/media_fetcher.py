@@ -0,0 +1,290 @@
+"""
+🤖 PyLab - Media Fetcher
+Download assíncrono de mídia por URL com pool de conexões, limite de tamanho e cache
+"""
+
+import os
+import json
+import time
+import asyncio
+import functools
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from . import async_fs
+
+logger = logging.getLogger("PyLab.MediaFetcher")
+
+# Bloco de leitura do corpo da resposta
+READ_CHUNK_SIZE = 64 * 1024
+
+# Escritas no disco entre duas podas do cache
+PRUNE_EVERY = 100
+
+
+class MediaTooLargeError(IOError):
+    """Resposta maior que o limite configurado"""
+
+
+@dataclass
+class FetchedMedia:
+    url: str
+    content: bytes
+    # Validador do conteúdo (ETag ou SHA-256): chave para caches derivados (ex.: imagem decodificada)
+    version: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    fetched_at: float = 0.0
+    from_cache: bool = False
+
+
+class MediaFetcher:
+    """
+    Cliente HTTP assíncrono (aiohttp) para imagens/áudios referenciados por URL.
+
+    - Uma única ``ClientSession`` por processo reaproveita conexões keep-alive
+      (limites total e por host em MEDIA_FETCH_POOL_SIZE / MEDIA_FETCH_PER_HOST).
+    - O corpo é lido em blocos e a leitura é abortada acima de ``max_bytes``.
+    - Respostas ficam num LRU em memória e no disco (``cache_dir``). Dentro de
+      ``fresh_for`` segundos são servidas direto do cache; depois disso são
+      revalidadas com If-None-Match / If-Modified-Since (304 reaproveita o cache).
+    - Downloads simultâneos da mesma URL são unificados (uma requisição só).
+    """
+
+    def __init__(
+        self,
+        pool_size: int = int(os.getenv("MEDIA_FETCH_POOL_SIZE", "32")),
+        per_host: int = int(os.getenv("MEDIA_FETCH_PER_HOST", "8")),
+        timeout: float = float(os.getenv("MEDIA_FETCH_TIMEOUT", "30")),
+        max_bytes: int = int(os.getenv("MEDIA_FETCH_MAX_MB", "25")) * 1024 * 1024,
+        fresh_for: float = float(os.getenv("MEDIA_FETCH_FRESH_SECONDS", "300")),
+        memory_cache_bytes: int = int(os.getenv("MEDIA_FETCH_MEMORY_CACHE_MB", "128")) * 1024 * 1024,
+        disk_cache_bytes: int = int(os.getenv("MEDIA_FETCH_DISK_CACHE_MB", "1024")) * 1024 * 1024,
+        cache_dir: Optional[str] = None
+    ):
+        self.pool_size = pool_size
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.fresh_for = fresh_for
+        self.memory_cache_bytes = memory_cache_bytes
+        self.disk_cache_bytes = disk_cache_bytes
+        self.cache_dir = Path(
+            cache_dir or os.getenv("MEDIA_FETCH_CACHE_PATH")
+            or os.path.join(os.getenv("CACHE_PATH", "./cache"), "media_fetch")
+        )
+
+        self._session = None
+        self._session_lock = asyncio.Lock()
+        self._memory: "OrderedDict[str, FetchedMedia]" = OrderedDict()
+        self._memory_size = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._disk_writes = 0
+
+    async def fetch(self, url: str) -> bytes:
+        """Baixar (ou obter do cache) o conteúdo de uma URL"""
+        return (await self.get(url)).content
+
+    async def get(self, url: str) -> FetchedMedia:
+        """
+        Obter uma URL com cache e revalidação condicional
+
+        Args:
+            url: URL http(s)
+
+        Returns:
+            FetchedMedia com o conteúdo e seus validadores
+
+        Raises:
+            MediaTooLargeError: Conteúdo acima de ``max_bytes``
+            IOError: Resposta com status de erro
+        """
+        task = self._inflight.get(url)
+        if task is None:
+            # Download em task própria: cancelar qualquer chamador (inclusive o
+            # primeiro) não cancela o download compartilhado com os demais
+            task = asyncio.ensure_future(self._get(url))
+            self._inflight[url] = task
+            task.add_done_callback(functools.partial(self._download_done, url))
+        return await asyncio.shield(task)
+
+    async def close(self):
+        """Cancelar downloads em andamento e fechar a sessão e as conexões do pool"""
+        pending = list(self._inflight.values())
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    # === MÉTODOS PRIVADOS ===
+
+    def _download_done(self, url: str, task: asyncio.Task):
+        if self._inflight.get(url) is task:
+            del self._inflight[url]
+        # Evitar "exception was never retrieved" quando todos os chamadores foram cancelados
+        if not task.cancelled():
+            task.exception()
+
+    async def _get(self, url: str) -> FetchedMedia:
+        cached = self._memory_get(url) or await self._disk_get(url)
+        if cached is not None and time.time() - cached.fetched_at < self.fresh_for:
+            cached.from_cache = True
+            return cached
+
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        session = await self._get_session()
+        async with session.get(url, headers=headers) as resp:
+            if resp.status == 304 and cached is not None:
+                cached.fetched_at = time.time()
+                cached.from_cache = True
+                self._memory_put(cached)
+                await self._disk_put(cached, content_changed=False)
+                return cached
+            if resp.status >= 400:
+                raise IOError(f"Falha ao baixar {url}: HTTP {resp.status}")
+
+            declared = resp.content_length
+            if declared is not None and declared > self.max_bytes:
+                raise MediaTooLargeError(f"{url}: {declared} bytes excede o limite de {self.max_bytes}")
+
+            chunks = []
+            received = 0
+            async for chunk in resp.content.iter_chunked(READ_CHUNK_SIZE):
+                received += len(chunk)
+                if received > self.max_bytes:
+                    raise MediaTooLargeError(f"{url}: conteúdo excede o limite de {self.max_bytes} bytes")
+                chunks.append(chunk)
+            content = b"".join(chunks)
+
+            etag = resp.headers.get("ETag")
+            media = FetchedMedia(
+                url=url,
+                content=content,
+                version=etag or hashlib.sha256(content).hexdigest(),
+                etag=etag,
+                last_modified=resp.headers.get("Last-Modified"),
+                fetched_at=time.time()
+            )
+
+        self._memory_put(media)
+        await self._disk_put(media)
+        return media
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            async with self._session_lock:
+                if self._session is None or self._session.closed:
+                    import aiohttp
+                    connector = aiohttp.TCPConnector(
+                        limit=self.pool_size, limit_per_host=self.per_host, keepalive_timeout=60
+                    )
+                    self._session = aiohttp.ClientSession(
+                        connector=connector,
+                        timeout=aiohttp.ClientTimeout(total=self.timeout)
+                    )
+        return self._session
+
+    # === CACHE EM MEMÓRIA ===
+
+    def _memory_get(self, url: str) -> Optional[FetchedMedia]:
+        media = self._memory.get(url)
+        if media is not None:
+            self._memory.move_to_end(url)
+        return media
+
+    def _memory_put(self, media: FetchedMedia):
+        previous = self._memory.pop(media.url, None)
+        if previous is not None:
+            self._memory_size -= len(previous.content)
+        if len(media.content) > self.memory_cache_bytes:
+            return
+        self._memory[media.url] = media
+        self._memory_size += len(media.content)
+        while self._memory_size > self.memory_cache_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted.content)
+
+    # === CACHE EM DISCO ===
+
+    def _disk_paths(self, url: str):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.cache_dir / f"{key}.bin", self.cache_dir / f"{key}.json"
+
+    async def _disk_get(self, url: str) -> Optional[FetchedMedia]:
+        if self.disk_cache_bytes <= 0:
+            return None
+        body_path, meta_path = self._disk_paths(url)
+        try:
+            meta = json.loads(await async_fs.read_bytes(meta_path))
+            content = await async_fs.read_bytes(body_path)
+        except (FileNotFoundError, ValueError):
+            return None
+        if meta.get("url") != url:
+            return None
+
+        media = FetchedMedia(
+            url=url,
+            content=content,
+            version=meta["version"],
+            etag=meta.get("etag"),
+            last_modified=meta.get("last_modified"),
+            fetched_at=meta.get("fetched_at", 0.0)
+        )
+        self._memory_put(media)
+        # mtime marca o último uso (poda por LRU)
+        await async_fs.run_io(os.utime, body_path)
+        return media
+
+    async def _disk_put(self, media: FetchedMedia, content_changed: bool = True):
+        if self.disk_cache_bytes <= 0 or len(media.content) > self.disk_cache_bytes:
+            return
+        body_path, meta_path = self._disk_paths(media.url)
+        meta = {
+            "url": media.url,
+            "version": media.version,
+            "etag": media.etag,
+            "last_modified": media.last_modified,
+            "fetched_at": media.fetched_at
+        }
+        try:
+            await async_fs.makedirs(self.cache_dir)
+            if content_changed:
+                await async_fs.atomic_write(body_path, media.content)
+            await async_fs.atomic_write(meta_path, json.dumps(meta).encode())
+        except OSError as e:
+            logger.warning(f"Erro ao gravar cache de mídia ({media.url}): {e}")
+            return
+
+        self._disk_writes += 1
+        if self._disk_writes % PRUNE_EVERY == 0:
+            await self._prune_disk()
+
+    async def _prune_disk(self):
+        """Remover os corpos menos usados recentemente até caber em ``disk_cache_bytes``"""
+        entries = []
+        async for path, stat in async_fs.scan_dir(self.cache_dir):
+            if path.suffix == ".bin":
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_cache_bytes:
+                break
+            await async_fs.unlink(path)
+            await async_fs.unlink(path.with_suffix(".json"))
+            total -= size
+
+# Instância global
+media_fetcher = MediaFetcher()
@@ -0,0 +1,151 @@
+"""
+🤖 PyLab - Media Serving
+Entrega de mídia armazenada sem cópias em Python (sendfile, HTTP Range, mmap)
+"""
+
+import mmap
+import mimetypes
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, StreamingResponse, Response
+
+from .storage import StorageManager
+
+logger = logging.getLogger("PyLab.MediaServing")
+
+
+def parse_range_header(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpretar header Range de um único intervalo em bytes
+
+    Args:
+        range_header: Valor do header (ex.: "bytes=0-1023", "bytes=-500")
+        size: Tamanho total do arquivo
+
+    Returns:
+        Tupla (início, fim) inclusiva, ou None para servir o arquivo inteiro
+
+    Raises:
+        ValueError: Intervalo não satisfatível (responder 416)
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec:
+        # Múltiplos intervalos (multipart/byteranges): servir o arquivo inteiro
+        return None
+
+    start_text, _, end_text = spec.partition("-")
+    try:
+        if not start_text:
+            # Sufixo: últimos N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError(range_header)
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+    except ValueError:
+        raise ValueError(f"Range inválido: {range_header}")
+
+    end = min(end, size - 1)
+    if start >= size or start > end:
+        raise ValueError(f"Range não satisfatível: {range_header}")
+    return start, end
+
+
+async def build_media_response(
+    storage_manager: StorageManager,
+    filename: str,
+    range_header: Optional[str] = None
+) -> Response:
+    """
+    Montar resposta de download de um arquivo armazenado
+
+    Arquivo inteiro no filesystem local usa FileResponse (o servidor
+    ASGI pode usar sendfile). Intervalos e backends remotos são
+    transmitidos em blocos direto do backend, sem carregar o arquivo
+    em memória.
+
+    Args:
+        storage_manager: Storage onde o arquivo está
+        filename: Nome do arquivo
+        range_header: Header Range da requisição
+
+    Returns:
+        Resposta 200 ou 206
+    """
+    info = await storage_manager.get_file_info(filename)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+
+    key = storage_manager.get_file_key(filename, info["media_type"])
+
+    # Tamanho atual do objeto (o do índice fica desatualizado se o arquivo mudou depois de indexado)
+    stat = await storage_manager.backend.stat(key)
+    if stat is None:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    size = stat.size
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    headers = {"Accept-Ranges": "bytes"}
+
+    try:
+        byte_range = parse_range_header(range_header, size)
+    except ValueError:
+        raise HTTPException(
+            status_code=416,
+            detail="Range não satisfatível",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+
+    if byte_range is None:
+        local_path = storage_manager.backend.local_path(key)
+        if local_path is not None:
+            return FileResponse(local_path, media_type=content_type, headers=headers)
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(
+            storage_manager.backend.stream(key), media_type=content_type, headers=headers
+        )
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        storage_manager.backend.stream(key, start, end),
+        status_code=206,
+        media_type=content_type,
+        headers=headers
+    )
+
+
+@contextmanager
+def open_mmap(path: Path) -> Iterator[mmap.mmap]:
+    """
+    Mapear arquivo em memória somente leitura
+
+    O buffer retornado pode ser passado a Image.open, np.frombuffer ou
+    cv2.imdecode sem copiar o conteúdo para um objeto bytes. As páginas
+    são carregadas sob demanda pelo kernel e compartilhadas com o page
+    cache.
+
+    Args:
+        path: Caminho do arquivo
+
+    Yields:
+        Objeto mmap (suporta read/seek e o protocolo de buffer)
+    """
+    with open(path, "rb") as f:
+        # mmap não aceita arquivos vazios
+        if Path(path).stat().st_size == 0:
+            raise ValueError(f"Arquivo vazio: {path}")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
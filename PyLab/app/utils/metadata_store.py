@@ -0,0 +1,289 @@
+"""
+🤖 PyLab - Metadata Store
+Índice de metadados de mídia em SQLite com cache LRU em memória
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+from .async_fs import run_io
+
+logger = logging.getLogger("PyLab.MetadataStore")
+
+
+class MetadataStore:
+    """
+    Armazena os metadados dos arquivos de mídia em um índice SQLite.
+
+    Leituras passam por um cache LRU limitado; escritas são acumuladas
+    em memória e gravadas em lote numa única transação, periodicamente
+    ou quando o buffer atinge ``max_pending``.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        cache_size: int = 2048,
+        flush_interval: float = 2.0,
+        max_pending: int = 256
+    ):
+        self.db_path = Path(db_path)
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pending: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        """Criar tabelas e índices se não existirem"""
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS media_files (
+                    filename TEXT PRIMARY KEY,
+                    media_type TEXT NOT NULL,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    created REAL NOT NULL,
+                    modified REAL NOT NULL,
+                    metadata TEXT
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_media_type_modified "
+                "ON media_files (media_type, modified)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_modified ON media_files (modified)"
+            )
+
+    # === LEITURA ===
+
+    async def get(self, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Obter registro de um arquivo
+
+        Args:
+            filename: Nome do arquivo
+
+        Returns:
+            Registro com metadados ou None se não indexado
+        """
+        with self._lock:
+            if filename in self._pending:
+                record = self._pending[filename]
+                return dict(record) if record is not None else None
+
+            if filename in self._cache:
+                self._cache.move_to_end(filename)
+                return dict(self._cache[filename])
+
+        record = await run_io(self._select_one, filename)
+        if record is not None:
+            self._remember(record)
+        return record
+
+    async def list(
+        self,
+        prefix: Optional[str] = None,
+        media_type: Optional[str] = None,
+        since: Optional[float] = None,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """
+        Listar registros indexados sem ler arquivos do disco
+
+        Args:
+            prefix: Prefixo do nome do arquivo
+            media_type: "image" ou "video"
+            since: Apenas arquivos modificados a partir deste timestamp
+            limit: Número máximo de registros
+
+        Returns:
+            Lista de registros, mais recentes primeiro
+        """
+        # Garantir que escritas pendentes apareçam na listagem
+        await self.flush()
+        return await run_io(self._select_many, prefix, media_type, since, limit)
+
+    # === ESCRITA ===
+
+    async def put(self, record: Dict[str, Any]):
+        """Agendar gravação de um registro (filename obrigatório)"""
+        self._remember(record)
+        with self._lock:
+            self._pending[record["filename"]] = dict(record)
+            pending_count = len(self._pending)
+
+        if pending_count >= self.max_pending:
+            await self.flush()
+        else:
+            self._ensure_flush_task()
+
+    async def delete(self, filename: str):
+        """Agendar remoção de um registro"""
+        with self._lock:
+            self._cache.pop(filename, None)
+            self._pending[filename] = None
+        self._ensure_flush_task()
+
+    async def flush(self):
+        """Gravar todas as escritas pendentes numa única transação"""
+        with self._lock:
+            if not self._pending:
+                return
+            batch = self._pending
+            self._pending = {}
+
+        try:
+            await run_io(self._write_batch, batch)
+        except Exception as e:
+            logger.error(f"Erro ao gravar lote de metadados: {e}")
+            # Devolver ao buffer para nova tentativa, sem sobrescrever escritas mais novas
+            with self._lock:
+                for filename, record in batch.items():
+                    self._pending.setdefault(filename, record)
+            raise
+
+    async def close(self):
+        """Gravar pendências e fechar a conexão"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        self._conn.close()
+
+    # === MÉTODOS PRIVADOS ===
+
+    def _remember(self, record: Dict[str, Any]):
+        """Inserir registro no cache LRU respeitando o limite"""
+        with self._lock:
+            self._cache[record["filename"]] = dict(record)
+            self._cache.move_to_end(record["filename"])
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _ensure_flush_task(self):
+        """Iniciar flush periódico no loop atual, se ainda não estiver rodando"""
+        if self._flush_task and not self._flush_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._flush_task = loop.create_task(self._periodic_flush())
+
+    async def _periodic_flush(self):
+        """Gravar o buffer a cada ``flush_interval`` segundos enquanto houver pendências"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                continue
+            with self._lock:
+                if not self._pending:
+                    return
+
+    def _write_batch(self, batch: Dict[str, Optional[Dict[str, Any]]]):
+        """Aplicar lote de inserções/remoções em uma transação"""
+        upserts = []
+        deletes = []
+        for filename, record in batch.items():
+            if record is None:
+                deletes.append((filename,))
+            else:
+                upserts.append((
+                    filename,
+                    record.get("media_type", "image"),
+                    int(record.get("size", 0)),
+                    float(record.get("created", time.time())),
+                    float(record.get("modified", time.time())),
+                    json.dumps(record.get("metadata"), separators=(",", ":"))
+                    if record.get("metadata") is not None else None
+                ))
+
+        with self._lock, self._conn:
+            if deletes:
+                self._conn.executemany("DELETE FROM media_files WHERE filename = ?", deletes)
+            if upserts:
+                self._conn.executemany(
+                    """
+                    INSERT INTO media_files (filename, media_type, size, created, modified, metadata)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(filename) DO UPDATE SET
+                        media_type = excluded.media_type,
+                        size = excluded.size,
+                        created = excluded.created,
+                        modified = excluded.modified,
+                        metadata = excluded.metadata
+                    """,
+                    upserts
+                )
+
+    def _select_one(self, filename: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename, media_type, size, created, modified, metadata "
+                "FROM media_files WHERE filename = ?",
+                (filename,)
+            ).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def _select_many(
+        self,
+        prefix: Optional[str],
+        media_type: Optional[str],
+        since: Optional[float],
+        limit: int
+    ) -> List[Dict[str, Any]]:
+        query = (
+            "SELECT filename, media_type, size, created, modified, metadata "
+            "FROM media_files WHERE 1=1"
+        )
+        params: List[Any] = []
+
+        if prefix:
+            # Escapar curingas do LIKE para tratar o prefixo literalmente
+            escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            query += " AND filename LIKE ? ESCAPE '\\'"
+            params.append(f"{escaped}%")
+        if media_type:
+            query += " AND media_type = ?"
+            params.append(media_type)
+        if since is not None:
+            query += " AND modified >= ?"
+            params.append(since)
+
+        query += " ORDER BY modified DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._row_to_record(row) for row in rows]
+
+    @staticmethod
+    def _row_to_record(row) -> Dict[str, Any]:
+        filename, media_type, size, created, modified, metadata = row
+        return {
+            "filename": filename,
+            "media_type": media_type,
+            "size": size,
+            "created": created,
+            "modified": modified,
+            "metadata": json.loads(metadata) if metadata else None
+        }
@@ -0,0 +1,206 @@
+"""
+🤖 PyLab - Metrics
+Contabilização de tokens, custo e latência por modelo e tipo de análise (Prometheus)
+"""
+
+import time
+import inspect
+import logging
+import functools
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("PyLab.Metrics")
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+    )
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    logger.warning("prometheus_client não instalado, métricas desativadas")
+    PROMETHEUS_AVAILABLE = False
+
+# Buckets para chamadas LLM e análises completas (segundos)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 40, 60, 120)
+
+
+@dataclass
+class OperationUsage:
+    """Uso acumulado pelas chamadas LLM de uma operação (requisição)"""
+    operation: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    llm_calls: int = 0
+    retries: int = 0
+    # Cortes aplicados às entradas dos prompts (prompt_builder.record_trim)
+    prompt_trims: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+# Operação corrente (ex.: "text.sentiment"); tasks filhas (gather) herdam o mesmo objeto
+_current_usage: contextvars.ContextVar[Optional[OperationUsage]] = contextvars.ContextVar(
+    "pylab_operation_usage", default=None
+)
+
+
+def current_usage() -> Optional[OperationUsage]:
+    """Uso da operação em andamento (None fora de ``track_operation``)"""
+    return _current_usage.get()
+
+
+def _operation_label() -> str:
+    usage = _current_usage.get()
+    return usage.operation if usage else "unknown"
+
+
+if PROMETHEUS_AVAILABLE:
+    registry = CollectorRegistry()
+
+    LLM_TOKENS = Counter(
+        "pylab_llm_tokens_total", "Tokens consumidos em chamadas LLM",
+        ["model", "operation", "kind"], registry=registry
+    )
+    LLM_COST = Counter(
+        "pylab_llm_cost_usd_total", "Custo estimado das chamadas LLM (USD)",
+        ["model", "operation"], registry=registry
+    )
+    LLM_REQUESTS = Counter(
+        "pylab_llm_requests_total", "Chamadas LLM por resultado",
+        ["model", "operation", "status"], registry=registry
+    )
+    LLM_RETRIES = Counter(
+        "pylab_llm_retries_total", "Novas tentativas de chamadas LLM",
+        ["model", "operation", "reason"], registry=registry
+    )
+    LLM_LATENCY = Histogram(
+        "pylab_llm_request_duration_seconds", "Latência das chamadas LLM",
+        ["model", "operation"], buckets=LATENCY_BUCKETS, registry=registry
+    )
+    OPERATION_LATENCY = Histogram(
+        "pylab_operation_duration_seconds", "Latência das análises/gerações completas",
+        ["operation"], buckets=LATENCY_BUCKETS, registry=registry
+    )
+    OPERATIONS = Counter(
+        "pylab_operations_total", "Análises/gerações por resultado",
+        ["operation", "status"], registry=registry
+    )
+    CACHE_LOOKUPS = Counter(
+        "pylab_cache_lookups_total", "Consultas ao cache de respostas",
+        ["operation", "result"], registry=registry
+    )
+
+
+def record_llm_call(model: str, prompt_tokens: int, completion_tokens: int, latency: float):
+    """Registrar uma chamada LLM bem-sucedida (e somar ao uso da operação corrente)"""
+    from .llm_gateway import estimate_cost
+
+    cost = estimate_cost(model, prompt_tokens + completion_tokens)
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.prompt_tokens += prompt_tokens
+        usage.completion_tokens += completion_tokens
+        usage.cost += cost
+        usage.llm_calls += 1
+
+    if PROMETHEUS_AVAILABLE:
+        operation = _operation_label()
+        LLM_TOKENS.labels(model, operation, "prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(model, operation, "completion").inc(completion_tokens)
+        LLM_COST.labels(model, operation).inc(cost)
+        LLM_REQUESTS.labels(model, operation, "ok").inc()
+        LLM_LATENCY.labels(model, operation).observe(latency)
+
+
+def record_llm_retry(model: str, reason: str):
+    """Registrar uma nova tentativa (429, timeout, erro de conexão...)"""
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.retries += 1
+    if PROMETHEUS_AVAILABLE:
+        LLM_RETRIES.labels(model, _operation_label(), reason).inc()
+
+
+def record_llm_error(model: str):
+    """Registrar uma chamada LLM que falhou definitivamente"""
+    if PROMETHEUS_AVAILABLE:
+        LLM_REQUESTS.labels(model, _operation_label(), "error").inc()
+
+
+def record_cache_lookup(match: Optional[str]):
+    """Registrar consulta ao cache: "exact", "semantic" ou None (miss)"""
+    if PROMETHEUS_AVAILABLE:
+        CACHE_LOOKUPS.labels(_operation_label(), match or "miss").inc()
+
+
+@contextmanager
+def track_operation(operation: str) -> Iterator[OperationUsage]:
+    """
+    Delimitar uma operação: latência, resultado e uso das chamadas LLM internas
+
+    Args:
+        operation: Rótulo (ex.: "text.sentiment", "code.sql_query")
+
+    Returns:
+        OperationUsage acumulado durante o bloco
+    """
+    usage = OperationUsage(operation)
+    token = _current_usage.set(usage)
+    start = time.perf_counter()
+    status = "error"
+    try:
+        yield usage
+        status = "ok"
+    finally:
+        if PROMETHEUS_AVAILABLE:
+            OPERATION_LATENCY.labels(operation).observe(time.perf_counter() - start)
+            OPERATIONS.labels(operation, status).inc()
+        try:
+            _current_usage.reset(token)
+        except ValueError:
+            # Gerador assíncrono finalizado em outro contexto
+            pass
+
+
+def instrument(kind: str, type_attr: Optional[str] = None) -> Callable:
+    """
+    Decorator de métodos ``(self, request, ...)``: rótulo "<kind>.<tipo>"
+
+    O tipo vem de ``request.<type_attr>`` (Enum); sem ``type_attr`` o rótulo
+    é só ``kind``. Funciona com corrotinas e geradores assíncronos.
+    """
+    def label(request: Any) -> str:
+        if type_attr is None:
+            return kind
+        value = getattr(request, type_attr, None)
+        return f"{kind}.{getattr(value, 'value', value)}"
+
+    def decorator(func: Callable) -> Callable:
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def gen_wrapper(self, request, *args, **kwargs):
+                with track_operation(label(request)):
+                    async for item in func(self, request, *args, **kwargs):
+                        yield item
+            return gen_wrapper
+
+        @functools.wraps(func)
+        async def wrapper(self, request, *args, **kwargs):
+            with track_operation(label(request)):
+                return await func(self, request, *args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Exposição no formato texto do Prometheus: (conteúdo, content type)"""
+    if not PROMETHEUS_AVAILABLE:
+        return b"# prometheus_client not installed\n", "text/plain; charset=utf-8"
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,112 @@
+"""
+🤖 PyLab - Micro Batcher
+Agrupamento de chamadas concorrentes em lotes para inferência de modelos
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Generic, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger("PyLab.MicroBatcher")
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Agrupa itens enviados por chamadas concorrentes e os processa em lote.
+
+    Um lote é disparado quando atinge ``max_batch_size`` itens ou quando
+    o primeiro item espera ``max_wait`` segundos - a latência adicional
+    fica limitada a esse tempo, e sob carga os lotes enchem sozinhos.
+    Lotes são processados um por vez (o modelo já paraleliza por dentro).
+
+    ``process_batch`` recebe a lista de itens e retorna os resultados na
+    mesma ordem. Se o lote falhar, os itens são reprocessados um a um:
+    só o item com problema (ex.: imagem corrompida) recebe a exceção, e
+    não as demais requisições que caíram no mesmo lote.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[T]], Awaitable[List[R]]],
+        max_batch_size: int = 32,
+        max_wait: float = 0.01
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._pending: List[Tuple[T, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def submit(self, item: T) -> R:
+        """Enviar um item e aguardar o seu resultado"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    async def submit_many(self, items: List[T]) -> List[R]:
+        """Enviar vários itens (podem ser agrupados com os de outras chamadas)"""
+        return list(await asyncio.gather(*[self.submit(item) for item in items]))
+
+    # === MÉTODOS PRIVADOS ===
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[T, asyncio.Future]]):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            # Itens cujo chamador desistiu (ex.: requisição cancelada) não são processados
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                return
+            try:
+                outcomes = [(result, None) for result in await self._process([item for item, _ in batch])]
+            except Exception as e:
+                if len(batch) == 1:
+                    logger.error(f"Erro ao processar item do lote: {e}")
+                    outcomes = [(None, e)]
+                else:
+                    logger.warning(f"Erro ao processar lote de {len(batch)} itens, processando um a um: {e}")
+                    outcomes = [await self._process_one(item) for item, _ in batch]
+
+        for (_, future), (result, error) in zip(batch, outcomes):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def _process(self, items: List[T]) -> List[R]:
+        results = await self.process_batch(items)
+        if len(results) != len(items):
+            # Sem isso os itens excedentes ficariam esperando para sempre
+            raise ValueError(f"process_batch retornou {len(results)} resultados para {len(items)} itens")
+        return results
+
+    async def _process_one(self, item: T) -> Tuple[Optional[R], Optional[Exception]]:
+        try:
+            return (await self._process([item]))[0], None
+        except Exception as e:
+            logger.error(f"Erro ao processar item do lote: {e}")
+            return None, e
@@ -0,0 +1,171 @@
+"""
+🤖 PyLab - Prompt Builder
+Compactação de prompts e ajuste de entradas ao orçamento de tokens do modelo
+"""
+
+import os
+import re
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import current_usage
+from .tokenizer import count_tokens, truncate_to_tokens, truncate_tokens_from_start
+
+logger = logging.getLogger("PyLab.PromptBuilder")
+
+# Janela de contexto por modelo (tokens de entrada + saída)
+CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-4-turbo-preview": 128_000,
+    "gpt-4": 8_192,
+    "gpt-3.5-turbo": 16_385,
+    "gpt-3.5-turbo-1106": 16_385,
+}
+DEFAULT_CONTEXT_WINDOW = 8_192
+
+# Teto global de entrada por chamada (0 = só a janela do modelo)
+PROMPT_MAX_INPUT_TOKENS = int(os.getenv("PROMPT_MAX_INPUT_TOKENS", "16000"))
+
+# Margem para as instruções do template em volta da entrada
+TEMPLATE_RESERVE_TOKENS = 1_000
+
+_INLINE_SPACES = re.compile(r"[ \t]+")
+_BLANK_LINES = re.compile(r"\n\s*\n(\s*\n)+")
+_OMITTED_MARKER = "\n[... {omitted} tokens omitidos ...]\n"
+
+
+def input_budget(model: str, completion_tokens: int = 2000) -> int:
+    """Tokens disponíveis para a entrada de uma chamada ao modelo"""
+    window = CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    budget = window - completion_tokens - TEMPLATE_RESERVE_TOKENS
+    if PROMPT_MAX_INPUT_TOKENS:
+        budget = min(budget, PROMPT_MAX_INPUT_TOKENS)
+    return max(256, budget)
+
+
+def compact_text(text: str, keep_indentation: bool = False) -> str:
+    """
+    Remover espaços redundantes
+
+    Args:
+        text: Texto
+        keep_indentation: Preservar a indentação das linhas (código)
+
+    Returns:
+        Texto com espaços internos colapsados e no máximo uma linha em branco seguida
+    """
+    if keep_indentation:
+        lines = [line.rstrip() for line in text.splitlines()]
+    else:
+        lines = [_INLINE_SPACES.sub(" ", line).strip() for line in text.splitlines()]
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip("\n")
+
+
+def compact_json(value: Any) -> str:
+    """JSON sem indentação nem espaços após separadores"""
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def dedupe_lines(lines: List[str]) -> Tuple[List[str], int]:
+    """
+    Remover linhas repetidas em sequência (ex.: loops de transcrição do Whisper)
+
+    Returns:
+        Tupla (linhas, quantidade removida)
+    """
+    result: List[str] = []
+    previous = None
+    for line in lines:
+        key = _INLINE_SPACES.sub(" ", line).strip().lower()
+        if key and key == previous:
+            continue
+        result.append(line)
+        previous = key
+    return result, len(lines) - len(result)
+
+
+def fit_to_budget(text: str, max_tokens: int, model: str) -> Tuple[str, int]:
+    """
+    Cortar texto para ``max_tokens`` mantendo início e fim
+
+    O início (2/3 do orçamento) costuma ter o contexto e o fim as
+    conclusões; o trecho do meio é substituído por um marcador.
+
+    Returns:
+        Tupla (texto, tokens omitidos)
+    """
+    total = count_tokens(text, model)
+    if total <= max_tokens:
+        return text, 0
+
+    head_tokens = max_tokens * 2 // 3
+    head = truncate_to_tokens(text, head_tokens, model)
+    tail = truncate_tokens_from_start(text[len(head):], max_tokens - head_tokens, model)
+
+    omitted = total - count_tokens(head, model) - count_tokens(tail, model)
+    return head + _OMITTED_MARKER.format(omitted=omitted) + tail, omitted
+
+
+def record_trim(label: str, original_tokens: int, final_tokens: int, actions: List[str]):
+    """Registrar no uso da operação corrente o corte aplicado a uma entrada"""
+    usage = current_usage()
+    if usage is not None:
+        usage.prompt_trims.append({
+            "input": label,
+            "original_tokens": original_tokens,
+            "final_tokens": final_tokens,
+            "actions": actions
+        })
+    logger.debug(f"Entrada '{label}' ajustada: {original_tokens} -> {final_tokens} tokens ({', '.join(actions)})")
+
+
+def prepare_input(
+    text: str,
+    model: str,
+    max_tokens: Optional[int] = None,
+    label: str = "input",
+    kind: str = "text"
+) -> str:
+    """
+    Preparar uma entrada para ser inserida em um prompt
+
+    Compacta espaços (preservando indentação em código), remove linhas
+    repetidas em transcrições e corta o que exceder o orçamento. Qualquer
+    redução é registrada (``record_trim``) e vai para a metadata do resultado.
+
+    Args:
+        text: Conteúdo a inserir (documento, transcrição, código)
+        model: Modelo que receberá o prompt
+        max_tokens: Orçamento da entrada (padrão: ``input_budget(model)``)
+        label: Nome da entrada no relatório
+        kind: "text", "transcript" ou "code"
+
+    Returns:
+        Texto pronto para o prompt
+    """
+    if not text:
+        return text
+
+    max_tokens = max_tokens or input_budget(model)
+    original_tokens = count_tokens(text, model)
+    actions: List[str] = []
+
+    compacted = compact_text(text, keep_indentation=(kind == "code"))
+    if kind == "transcript":
+        lines, removed = dedupe_lines(compacted.splitlines())
+        if removed:
+            compacted = "\n".join(lines)
+            actions.append(f"dedupe:{removed}")
+
+    if len(compacted) < len(text):
+        actions.append("whitespace")
+
+    compacted, omitted = fit_to_budget(compacted, max_tokens, model)
+    if omitted:
+        actions.append(f"truncate:{omitted}")
+
+    final_tokens = count_tokens(compacted, model)
+    # Só compactação de espaços sem ganho real de tokens não é relatada
+    if actions and final_tokens < original_tokens:
+        record_trim(label, original_tokens, final_tokens, actions)
+    return compacted
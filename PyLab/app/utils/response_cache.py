@@ -0,0 +1,193 @@
+"""
+🤖 PyLab - Response Cache
+Cache de respostas LLM (exato por hash + camada opcional por similaridade)
+"""
+
+import re
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("PyLab.ResponseCache")
+
+EmbedFunction = Callable[[str], Awaitable[List[float]]]
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Normalizar texto para a chave: espaços colapsados e bordas removidas"""
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def make_cache_key(*parts: str) -> str:
+    """SHA-256 das partes normalizadas (separadas para evitar colisões por concatenação)"""
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(normalize_prompt(part or "").encode("utf-8"))
+        hasher.update(b"\x1f")
+    return hasher.hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache LRU com TTL para respostas de modelos.
+
+    A camada exata usa a chave (hash do prompt normalizado). Quando um
+    ``embed`` é fornecido, uma segunda camada compara o embedding do
+    texto com entradas do mesmo ``scope`` (mesmo prompt de sistema,
+    idioma, domínio e contexto) e aceita similaridade de cosseno acima
+    de ``similarity_threshold`` - documentos levemente editados reutilizam
+    a análise anterior.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 3600.0,
+        embed: Optional[EmbedFunction] = None,
+        similarity_threshold: float = 0.97
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+
+        # key -> (expira_em, valor, scope)
+        self._entries: "OrderedDict[str, Tuple[float, Any, Optional[str]]]" = OrderedDict()
+        # scope -> {key: embedding normalizado}
+        self._vectors: Dict[str, Dict[str, Any]] = {}
+        # Embeddings recentes por hash do texto: a consulta de um miss é reaproveitada no put
+        self._recent_embeddings: "OrderedDict[str, Any]" = OrderedDict()
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    async def get(
+        self,
+        key: str,
+        scope: Optional[str] = None,
+        text: Optional[str] = None
+    ) -> Tuple[Optional[Any], Optional[str]]:
+        """
+        Buscar resposta em cache
+
+        Args:
+            key: Chave exata (make_cache_key)
+            scope: Escopo para a busca por similaridade
+            text: Texto a comparar por similaridade
+
+        Returns:
+            Tupla (valor, tipo de acerto "exact"/"semantic") ou (None, None)
+        """
+        value = self._lookup(key)
+        if value is not None:
+            self.hits += 1
+            return value, "exact"
+
+        if self.embed is not None and scope is not None and text:
+            match = await self._lookup_similar(scope, text)
+            if match is not None:
+                self.semantic_hits += 1
+                return match, "semantic"
+
+        self.misses += 1
+        return None, None
+
+    async def put(
+        self,
+        key: str,
+        value: Any,
+        scope: Optional[str] = None,
+        text: Optional[str] = None
+    ):
+        """Armazenar resposta (e o embedding do texto, se a camada semântica estiver ativa)"""
+        self._entries[key] = (time.monotonic() + self.ttl, value, scope)
+        self._entries.move_to_end(key)
+
+        if self.embed is not None and scope is not None and text:
+            try:
+                vector = await self._embed(text)
+                self._vectors.setdefault(scope, {})[key] = vector
+            except Exception as e:
+                logger.warning(f"Erro ao gerar embedding para cache: {e}")
+
+        while len(self._entries) > self.max_entries:
+            old_key, (_, _, old_scope) = self._entries.popitem(last=False)
+            self._forget_vector(old_key, old_scope)
+
+    def clear(self):
+        self._entries.clear()
+        self._vectors.clear()
+        self._recent_embeddings.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses
+        }
+
+    # === MÉTODOS PRIVADOS ===
+
+    def _lookup(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self._forget_vector(key, entry[2])
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def _lookup_similar(self, scope: str, text: str) -> Optional[Any]:
+        candidates = self._vectors.get(scope)
+        if not candidates:
+            return None
+
+        import numpy as np
+
+        try:
+            query = await self._embed(text)
+        except Exception as e:
+            logger.warning(f"Erro ao gerar embedding para consulta ao cache: {e}")
+            return None
+
+        keys = list(candidates)
+        similarities = np.stack([candidates[k] for k in keys]) @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        return self._lookup(keys[best])
+
+    async def _embed(self, text: str):
+        import numpy as np
+
+        text_key = make_cache_key(text)
+        vector = self._recent_embeddings.get(text_key)
+        if vector is not None:
+            return vector
+
+        vector = np.asarray(await self.embed(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        vector = vector / norm if norm else vector
+
+        self._recent_embeddings[text_key] = vector
+        while len(self._recent_embeddings) > 64:
+            self._recent_embeddings.popitem(last=False)
+        return vector
+
+    def _forget_vector(self, key: str, scope: Optional[str] = None):
+        scopes = [scope] if scope is not None else list(self._vectors)
+        for s in scopes:
+            vectors = self._vectors.get(s)
+            if vectors and key in vectors:
+                del vectors[key]
+                if not vectors:
+                    del self._vectors[s]
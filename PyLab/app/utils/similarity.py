@@ -0,0 +1,74 @@
+"""
+🤖 PyLab - Similarity
+Estatísticas de similaridade entre pares de embeddings, calculadas em blocos
+"""
+
+from typing import Any, Dict, List, Tuple
+
+import torch
+
+
+def pairwise_similarity_stats(
+    features: torch.Tensor,
+    top_k: int,
+    block_size: int,
+    include_matrix: bool
+) -> Dict[str, Any]:
+    """
+    Estatísticas dos pares i < j a partir das features normalizadas (n, d)
+
+    Cada bloco de linhas gera S = F[bloco] @ F.T; os candidatos a maior e
+    menor similaridade do bloco (top-k mascarado) são unidos aos anteriores.
+    """
+    n = features.shape[0]
+    k = max(1, min(top_k, n * (n - 1) // 2))
+    columns = torch.arange(n)
+
+    best_values = torch.empty(0)
+    best_index = torch.empty(0, dtype=torch.long)
+    worst_values = torch.empty(0)
+    worst_index = torch.empty(0, dtype=torch.long)
+    total = 0.0
+    rows_out = [] if include_matrix else None
+
+    with torch.no_grad():
+        for start in range(0, n, block_size):
+            block = features[start:start + block_size] @ features.T
+            if rows_out is not None:
+                rows_out.append(block)
+            
+            # Só pares acima da diagonal (j > i)
+            rows = torch.arange(start, start + block.shape[0]).unsqueeze(1)
+            upper = columns.unsqueeze(0) > rows
+            if not upper.any():
+                continue
+            total += float(block[upper].sum())
+            
+            # Índice linear global (i * n + j) para unir candidatos entre blocos
+            flat_index = (rows * n + columns.unsqueeze(0)).flatten()
+            candidates = min(k, int(upper.sum()))
+            
+            values, idx = block.masked_fill(~upper, float("-inf")).flatten().topk(candidates)
+            best_values, order = torch.cat([best_values, values]).topk(min(k, len(best_values) + candidates))
+            best_index = torch.cat([best_index, flat_index[idx]])[order]
+            
+            values, idx = block.masked_fill(~upper, float("inf")).flatten().topk(candidates, largest=False)
+            worst_values, order = torch.cat([worst_values, values]).topk(
+                min(k, len(worst_values) + candidates), largest=False
+            )
+            worst_index = torch.cat([worst_index, flat_index[idx]])[order]
+
+    def pairs(values: torch.Tensor, index: torch.Tensor) -> List[Tuple[int, int, float]]:
+        return [(i // n, i % n, v) for i, v in zip(index.tolist(), values.tolist())]
+
+    top_pairs = pairs(best_values, best_index)
+    bottom_pairs = pairs(worst_values, worst_index)
+
+    return {
+        "similarity_matrix": torch.cat(rows_out).tolist() if rows_out is not None else None,
+        "most_similar_pair": top_pairs[0],
+        "least_similar_pair": bottom_pairs[0],
+        "top_pairs": top_pairs,
+        "bottom_pairs": bottom_pairs,
+        "average_similarity": total / (n * (n - 1) // 2)
+    }
@@ -4,35 +4,77 @@ Gerenciamento de arquivos de mídia gerados
 """
 
 import os
+import json
 import asyncio
-import aiofiles
 from pathlib import Path
-import hashlib
 import time
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Callable, Awaitable
 from PIL import Image
 import io
 
+from .async_fs import run_io
+from .metadata_store import MetadataStore
+from .dedup import ContentDeduplicator, content_digest
+from .storage_backends import ObjectStat, StorageBackend, create_storage_backend
+
 logger = logging.getLogger("PyLab.Storage")
 
 class StorageManager:
     """Gerenciador de storage para arquivos de mídia"""
     
-    def __init__(self, base_path: str = "/var/shared_media"):
+    IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif']
+    
+    # Prefixos das chaves no backend
+    IMAGE_PREFIX = "images"
+    VIDEO_PREFIX = "videos"
+    TEMP_PREFIX = "temp"
+    BLOB_PREFIX = ".blobs"
+    
+    def __init__(self, base_path: str = "/var/shared_media", backend: Optional[StorageBackend] = None):
         self.base_path = Path(base_path)
-        self.image_path = self.base_path / "images"
-        self.video_path = self.base_path / "videos"
-        self.temp_path = self.base_path / "temp"
+        self.image_path = self.base_path / self.IMAGE_PREFIX
+        self.video_path = self.base_path / self.VIDEO_PREFIX
+        self.temp_path = self.base_path / self.TEMP_PREFIX
+        self.blob_path = self.base_path / self.BLOB_PREFIX
+        
+        # Backend de armazenamento (filesystem local ou S3 compatível, via STORAGE_BACKEND)
+        self.backend = backend or create_storage_backend(str(self.base_path))
         
         # Criar diretórios se não existirem
         self._ensure_directories()
         
-        logger.info(f"Storage Manager inicializado: {base_path}")
+        # Índice de metadados e referências da deduplicação (SQLite). Esse estado
+        # não vai para o bucket: com backend remoto e várias réplicas,
+        # STORAGE_INDEX_PATH deve apontar para um volume compartilhado por elas
+        index_path = Path(os.getenv("STORAGE_INDEX_PATH") or self.base_path)
+        index_path.mkdir(parents=True, exist_ok=True)
+        if self.backend.local_path("") is None and not os.getenv("STORAGE_INDEX_PATH"):
+            logger.warning(
+                f"Índice de storage em disco local ({index_path}) com backend {self.backend.name}: "
+                "réplicas não compartilham listagem nem contagem de referências (defina STORAGE_INDEX_PATH)"
+            )
+        
+        # Índice de metadados (SQLite + LRU em memória, escritas em lote)
+        self.metadata_store = MetadataStore(index_path / "metadata.db")
+        
+        # Deduplicação de conteúdo (blobs por SHA-256 + link no backend)
+        self.deduplicator = ContentDeduplicator(
+            self.backend, index_path / "metadata.db", blob_prefix=self.BLOB_PREFIX
+        )
+        
+        # Chamados com o filename de cada arquivo removido (ex.: índice de embeddings)
+        self._delete_listeners: List[Callable[[str], Awaitable[Any]]] = []
+        
+        logger.info(f"Storage Manager inicializado: {base_path} (backend: {self.backend.name})")
     
     def _ensure_directories(self):
         """Garantir que os diretórios existem"""
-        for path in [self.base_path, self.image_path, self.video_path, self.temp_path]:
+        paths = [self.base_path]
+        if self.backend.local_path("") is not None:
+            paths += [self.image_path, self.video_path, self.temp_path, self.blob_path]
+        
+        for path in paths:
             path.mkdir(parents=True, exist_ok=True)
             # Garantir permissões de escrita
             os.chmod(path, 0o777)
@@ -55,26 +97,25 @@ class StorageManager:
             Nome do arquivo salvo
         """
         try:
+            # Otimizar antes de gravar: arquivos deduplicados não podem ser alterados no lugar
+            image_data = await self._optimize_image(image_data)
+            
+            # Hash forte do conteúdo (nome do arquivo + índice de deduplicação)
+            digest = await asyncio.to_thread(content_digest, image_data)
+            
             # Gerar filename se não fornecido
             if filename is None:
                 timestamp = int(time.time())
-                hash_obj = hashlib.md5(image_data)
-                file_hash = hash_obj.hexdigest()[:8]
-                filename = f"img_{timestamp}_{file_hash}.png"
-            
-            # Caminho completo
-            file_path = self.image_path / filename
+                filename = f"img_{timestamp}_{digest[:8]}.png"
             
-            # Salvar arquivo
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(image_data)
+            # Chave no backend
+            key = f"{self.IMAGE_PREFIX}/{filename}"
             
-            # Verificar e otimizar imagem
-            await self._optimize_image(file_path)
+            # Salvar arquivo (ou reutilizar conteúdo idêntico já armazenado)
+            await self.deduplicator.store(image_data, key, digest)
             
-            # Salvar metadados se fornecidos
-            if metadata:
-                await self._save_metadata(file_path, metadata)
+            # Indexar arquivo e metadados
+            await self._index_file(filename, "image", len(image_data), metadata)
             
             logger.info(f"Imagem salva: {filename} ({len(image_data)} bytes)")
             return filename
@@ -101,23 +142,22 @@ class StorageManager:
             Nome do arquivo salvo
         """
         try:
+            # Hash forte do conteúdo (nome do arquivo + índice de deduplicação)
+            digest = await asyncio.to_thread(content_digest, video_data)
+            
             # Gerar filename se não fornecido
             if filename is None:
                 timestamp = int(time.time())
-                hash_obj = hashlib.md5(video_data)
-                file_hash = hash_obj.hexdigest()[:8]
-                filename = f"vid_{timestamp}_{file_hash}.mp4"
+                filename = f"vid_{timestamp}_{digest[:8]}.mp4"
             
-            # Caminho completo
-            file_path = self.video_path / filename
+            # Chave no backend
+            key = f"{self.VIDEO_PREFIX}/{filename}"
             
-            # Salvar arquivo
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(video_data)
+            # Salvar arquivo (ou reutilizar conteúdo idêntico já armazenado)
+            await self.deduplicator.store(video_data, key, digest)
             
-            # Salvar metadados se fornecidos
-            if metadata:
-                await self._save_metadata(file_path, metadata)
+            # Indexar arquivo e metadados
+            await self._index_file(filename, "video", len(video_data), metadata)
             
             logger.info(f"Vídeo salvo: {filename} ({len(video_data)} bytes)")
             return filename
@@ -137,27 +177,29 @@ class StorageManager:
             Dicionário com informações do arquivo
         """
         try:
-            # Procurar arquivo nos diretórios
-            for path in [self.image_path, self.video_path]:
-                file_path = path / filename
-                if file_path.exists():
-                    stat = file_path.stat()
+            # Consultar o índice antes de tocar no backend
+            record = await self.metadata_store.get(filename)
+            if record is not None:
+                return self._with_path(record)
+            
+            # Arquivos anteriores ao índice (ou com registro perdido antes do flush):
+            # procurar no backend (stat em lote) e indexar
+            keys = [f"{prefix}/{filename}" for prefix in [self.IMAGE_PREFIX, self.VIDEO_PREFIX]]
+            for key, stat in zip(keys, await self.backend.stat_many(keys)):
+                if stat is not None:
+                    media_type = self._media_type_for(filename)
                     
-                    # Determinar tipo
-                    media_type = "image" if file_path.suffix.lower() in ['.png', '.jpg', '.jpeg', '.gif'] else "video"
+                    # Metadados legados em arquivo JSON ao lado da mídia
+                    metadata = await self._load_metadata(key)
+                    saved_at = await self.deduplicator.stored_at(key)
+                    record = await self._index_file(
+                        filename, media_type, stat.size, metadata,
+                        created=saved_at or stat.created or stat.modified,
+                        modified=saved_at or stat.modified,
+                        stamp=False
+                    )
                     
-                    # Carregar metadados se existirem
-                    metadata = await self._load_metadata(file_path)
-                    
-                    return {
-                        "filename": filename,
-                        "path": str(file_path),
-                        "size": stat.st_size,
-                        "created": stat.st_ctime,
-                        "modified": stat.st_mtime,
-                        "media_type": media_type,
-                        "metadata": metadata
-                    }
+                    return self._with_path(record)
             
             return None
             
@@ -165,6 +207,32 @@ class StorageManager:
             logger.error(f"Erro ao obter info do arquivo {filename}: {e}")
             return None
     
+    async def list_files(
+        self,
+        prefix: Optional[str] = None,
+        media_type: Optional[str] = None,
+        since: Optional[float] = None,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """
+        Listar arquivos com metadados a partir do índice
+        
+        Args:
+            prefix: Prefixo do nome do arquivo
+            media_type: "image" ou "video"
+            since: Apenas arquivos modificados a partir deste timestamp
+            limit: Número máximo de resultados
+            
+        Returns:
+            Lista de dicionários no mesmo formato de get_file_info
+        """
+        try:
+            records = await self.metadata_store.list(prefix, media_type, since, limit)
+            return [self._with_path(record) for record in records]
+        except Exception as e:
+            logger.error(f"Erro ao listar arquivos: {e}")
+            return []
+    
     async def delete_file(self, filename: str) -> bool:
         """
         Deletar arquivo do storage
@@ -179,18 +247,18 @@ class StorageManager:
             deleted = False
             
             # Procurar e deletar arquivo
-            for path in [self.image_path, self.video_path, self.temp_path]:
-                file_path = path / filename
-                if file_path.exists():
-                    file_path.unlink()
+            for prefix in [self.IMAGE_PREFIX, self.VIDEO_PREFIX, self.TEMP_PREFIX]:
+                key = f"{prefix}/{filename}"
+                if await self.backend.delete(key):
+                    await self.deduplicator.release(key)
                     deleted = True
                     
-                    # Deletar metadados também
-                    metadata_path = file_path.with_suffix('.json')
-                    if metadata_path.exists():
-                        metadata_path.unlink()
+                    # Deletar metadados legados também
+                    await self.backend.delete(self._legacy_metadata_key(key))
             
             if deleted:
+                await self.metadata_store.delete(filename)
+                await self._notify_deleted(filename)
                 logger.info(f"Arquivo deletado: {filename}")
             
             return deleted
@@ -214,20 +282,18 @@ class StorageManager:
             max_age_seconds = max_age_hours * 3600
             deleted_count = 0
             
-            # Limpar cada diretório
-            for path in [self.image_path, self.video_path, self.temp_path]:
-                for file_path in path.iterdir():
-                    if file_path.is_file():
-                        file_age = current_time - file_path.stat().st_mtime
-                        
-                        if file_age > max_age_seconds:
-                            file_path.unlink()
-                            deleted_count += 1
-                            
-                            # Deletar metadados também
-                            metadata_path = file_path.with_suffix('.json')
-                            if metadata_path.exists():
-                                metadata_path.unlink()
+            # Limpar cada prefixo
+            for prefix in [self.IMAGE_PREFIX, self.VIDEO_PREFIX, self.TEMP_PREFIX]:
+                for obj in await self.backend.list(f"{prefix}/"):
+                    file_age = current_time - await self._saved_at(obj)
+                    
+                    if file_age > max_age_seconds:
+                        await self.backend.delete(obj.key)
+                        await self.deduplicator.release(obj.key)
+                        deleted_count += 1
+                        filename = obj.key.rsplit("/", 1)[-1]
+                        await self.metadata_store.delete(filename)
+                        await self._notify_deleted(filename)
             
             logger.info(f"Limpeza: {deleted_count} arquivos antigos removidos")
             return deleted_count
@@ -236,6 +302,22 @@ class StorageManager:
             logger.error(f"Erro na limpeza de arquivos: {e}")
             return 0
     
+    def add_delete_listener(self, listener: Callable[[str], Awaitable[Any]]):
+        """
+        Registrar uma corrotina chamada após a remoção de cada arquivo
+        
+        Args:
+            listener: Recebe o filename removido (delete_file e cleanup_old_files)
+        """
+        self._delete_listeners.append(listener)
+    
+    async def _notify_deleted(self, filename: str):
+        for listener in self._delete_listeners:
+            try:
+                await listener(filename)
+            except Exception as e:
+                logger.warning(f"Erro ao propagar remoção de {filename}: {e}")
+    
     async def get_storage_stats(self) -> Dict[str, Any]:
         """
         Obter estatísticas do storage
@@ -253,18 +335,17 @@ class StorageManager:
             }
             
             # Contar arquivos e tamanhos
-            for name, path in [
-                ("images", self.image_path),
-                ("videos", self.video_path),
-                ("temp", self.temp_path)
+            for name, prefix in [
+                ("images", self.IMAGE_PREFIX),
+                ("videos", self.VIDEO_PREFIX),
+                ("temp", self.TEMP_PREFIX)
             ]:
-                for file_path in path.iterdir():
-                    if file_path.is_file() and not file_path.suffix == '.json':
-                        file_size = file_path.stat().st_size
+                for obj in await self.backend.list(f"{prefix}/"):
+                    if not obj.key.endswith('.json'):
                         stats[name]["count"] += 1
-                        stats[name]["size"] += file_size
+                        stats[name]["size"] += obj.size
                         stats["total_files"] += 1
-                        stats["total_size"] += file_size
+                        stats["total_size"] += obj.size
             
             return stats
             
@@ -274,53 +355,108 @@ class StorageManager:
     
     # === MÉTODOS PRIVADOS ===
     
-    async def _optimize_image(self, file_path: Path):
-        """Otimizar imagem (reduzir tamanho se necessário)"""
+    async def _optimize_image(self, image_data: bytes) -> bytes:
+        """Otimizar imagem (reduzir tamanho se necessário) fora do event loop"""
         try:
-            # Verificar tamanho do arquivo
-            file_size = file_path.stat().st_size
-            max_size = 10 * 1024 * 1024  # 10MB
-            
-            if file_size > max_size:
-                # Reduzir qualidade/tamanho
-                with Image.open(file_path) as img:
-                    # Reduzir para máximo 2048x2048
-                    if img.width > 2048 or img.height > 2048:
-                        img.thumbnail((2048, 2048), Image.Resampling.LANCZOS)
-                    
-                    # Salvar com qualidade reduzida
-                    img.save(file_path, optimize=True, quality=85)
-                
-                logger.info(f"Imagem otimizada: {file_path.name}")
-                
+            return await run_io(self._optimize_image_sync, image_data)
         except Exception as e:
-            logger.warning(f"Erro ao otimizar imagem {file_path}: {e}")
+            logger.warning(f"Erro ao otimizar imagem: {e}")
+        
+        return image_data
     
-    async def _save_metadata(self, file_path: Path, metadata: Dict[str, Any]):
-        """Salvar metadados como arquivo JSON"""
-        try:
-            import json
-            metadata_path = file_path.with_suffix('.json')
+    @staticmethod
+    def _optimize_image_sync(image_data: bytes) -> bytes:
+        # Verificar tamanho do arquivo
+        max_size = 10 * 1024 * 1024  # 10MB
+        
+        if len(image_data) <= max_size:
+            return image_data
+        
+        # Reduzir qualidade/tamanho (decodificação e re-encode bloqueantes)
+        with Image.open(io.BytesIO(image_data)) as img:
+            image_format = img.format or "PNG"
             
-            # Adicionar timestamp
-            metadata['saved_at'] = time.time()
+            # Reduzir para máximo 2048x2048
+            if img.width > 2048 or img.height > 2048:
+                img.thumbnail((2048, 2048), Image.Resampling.LANCZOS)
             
-            async with aiofiles.open(metadata_path, 'w') as f:
-                await f.write(json.dumps(metadata, indent=2))
-                
-        except Exception as e:
-            logger.warning(f"Erro ao salvar metadados: {e}")
+            # Salvar com qualidade reduzida
+            output = io.BytesIO()
+            img.save(output, format=image_format, optimize=True, quality=85)
+        
+        logger.info(f"Imagem otimizada: {len(image_data)} -> {output.tell()} bytes")
+        return output.getvalue()
+    
+    async def _saved_at(self, obj: ObjectStat) -> float:
+        """
+        Momento em que o arquivo foi salvo
+        
+        Arquivos deduplicados são hard links do blob e herdam o mtime dele;
+        a data vem do índice de metadados (ou da referência no deduplicador)
+        e o mtime do backend só vale para arquivos fora de ambos.
+        """
+        filename = obj.key.rsplit("/", 1)[-1]
+        record = await self.metadata_store.get(filename)
+        if record is not None and self.get_file_key(filename, record["media_type"]) == obj.key:
+            return record["modified"]
+        
+        stored_at = await self.deduplicator.stored_at(obj.key)
+        return stored_at if stored_at is not None else obj.modified
+    
+    def _media_type_for(self, filename: str) -> str:
+        """Determinar tipo de mídia pela extensão"""
+        return "image" if Path(filename).suffix.lower() in self.IMAGE_EXTENSIONS else "video"
+    
+    def get_file_key(self, filename: str, media_type: str) -> str:
+        """Chave no backend de um arquivo indexado"""
+        prefix = self.IMAGE_PREFIX if media_type == "image" else self.VIDEO_PREFIX
+        return f"{prefix}/{filename}"
+    
+    def _with_path(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Completar registro do índice com a localização no backend"""
+        key = self.get_file_key(record["filename"], record["media_type"])
+        return {**record, "path": self.backend.uri(key)}
     
-    async def _load_metadata(self, file_path: Path) -> Optional[Dict[str, Any]]:
-        """Carregar metadados do arquivo JSON"""
+    @staticmethod
+    def _legacy_metadata_key(key: str) -> str:
+        return Path(key).with_suffix('.json').as_posix()
+    
+    async def _index_file(
+        self,
+        filename: str,
+        media_type: str,
+        size: int,
+        metadata: Optional[Dict[str, Any]],
+        created: Optional[float] = None,
+        modified: Optional[float] = None,
+        stamp: bool = True
+    ) -> Dict[str, Any]:
+        """Registrar arquivo e metadados no índice (gravação em lote)"""
+        now = time.time()
+        
+        if metadata is not None and stamp:
+            # Adicionar timestamp
+            metadata = {**metadata, "saved_at": now}
+        
+        record = {
+            "filename": filename,
+            "media_type": media_type,
+            "size": size,
+            "created": created if created is not None else now,
+            "modified": modified if modified is not None else now,
+            "metadata": metadata
+        }
+        await self.metadata_store.put(record)
+        return record
+    
+    async def _load_metadata(self, key: str) -> Optional[Dict[str, Any]]:
+        """Carregar metadados legados do arquivo JSON (anteriores ao índice)"""
         try:
-            import json
-            metadata_path = file_path.with_suffix('.json')
+            metadata_key = self._legacy_metadata_key(key)
             
-            if metadata_path.exists():
-                async with aiofiles.open(metadata_path, 'r') as f:
-                    content = await f.read()
-                    return json.loads(content)
+            if await self.backend.exists(metadata_key):
+                content = await self.backend.get(metadata_key)
+                return json.loads(content)
             
             return None
             
@@ -328,6 +464,12 @@ class StorageManager:
             logger.warning(f"Erro ao carregar metadados: {e}")
             return None
     
+    async def close(self):
+        """Gravar metadados pendentes e liberar o índice e o backend"""
+        await self.metadata_store.close()
+        self.deduplicator.close()
+        await self.backend.close()
+    
     def get_file_url(self, filename: str) -> str:
         """
         Obter URL pública do arquivo
@@ -348,10 +490,10 @@ class StorageManager:
             filename: Nome do arquivo
             
         Returns:
-            Path do arquivo se existir
+            Path do arquivo se existir (None em backends remotos)
         """
-        for path in [self.image_path, self.video_path]:
-            file_path = path / filename
-            if file_path.exists():
+        for prefix in [self.IMAGE_PREFIX, self.VIDEO_PREFIX]:
+            file_path = self.backend.local_path(f"{prefix}/{filename}")
+            if file_path is not None and file_path.exists():
                 return file_path
         return None
\ No newline at end of file
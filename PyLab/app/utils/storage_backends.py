@@ -0,0 +1,502 @@
+"""
+🤖 PyLab - Storage Backends
+Backends plugáveis de armazenamento de mídia (filesystem local e S3 compatível)
+"""
+
+import os
+import errno
+import stat as stat_module
+import asyncio
+import hashlib
+import hmac
+import logging
+import xml.etree.ElementTree as ET
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Optional, Dict, List, AsyncIterator, Tuple
+from urllib.parse import quote, urlsplit
+
+import aiofiles
+
+from . import async_fs
+
+logger = logging.getLogger("PyLab.StorageBackends")
+
+# ioctl do Linux para clonar extents (btrfs, xfs com reflink=1, ...)
+FICLONE = 0x40049409
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class ObjectStat:
+    """Informações de um objeto armazenado"""
+    key: str
+    size: int
+    modified: float
+    created: Optional[float] = None
+    etag: Optional[str] = None
+
+
+class StorageBackend(ABC):
+    """
+    Interface comum dos backends de storage.
+
+    Chaves são caminhos relativos com "/" (ex.: ``images/img_1.png``).
+    """
+
+    name = "abstract"
+
+    @abstractmethod
+    async def put(self, key: str, data: bytes, content_type: Optional[str] = None) -> int:
+        """Gravar objeto e retornar o número de bytes gravados"""
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes:
+        """Ler objeto completo"""
+
+    @abstractmethod
+    def stream(
+        self,
+        key: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> AsyncIterator[bytes]:
+        """Ler objeto em blocos (``end`` inclusivo, como no header Range)"""
+
+    @abstractmethod
+    async def delete(self, key: str) -> bool:
+        """Remover objeto; retorna True se existia"""
+
+    @abstractmethod
+    async def list(self, prefix: str = "") -> List[ObjectStat]:
+        """Listar objetos sob um prefixo"""
+
+    @abstractmethod
+    async def stat(self, key: str) -> Optional[ObjectStat]:
+        """Obter informações de um objeto ou None se não existir"""
+
+    @abstractmethod
+    async def link(self, src_key: str, dst_key: str):
+        """Fazer ``dst_key`` apontar para o conteúdo de ``src_key`` da forma mais barata possível"""
+
+    async def exists(self, key: str) -> bool:
+        return await self.stat(key) is not None
+
+    async def stat_many(self, keys: List[str]) -> List[Optional[ObjectStat]]:
+        """stat() de várias chaves (na mesma ordem)"""
+        return list(await asyncio.gather(*[self.stat(key) for key in keys]))
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Caminho local do objeto, quando o backend é um filesystem"""
+        return None
+
+    def uri(self, key: str) -> str:
+        """Identificador legível do objeto"""
+        return key
+
+    async def close(self):
+        """Liberar recursos (conexões, sessões)"""
+
+
+class LocalFilesystemBackend(StorageBackend):
+    """Backend sobre um diretório local (ex.: volume compartilhado /var/shared_media)"""
+
+    name = "local"
+
+    def __init__(self, base_path: str):
+        self.base_path = Path(base_path)
+        self.base_path.mkdir(parents=True, exist_ok=True)
+
+    def local_path(self, key: str) -> Optional[Path]:
+        return self._path(key)
+
+    def uri(self, key: str) -> str:
+        return str(self._path(key))
+
+    async def put(self, key: str, data: bytes, content_type: Optional[str] = None) -> int:
+        path = self._path(key)
+        await async_fs.makedirs(path.parent)
+        # Temporário + rename: o arquivo nunca aparece parcialmente gravado
+        await async_fs.atomic_write(path, data)
+        return len(data)
+
+    async def get(self, key: str) -> bytes:
+        return await async_fs.read_bytes(self._path(key))
+
+    async def stream(
+        self,
+        key: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> AsyncIterator[bytes]:
+        async with aiofiles.open(self._path(key), 'rb') as f:
+            await f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                size = chunk_size if remaining is None else min(chunk_size, remaining)
+                chunk = await f.read(size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    async def delete(self, key: str) -> bool:
+        return await async_fs.unlink(self._path(key))
+
+    async def list(self, prefix: str = "") -> List[ObjectStat]:
+        if prefix.endswith("/") or not prefix:
+            directory, name_prefix = self._path(prefix), ""
+        else:
+            directory, name_prefix = self._path(prefix).parent, Path(prefix).name
+
+        return [
+            ObjectStat(
+                key=self._key(file_path),
+                size=stat.st_size,
+                modified=stat.st_mtime,
+                created=stat.st_ctime
+            )
+            # Recursivo: mesma semântica de prefixo do S3 (ex.: "jobs" alcança jobs/<id>/state.json)
+            async for file_path, stat in async_fs.scan_dir(directory, name_prefix, recursive=True)
+            # Ignorar temporários de escrita atômica
+            if not file_path.name.startswith(".")
+        ]
+
+    async def stat(self, key: str) -> Optional[ObjectStat]:
+        return (await self.stat_many([key]))[0]
+
+    async def stat_many(self, keys: List[str]) -> List[Optional[ObjectStat]]:
+        """stat() em lote com um único salto de thread"""
+        stats = await async_fs.stat_many([self._path(key) for key in keys])
+        return [
+            ObjectStat(key=key, size=st.st_size, modified=st.st_mtime, created=st.st_ctime)
+            if st is not None and stat_module.S_ISREG(st.st_mode) else None
+            for key, st in zip(keys, stats)
+        ]
+
+    async def link(self, src_key: str, dst_key: str):
+        """Hard link; reflink se hard links não forem permitidos; cópia como último recurso"""
+        src, dst = self._path(src_key), self._path(dst_key)
+        await async_fs.makedirs(dst.parent)
+
+        if await async_fs.run_io(self._link_or_clone, src, dst):
+            return
+        await async_fs.atomic_copy(src, dst)
+
+    @staticmethod
+    def _link_or_clone(src: Path, dst: Path) -> bool:
+        """Tentar hard link e depois reflink; False se ambos não forem suportados"""
+        try:
+            os.link(src, dst)
+            return True
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+
+        try:
+            import fcntl
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            return True
+        except (ImportError, OSError):
+            if dst.exists():
+                dst.unlink()
+        return False
+
+    def _path(self, key: str) -> Path:
+        path = (self.base_path / key).resolve()
+        if path != self.base_path.resolve() and self.base_path.resolve() not in path.parents:
+            raise ValueError(f"Chave fora do storage: {key}")
+        return path
+
+    def _key(self, path: Path) -> str:
+        return path.resolve().relative_to(self.base_path.resolve()).as_posix()
+
+
+class S3StorageBackend(StorageBackend):
+    """
+    Backend para qualquer endpoint compatível com S3 (AWS, MinIO, Ceph RGW...).
+
+    Usa endereçamento path-style, assinatura SigV4, um pool de conexões
+    HTTP keep-alive e upload multipart para objetos grandes.
+    """
+
+    name = "s3"
+
+    def __init__(
+        self,
+        endpoint_url: str,
+        bucket: str,
+        access_key: str,
+        secret_key: str,
+        region: str = "us-east-1",
+        pool_size: int = 32,
+        multipart_threshold: int = 16 * 1024 * 1024,
+        part_size: int = 8 * 1024 * 1024,
+        max_concurrent_parts: int = 4,
+        timeout: float = 300.0
+    ):
+        if part_size < 5 * 1024 * 1024:
+            raise ValueError("part_size mínimo do S3 é 5MB")
+
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.pool_size = pool_size
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.max_concurrent_parts = max_concurrent_parts
+        self.timeout = timeout
+
+        self._host = urlsplit(self.endpoint_url).netloc
+        self._session = None
+
+    def uri(self, key: str) -> str:
+        return f"s3://{self.bucket}/{key}"
+
+    async def put(self, key: str, data: bytes, content_type: Optional[str] = None) -> int:
+        headers = {"Content-Type": content_type} if content_type else {}
+        if len(data) > self.multipart_threshold:
+            await self._multipart_upload(key, data, headers)
+        else:
+            async with await self._request("PUT", key, data=data, headers=headers) as resp:
+                await self._raise_for_status(resp)
+        return len(data)
+
+    async def get(self, key: str) -> bytes:
+        async with await self._request("GET", key) as resp:
+            await self._raise_for_status(resp)
+            return await resp.read()
+
+    async def stream(
+        self,
+        key: str,
+        start: int = 0,
+        end: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> AsyncIterator[bytes]:
+        headers = {}
+        if start or end is not None:
+            headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+        async with await self._request("GET", key, headers=headers) as resp:
+            await self._raise_for_status(resp)
+            async for chunk in resp.content.iter_chunked(chunk_size):
+                yield chunk
+
+    async def delete(self, key: str) -> bool:
+        existed = await self.stat(key) is not None
+        async with await self._request("DELETE", key) as resp:
+            await self._raise_for_status(resp)
+        return existed
+
+    async def list(self, prefix: str = "") -> List[ObjectStat]:
+        results = []
+        token = None
+        while True:
+            query = {"list-type": "2", "prefix": prefix}
+            if token:
+                query["continuation-token"] = token
+            async with await self._request("GET", "", query=query) as resp:
+                await self._raise_for_status(resp)
+                root = ET.fromstring(await resp.read())
+
+            ns = {"s3": root.tag.split("}")[0].strip("{")} if root.tag.startswith("{") else {}
+            find = (lambda el, tag: el.find(f"s3:{tag}", ns)) if ns else (lambda el, tag: el.find(tag))
+            contents = root.findall("s3:Contents", ns) if ns else root.findall("Contents")
+            for item in contents:
+                modified = datetime.fromisoformat(find(item, "LastModified").text.replace("Z", "+00:00"))
+                results.append(ObjectStat(
+                    key=find(item, "Key").text,
+                    size=int(find(item, "Size").text),
+                    modified=modified.timestamp(),
+                    etag=(find(item, "ETag").text or "").strip('"')
+                ))
+
+            truncated = find(root, "IsTruncated")
+            if truncated is None or truncated.text != "true":
+                break
+            token = find(root, "NextContinuationToken").text
+        return results
+
+    async def stat(self, key: str) -> Optional[ObjectStat]:
+        async with await self._request("HEAD", key) as resp:
+            if resp.status == 404:
+                return None
+            await self._raise_for_status(resp)
+            modified = resp.headers.get("Last-Modified")
+            return ObjectStat(
+                key=key,
+                size=int(resp.headers.get("Content-Length", 0)),
+                modified=parsedate_to_datetime(modified).timestamp() if modified else 0.0,
+                etag=resp.headers.get("ETag", "").strip('"')
+            )
+
+    async def link(self, src_key: str, dst_key: str):
+        """Cópia server-side (CopyObject): nenhum byte trafega pelo PyLab"""
+        headers = {"x-amz-copy-source": f"/{self.bucket}/{quote(src_key)}"}
+        async with await self._request("PUT", dst_key, headers=headers) as resp:
+            await self._raise_for_status(resp)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    # === MULTIPART ===
+
+    async def _multipart_upload(self, key: str, data: bytes, headers: Dict[str, str]):
+        async with await self._request("POST", key, query={"uploads": ""}, headers=headers) as resp:
+            await self._raise_for_status(resp)
+            root = ET.fromstring(await resp.read())
+        upload_id = next(el.text for el in root.iter() if el.tag.endswith("UploadId"))
+
+        view = memoryview(data)
+        offsets = list(range(0, len(data), self.part_size))
+        semaphore = asyncio.Semaphore(self.max_concurrent_parts)
+
+        async def upload_part(number: int, offset: int) -> Tuple[int, str]:
+            async with semaphore:
+                part = bytes(view[offset:offset + self.part_size])
+                query = {"partNumber": str(number), "uploadId": upload_id}
+                async with await self._request("PUT", key, query=query, data=part) as resp:
+                    await self._raise_for_status(resp)
+                    return number, resp.headers["ETag"]
+
+        try:
+            parts = await asyncio.gather(*[
+                upload_part(i + 1, offset) for i, offset in enumerate(offsets)
+            ])
+            body = "<CompleteMultipartUpload>" + "".join(
+                f"<Part><PartNumber>{n}</PartNumber><ETag>{etag}</ETag></Part>"
+                for n, etag in sorted(parts)
+            ) + "</CompleteMultipartUpload>"
+            async with await self._request(
+                "POST", key, query={"uploadId": upload_id}, data=body.encode()
+            ) as resp:
+                await self._raise_for_status(resp)
+                # S3 pode retornar 200 com <Error> no corpo
+                payload = await resp.read()
+                if b"<Error>" in payload:
+                    raise IOError(f"Falha ao completar upload multipart: {payload[:200]!r}")
+        except BaseException:
+            try:
+                async with await self._request("DELETE", key, query={"uploadId": upload_id}) as resp:
+                    pass
+            except Exception as abort_error:
+                logger.warning(f"Erro ao abortar upload multipart {upload_id}: {abort_error}")
+            raise
+
+    # === HTTP / SIGV4 ===
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            import aiohttp
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def _request(
+        self,
+        method: str,
+        key: str,
+        query: Optional[Dict[str, str]] = None,
+        data: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None
+    ):
+        session = await self._get_session()
+        path = f"/{self.bucket}/{quote(key, safe='/-_.~')}" if key else f"/{self.bucket}"
+        query = query or {}
+        canonical_query = "&".join(
+            f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(query.items())
+        )
+        payload_hash = hashlib.sha256(data or b"").hexdigest()
+        signed_headers = self._sign(method, path, canonical_query, dict(headers or {}), payload_hash)
+
+        url = f"{self.endpoint_url}{path}" + (f"?{canonical_query}" if canonical_query else "")
+        return session.request(method, url, data=data, headers=signed_headers)
+
+    def _sign(
+        self,
+        method: str,
+        path: str,
+        canonical_query: str,
+        headers: Dict[str, str],
+        payload_hash: str
+    ) -> Dict[str, str]:
+        """Assinar requisição com AWS Signature Version 4"""
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date_stamp = now.strftime("%Y%m%d")
+
+        headers["host"] = self._host
+        headers["x-amz-date"] = amz_date
+        headers["x-amz-content-sha256"] = payload_hash
+
+        to_sign = {k.lower(): str(v).strip() for k, v in headers.items()
+                   if k.lower() in ("host", "content-type", "range") or k.lower().startswith("x-amz-")}
+        signed_header_names = ";".join(sorted(to_sign))
+        canonical_headers = "".join(f"{k}:{to_sign[k]}\n" for k in sorted(to_sign))
+
+        canonical_request = "\n".join([
+            method, path, canonical_query, canonical_headers, signed_header_names, payload_hash
+        ])
+        scope = f"{date_stamp}/{self.region}/s3/aws4_request"
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest()
+        ])
+
+        key = f"AWS4{self.secret_key}".encode()
+        for part in (date_stamp, self.region, "s3", "aws4_request"):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+        headers["Authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={signed_header_names}, Signature={signature}"
+        )
+        return headers
+
+    @staticmethod
+    async def _raise_for_status(resp):
+        if resp.status >= 400:
+            body = await resp.read()
+            raise IOError(f"S3 {resp.method} {resp.url.path} falhou ({resp.status}): {body[:200]!r}")
+
+
+def create_storage_backend(base_path: str) -> StorageBackend:
+    """
+    Criar backend a partir do ambiente
+
+    STORAGE_BACKEND=local (padrão) usa ``base_path``; STORAGE_BACKEND=s3 usa
+    S3_ENDPOINT_URL, S3_BUCKET, S3_ACCESS_KEY_ID, S3_SECRET_ACCESS_KEY e S3_REGION.
+    """
+    backend = os.getenv("STORAGE_BACKEND", "local").lower()
+
+    if backend == "s3":
+        return S3StorageBackend(
+            endpoint_url=os.environ["S3_ENDPOINT_URL"],
+            bucket=os.environ["S3_BUCKET"],
+            access_key=os.environ["S3_ACCESS_KEY_ID"],
+            secret_key=os.environ["S3_SECRET_ACCESS_KEY"],
+            region=os.getenv("S3_REGION", "us-east-1"),
+            pool_size=int(os.getenv("S3_POOL_SIZE", "32")),
+            multipart_threshold=int(os.getenv("S3_MULTIPART_THRESHOLD", str(16 * 1024 * 1024))),
+            part_size=int(os.getenv("S3_PART_SIZE", str(8 * 1024 * 1024)))
+        )
+
+    if backend != "local":
+        raise ValueError(f"Backend de storage não suportado: {backend}")
+    return LocalFilesystemBackend(base_path)
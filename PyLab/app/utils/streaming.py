@@ -0,0 +1,167 @@
+"""
+🤖 PyLab - Streaming
+Parser JSON incremental e helpers de Server-Sent Events
+"""
+
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+logger = logging.getLogger("PyLab.Streaming")
+
+
+class IncrementalJSONParser:
+    """
+    Parser incremental para um objeto JSON recebido em pedaços.
+
+    Acompanha apenas o nível superior do objeto: cada campo é emitido
+    assim que o seu valor fecha, e valores string do nível superior
+    (ex.: ``summary``) também são emitidos parcialmente, à medida que
+    chegam.
+
+    Eventos:
+        {"type": "delta", "field": nome, "text": trecho}
+        {"type": "field", "field": nome, "value": valor}
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: Dict[str, Any] = {}
+
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        self._value_start: Optional[int] = None
+        self._expect_value = False
+        self._emitted_chars = 0
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Processar mais texto e retornar os eventos produzidos"""
+        self.buffer += chunk
+        events: List[Dict[str, Any]] = []
+
+        while self._pos < len(self.buffer):
+            char = self.buffer[self._pos]
+            index = self._pos
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._close_string(index, events)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None and self._key_start is None:
+                    self._key_start = index
+                elif self._depth == 1 and self._expect_value:
+                    self._value_start = index
+                    self._expect_value = False
+                    self._emitted_chars = 0
+            elif char in "{[":
+                if self._depth == 1 and self._expect_value:
+                    self._value_start = index
+                    self._expect_value = False
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None and self._key is not None:
+                    self._emit_field(self.buffer[self._value_start:index + 1], events)
+                elif self._depth == 0 and self._key is not None and self._value_start is not None:
+                    # Primitivo no fim do objeto
+                    self._emit_field(self.buffer[self._value_start:index], events)
+            elif char == ":" and self._depth == 1:
+                self._expect_value = True
+            elif char == "," and self._depth == 1:
+                if self._key is not None and self._value_start is not None:
+                    self._emit_field(self.buffer[self._value_start:index], events)
+            elif not char.isspace() and self._depth == 1 and self._expect_value:
+                # Início de número, true/false/null
+                self._value_start = index
+                self._expect_value = False
+
+        if self._in_string and self._depth == 1 and self._value_start is not None and self._key is not None:
+            self._emit_partial_string(events)
+
+        return events
+
+    def result(self) -> Dict[str, Any]:
+        """Objeto completo (ou os campos já concluídos, se o JSON estiver incompleto)"""
+        try:
+            return json.loads(self.buffer)
+        except json.JSONDecodeError:
+            return dict(self.fields)
+
+    # === MÉTODOS PRIVADOS ===
+
+    def _close_string(self, index: int, events: List[Dict[str, Any]]):
+        if self._depth != 1:
+            return
+        if self._key is None and self._key_start is not None:
+            self._key = json.loads(self.buffer[self._key_start:index + 1])
+            self._key_start = None
+        elif self._key is not None and self._value_start is not None:
+            self._emit_partial_string(events, closing_index=index)
+            self._emit_field(self.buffer[self._value_start:index + 1], events)
+
+    def _emit_partial_string(self, events: List[Dict[str, Any]], closing_index: Optional[int] = None):
+        raw = self.buffer[self._value_start + 1:closing_index if closing_index is not None else len(self.buffer)]
+        # Não decodificar escapes incompletos (ex.: "\" ou "\u00")
+        cut = raw.rfind("\\")
+        if cut != -1 and closing_index is None:
+            tail = raw[cut:]
+            if len(tail) < 2 or (tail[1] == "u" and len(tail) < 6):
+                raw = raw[:cut]
+        try:
+            decoded = json.loads(f'"{raw}"')
+        except json.JSONDecodeError:
+            return
+        if len(decoded) > self._emitted_chars:
+            events.append({"type": "delta", "field": self._key, "text": decoded[self._emitted_chars:]})
+            self._emitted_chars = len(decoded)
+
+    def _emit_field(self, raw_value: str, events: List[Dict[str, Any]]):
+        try:
+            value = json.loads(raw_value)
+        except json.JSONDecodeError:
+            logger.debug(f"Valor JSON inválido para {self._key}: {raw_value[:100]}")
+            value = raw_value.strip()
+        self.fields[self._key] = value
+        events.append({"type": "field", "field": self._key, "value": value})
+        self._key = None
+        self._value_start = None
+        self._expect_value = False
+
+
+def sse_event(data: Any, event: Optional[str] = None) -> str:
+    """Formatar uma mensagem Server-Sent Events"""
+    payload = json.dumps(data, ensure_ascii=False, default=_json_default)
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {payload}\n\n"
+
+
+async def sse_stream(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """Converter eventos (dicts com "type") em mensagens SSE; erros viram evento "error\""""
+    try:
+        async for event in events:
+            yield sse_event(event, event.get("type"))
+    except Exception as e:
+        logger.error(f"Erro durante streaming: {e}")
+        yield sse_event({"type": "error", "message": str(e)}, "error")
+
+
+def _json_default(value: Any) -> Any:
+    # Enums e dataclasses dos modelos
+    if hasattr(value, "value"):
+        return value.value
+    if hasattr(value, "__dict__"):
+        return value.__dict__
+    return str(value)
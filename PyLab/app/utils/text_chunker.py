@@ -0,0 +1,127 @@
+"""
+🤖 PyLab - Text Chunker
+Divisão de documentos longos respeitando a estrutura (seções, parágrafos, frases)
+"""
+
+import re
+import logging
+from typing import List, Tuple
+
+from .tokenizer import count_tokens, split_by_tokens
+
+logger = logging.getLogger("PyLab.TextChunker")
+
+# Títulos: markdown (#), numeração (1., 1.2), ou linha curta toda em maiúsculas
+_HEADING = re.compile(
+    r"^(?:#{1,6}\s+\S.*|\d+(?:\.\d+)*[.)]?\s+[A-ZÁÉÍÓÚÂÊÔÃÕÇ].{0,80}|[A-ZÁÉÍÓÚÂÊÔÃÕÇ0-9][A-ZÁÉÍÓÚÂÊÔÃÕÇ0-9 \-:]{2,80})$"
+)
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+# Fim de frase (não corta numerações como "3. Conclusão")
+_SENTENCE_END = re.compile(r"(?<=[^\d\s][.!?…])\s+")
+
+
+def split_sections(text: str) -> List[str]:
+    """Separar o texto em seções iniciadas por títulos"""
+    sections: List[List[str]] = [[]]
+    for line in text.splitlines():
+        if _HEADING.match(line.strip()) and any(l.strip() for l in sections[-1]):
+            sections.append([])
+        sections[-1].append(line)
+    return ["\n".join(lines).strip() for lines in sections if any(l.strip() for l in lines)]
+
+
+def chunk_text(text: str, max_tokens: int, model: str = "gpt-3.5-turbo") -> List[str]:
+    """
+    Dividir texto em partes de no máximo ``max_tokens`` tokens
+
+    Seções são mantidas inteiras quando cabem; senão, são divididas em
+    parágrafos, depois em frases e, em último caso, por contagem de
+    tokens. Partes pequenas consecutivas são agrupadas até o limite.
+
+    Args:
+        text: Documento
+        max_tokens: Tamanho máximo de cada parte
+        model: Modelo cujo tokenizer define o tamanho
+
+    Returns:
+        Lista de partes na ordem do documento
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return [text]
+
+    pieces: List[Tuple[str, str, bool]] = []
+    for section in split_sections(text):
+        section_pieces = _split_to_fit(section, max_tokens, model, level=0, joiner="\n\n")
+        pieces.extend(
+            (piece, joiner, i == 0) for i, (piece, joiner) in enumerate(section_pieces)
+        )
+
+    return _pack(pieces, max_tokens, model)
+
+
+# Níveis de divisão e o separador usado para juntar as partes de volta
+_SPLIT_LEVELS = [(_PARAGRAPH_BREAK, "\n\n"), (_SENTENCE_END, " ")]
+
+
+def _split_to_fit(text: str, max_tokens: int, model: str, level: int, joiner: str) -> List[Tuple[str, str]]:
+    """Dividir recursivamente (parágrafos -> frases -> tokens); retorna (parte, separador anterior)"""
+    if count_tokens(text, model) <= max_tokens:
+        return [(text, joiner)]
+
+    if level < len(_SPLIT_LEVELS):
+        pattern, inner_joiner = _SPLIT_LEVELS[level]
+        parts = [p.strip() for p in pattern.split(text) if p.strip()]
+        if level == 0:
+            parts = _attach_headings(parts)
+        if len(parts) > 1:
+            result: List[Tuple[str, str]] = []
+            for i, part in enumerate(parts):
+                result.extend(_split_to_fit(
+                    part, max_tokens, model, level + 1, joiner if i == 0 else inner_joiner
+                ))
+            return result
+        return _split_to_fit(text, max_tokens, model, level + 1, joiner)
+
+    # Sem fronteira natural (ex.: tabela ou frase enorme): corte por tokens
+    return [
+        (part, joiner if i == 0 else "")
+        for i, part in enumerate(split_by_tokens(text, max_tokens, model))
+    ]
+
+
+def _attach_headings(paragraphs: List[str]) -> List[str]:
+    """Manter cada título junto do parágrafo seguinte"""
+    result: List[str] = []
+    pending = ""
+    for paragraph in paragraphs:
+        if _HEADING.match(paragraph) and "\n" not in paragraph:
+            pending = f"{pending}\n\n{paragraph}" if pending else paragraph
+            continue
+        result.append(f"{pending}\n\n{paragraph}" if pending else paragraph)
+        pending = ""
+    if pending:
+        result.append(pending)
+    return result
+
+
+def _pack(pieces: List[Tuple[str, str, bool]], max_tokens: int, model: str) -> List[str]:
+    """Agrupar partes consecutivas sem ultrapassar o limite"""
+    chunks: List[str] = []
+    current = ""
+    current_tokens = 0
+
+    for piece, joiner, section_start in pieces:
+        piece_tokens = count_tokens(piece, model)
+        # +2 tokens aproximados do separador entre partes
+        overflow = current_tokens + piece_tokens + 2 > max_tokens
+        # Início de seção é o ponto de corte preferido quando a parte atual já está cheia pela metade
+        prefer_break = section_start and current_tokens > max_tokens // 2
+        if current and (overflow or prefer_break):
+            chunks.append(current)
+            current, current_tokens = "", 0
+        current = f"{current}{joiner}{piece}" if current else piece
+        current_tokens += piece_tokens + 2
+
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,96 @@
+"""
+🤖 PyLab - Tokenizer
+Contagem de tokens para orçamento de chamadas LLM
+"""
+
+import logging
+from functools import lru_cache
+from typing import Dict, List
+
+logger = logging.getLogger("PyLab.Tokenizer")
+
+# Overhead aproximado por mensagem no formato chat (role, separadores)
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+# Sem tiktoken: ~4 caracteres por token em texto latino
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=16)
+def _get_encoding(model: str):
+    """Obter encoding do tiktoken para o modelo (None se indisponível)"""
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning("tiktoken não instalado, usando estimativa por caracteres")
+        return None
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # Download do vocabulário pode falhar em ambientes sem rede
+        logger.warning(f"Erro ao carregar encoding de {model}: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4-turbo-preview") -> int:
+    """
+    Contar tokens de um texto
+
+    Args:
+        text: Texto
+        model: Modelo cujo tokenizer será usado
+
+    Returns:
+        Número de tokens (estimado se tiktoken não estiver disponível)
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return max(1, len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str = "gpt-4-turbo-preview") -> int:
+    """Contar tokens de uma lista de mensagens no formato chat"""
+    total = TOKENS_PER_REPLY
+    for message in messages:
+        total += TOKENS_PER_MESSAGE
+        total += count_tokens(message.get("content") or "", model)
+    return total
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4-turbo-preview") -> str:
+    """Cortar texto para caber em ``max_tokens``"""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def truncate_tokens_from_start(text: str, max_tokens: int, model: str = "gpt-4-turbo-preview") -> str:
+    """Manter apenas os últimos ``max_tokens`` tokens do texto"""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return text[-max_tokens * CHARS_PER_TOKEN:] if max_tokens > 0 else ""
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[-max_tokens:]) if max_tokens > 0 else ""
+
+
+def split_by_tokens(text: str, max_tokens: int, model: str = "gpt-4-turbo-preview") -> List[str]:
+    """Dividir texto em blocos consecutivos de até ``max_tokens`` tokens"""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        size = max_tokens * CHARS_PER_TOKEN
+        return [text[i:i + size] for i in range(0, len(text), size)]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]